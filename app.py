@@ -1,10 +1,12 @@
 import multiprocessing
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
 import webbrowser
 
 
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 
 
@@ -19,7 +21,60 @@ HOST = "0.0.0.0"
 PORT = 8001
 URL = f"http://{HOST}:{PORT}"
 
-app = FastAPI()
+
+
+def resume_gemini_batches() -> None:
+    """Reattach to Gemini batch jobs that were still running at the last shutdown."""
+    from exceptions import MissingGeminiApiKeyError
+    from utils.batch_store import batch_store
+
+    if not batch_store.pending():
+        return
+    try:
+        from utils.models.gemini import resume_pending_batches
+
+        resumed = resume_pending_batches()
+        print(f"Retomando {resumed} job(s) em lote do Gemini...")
+    except MissingGeminiApiKeyError as e:
+        print(f"Não foi possível retomar jobs do Gemini: {e}")
+
+
+def restore_interrupted_tasks() -> None:
+    """List the matching tasks interrupted at the last shutdown and drop expired checkpoints."""
+    from services.checkpoints import prune_checkpoints
+    from utils.config import load_config
+    from web.routes import register_interrupted_tasks
+
+    config = load_config()
+    prune_checkpoints(config.checkpoint_retention_hours, config.interrupted_checkpoint_retention_hours)
+    restored = register_interrupted_tasks()
+    if restored:
+        print(f"{restored} tarefa(s) interrompida(s) podem ser retomadas do último checkpoint.")
+
+
+def start_inference_workers() -> None:
+    """Start the inference worker processes and let them load the models in the background."""
+    from utils.inference import get_inference_client
+
+    client = get_inference_client()
+    if client is not None:
+        print(f"Carregando modelos em {client.workers} processo(s) de inferência...")
+        client.warm_up()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from utils.inference import shutdown_inference
+
+    start_inference_workers()
+    resume_gemini_batches()
+    restore_interrupted_tasks()
+    yield
+    shutdown_inference()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # 1. Monta a pasta 'static' para servir o HTML e scripts
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
@@ -34,6 +34,10 @@ datas += td; binaries += tb; hiddenimports += th
 # Pydantic
 hiddenimports += collect_submodules('pydantic')
 
+# pyarrow (Parquet engine of the spreadsheet cache)
+td, tb, th = collect_all('pyarrow')
+datas += td; binaries += tb; hiddenimports += th
+
 # Include templates and static files
 datas += [
     ('templates', 'templates'),
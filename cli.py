@@ -0,0 +1,340 @@
+"""Headless batch matching, for scheduled jobs.
+
+Matches one or more pesquisa files against a catalog without the web UI.
+The catalog files are merged into a named catalog (as on the upload page)
+and indexed once; the query files are then matched concurrently against
+that shared collection, with the models loaded once for the whole run.
+
+Example::
+
+    python cli.py --catalog notas_jan.xlsx notas_fev.xlsx --catalog-name pneus \\
+        --queries pesquisas/*.xlsx --output-dir resultados --format jsonl \\
+        --jobs 4 --set vector_backend=numpy --set high_confidence_threshold=0.85
+
+Results are written to ``<output-dir>/<query file name>.<format>``; a JSON
+summary of the run is printed to stdout (and to ``--summary`` if given).
+The exit code is 1 if any file failed.
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import multiprocessing
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+from tqdm import tqdm
+
+from services.export import iter_csv
+from services.indexing import IndexingJob, start_indexing
+from services.matching import run_matching_pipeline
+from utils.catalog_store import get_catalog_store
+from utils.config import load_config, override_config
+from utils.dedup import collapse_catalog
+from utils.excel_cache import read_excel_cached
+from utils.inference import get_inference_client, shutdown_inference
+
+
+def parse_overrides(pairs: list[str]) -> dict[str, Any]:
+    """``key=value`` pairs; values are read as JSON when possible (``false``, ``4``, ``0.85``), else as text."""
+    overrides = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Use chave=valor em --set: {pair}")
+        try:
+            overrides[key.strip()] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[key.strip()] = value
+    return overrides
+
+
+def read_table(path: Path, sheet: str | int, skiprows: int) -> pd.DataFrame:
+    """A CSV file, or a sheet of a spreadsheet (cached, see ``utils.excel_cache``)."""
+    if path.suffix.lower() == ".csv":
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            sample = f.read(64 * 1024)
+        try:
+            sep = csv.Sniffer().sniff(sample, delimiters=",;\t").delimiter
+        except csv.Error:
+            # A single column has no delimiter to detect
+            sep = ","
+        return pd.read_csv(path, skiprows=skiprows, sep=sep, encoding="utf-8-sig")
+    return read_excel_cached(path, sheet_name=sheet, skiprows=skiprows)
+
+
+def _column(df: pd.DataFrame, name: str, path: Path) -> pd.Series:
+    if name not in df.columns:
+        raise KeyError(f"Coluna '{name}' não encontrada em {path.name}. Colunas: {', '.join(map(str, df.columns))}")
+    return df[name]
+
+
+def load_catalog(args: argparse.Namespace) -> pd.DataFrame:
+    """Merge the catalog files into ``args.catalog_name`` and return its descriptions with mean values.
+
+    Without catalog files, the catalog stored under that name is used as is.
+    """
+    store = get_catalog_store()
+    if args.catalog:
+        frames = []
+        for path in args.catalog:
+            df = read_table(path, args.catalog_sheet, args.catalog_skiprows)
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "description": _column(df, args.description_column, path),
+                        "quantity": pd.to_numeric(_column(df, args.quantity_column, path), errors="coerce"),
+                        "value": pd.to_numeric(_column(df, args.value_column, path), errors="coerce"),
+                    }
+                )
+            )
+        extract = pd.concat(frames, ignore_index=True).dropna()
+        extract["description"] = extract["description"].astype(str)
+        if args.catalog_filter:
+            extract = extract[extract["description"].str.contains(args.catalog_filter, case=False, na=False, regex=True)]
+
+        config = load_config()
+        collapsed, dedup_report = collapse_catalog(
+            extract, near_duplicates=config.dedup_near_duplicates, threshold=config.dedup_similarity
+        )
+        print(f"Catálogo: {dedup_report.summary()}", file=sys.stderr)
+        if store.merge(args.catalog_name, collapsed, replace=not args.append).duplicate:
+            print(f"Catálogo {args.catalog_name}: extrato já incorporado, ignorado", file=sys.stderr)
+
+    catalog = store.load(args.catalog_name)
+    if catalog.empty:
+        raise ValueError(f"Catálogo '{args.catalog_name}' vazio ou inexistente")
+    catalog["mean_value"] = catalog["total_value"] / catalog["quantity"]
+    return catalog[["description", "mean_value", "quantity", "count"]].dropna()
+
+
+def load_queries(path: Path, args: argparse.Namespace) -> tuple[list[str], list[float | None] | None]:
+    """Distinct query descriptions of a pesquisa file and, with ``--expected-value-column``, their reference prices."""
+    df = read_table(path, args.query_sheet, args.query_skiprows)
+    df = df[_column(df, args.query_column, path).notna()]
+    columns = {"query": df[args.query_column].astype(str).str.strip()}
+    if args.expected_value_column:
+        columns["expected"] = pd.to_numeric(_column(df, args.expected_value_column, path), errors="coerce")
+    queries = pd.DataFrame(columns)
+    queries = queries[queries["query"] != ""].drop_duplicates("query")
+
+    expected = None
+    if args.expected_value_column:
+        expected = [None if pd.isna(value) else float(value) for value in queries["expected"]]
+    return queries["query"].tolist(), expected
+
+
+def write_results(results: list[dict[str, Any]], path: Path, output_format: str) -> None:
+    """Write serialized task results: the UI's CSV export, or one JSON object per query."""
+    with open(path, "wb") as f:
+        if output_format == "csv":
+            for chunk in iter_csv(results, {}):
+                f.write(chunk)
+        else:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def match_file(
+    path: Path, position: int, catalog: pd.DataFrame, catalog_job: IndexingJob, args: argparse.Namespace
+) -> dict[str, Any]:
+    """Run the matching pipeline for one pesquisa file and write its results; returns its summary entry."""
+    started = time.perf_counter()
+    entry: dict[str, Any] = {"file": str(path), "status": "failed", "queries": 0, "matched": 0}
+    try:
+        queries, expected_values = load_queries(path, args)
+    except Exception as e:
+        entry.update(error=str(e), seconds=round(time.perf_counter() - started, 2))
+        return entry
+    entry["queries"] = len(queries)
+
+    task: dict[str, Any] = {}
+    task_lock = threading.Lock()
+    bar = tqdm(total=len(queries), desc=path.stem[:30], position=position, leave=True, file=sys.stderr)
+
+    def _update(task_id: str, **updates: Any) -> None:
+        with task_lock:
+            task.update(updates)
+            if "progress" in updates:
+                bar.n = updates["progress"]
+            if "stage" in updates:
+                bar.set_postfix_str(updates["stage"], refresh=False)
+            bar.refresh()
+
+    task_id = str(uuid.uuid4())
+    entry["task_id"] = task_id
+    try:
+        run_matching_pipeline(
+            task_id,
+            queries,
+            catalog["description"].tolist(),
+            catalog["mean_value"].tolist(),
+            args.context,
+            _update,
+            args.catalog_name,
+            catalog_job=catalog_job,
+            quantities=catalog["quantity"].tolist(),
+            counts=catalog["count"].tolist(),
+            expected_values=expected_values,
+        )
+    except Exception as e:
+        task.update(status="failed", error=str(e))
+    finally:
+        bar.close()
+
+    entry.update(status=task.get("status"), seconds=round(time.perf_counter() - started, 2))
+    if task.get("status") != "completed":
+        entry.update(status="failed", error=task.get("error"))
+        return entry
+
+    results = task.get("results") or []
+    output = args.output_dir / f"{path.stem}.{args.format}"
+    try:
+        write_results(results, output, args.format)
+    except OSError as e:
+        entry.update(status="failed", error=f"Erro ao gravar {output}: {e}")
+        return entry
+    entry.update(matched=len(results), output=str(output))
+    if "cache_hit_ratio" in task:
+        entry["cache_hit_ratio"] = task["cache_hit_ratio"]
+    if "attribute_pruned" in task:
+        entry["attribute_pruned"] = task["attribute_pruned"]
+    return entry
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Correspondência de pesquisas com um catálogo, sem interface web.")
+    catalog = parser.add_argument_group("catálogo")
+    catalog.add_argument("--catalog", nargs="*", type=Path, default=[], help="Planilhas (ou CSV) de notas fiscais")
+    catalog.add_argument("--catalog-name", required=True, help="Nome do catálogo (e da coleção vetorial)")
+    catalog.add_argument("--append", action="store_true", help="Somar os arquivos ao catálogo armazenado em vez de substituí-lo")
+    catalog.add_argument("--catalog-sheet", default=0, help="Aba das planilhas do catálogo (nome ou índice)")
+    catalog.add_argument("--catalog-skiprows", type=int, default=4)
+    catalog.add_argument("--description-column", default="descr_compl")
+    catalog.add_argument("--quantity-column", default="qtd")
+    catalog.add_argument("--value-column", default="vl_item", help="Valor total da linha")
+    catalog.add_argument("--catalog-filter", help="Expressão regular: só descrições que a contenham")
+
+    queries = parser.add_argument_group("pesquisas")
+    queries.add_argument("--queries", nargs="+", type=Path, required=True, help="Arquivos de pesquisa")
+    queries.add_argument("--query-sheet", default=0, help="Aba das planilhas de pesquisa (nome ou índice)")
+    queries.add_argument("--query-skiprows", type=int, default=0)
+    queries.add_argument("--query-column", default="DESCRIÇÃO")
+    queries.add_argument("--expected-value-column", help="Preço de referência de cada consulta (retrieval_price_band)")
+    queries.add_argument("--context", default="product matching", help="Contexto para os replacements do LLM")
+
+    run = parser.add_argument_group("execução")
+    run.add_argument("--output-dir", type=Path, default=Path("resultados"))
+    run.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    run.add_argument("--jobs", type=int, default=2, help="Arquivos de pesquisa processados em paralelo")
+    run.add_argument("--set", dest="overrides", action="append", default=[], metavar="CHAVE=VALOR",
+                     help="Sobrescreve uma configuração do config.json só nesta execução")
+    run.add_argument("--summary", type=Path, help="Também grava o resumo JSON neste arquivo")
+    return parser
+
+
+def _sheet(value: str | int) -> str | int:
+    return int(value) if isinstance(value, str) and value.isdigit() else value
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.catalog_sheet = _sheet(args.catalog_sheet)
+    args.query_sheet = _sheet(args.query_sheet)
+    try:
+        override_config(**parse_overrides(args.overrides))
+    except (KeyError, ValueError) as e:
+        parser.error(str(e))
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+
+    # stdout is kept for the summary: progress messages of the pipeline go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        files, catalog_descriptions, catalog_error = _run(args)
+
+    summary = {
+        "catalog": args.catalog_name,
+        "catalog_descriptions": catalog_descriptions,
+        "config_overrides": parse_overrides(args.overrides),
+        "files": files,
+        "queries": sum(entry["queries"] for entry in files),
+        "matched": sum(entry["matched"] for entry in files),
+        "failed": sum(entry["status"] != "completed" for entry in files),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    if catalog_error:
+        summary["catalog_error"] = catalog_error
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    print(text)
+    if args.summary:
+        try:
+            args.summary.write_text(text, encoding="utf-8")
+        except OSError as e:
+            print(f"Erro ao gravar o resumo em {args.summary}: {e}", file=sys.stderr)
+            return 1
+    return 1 if summary["failed"] or catalog_error else 0
+
+
+def _run(args: argparse.Namespace) -> tuple[list[dict[str, Any]], int, str | None]:
+    """Index the catalog once, then match the query files concurrently against it.
+
+    Returns:
+        ``(file entries, catalog descriptions, catalog error)``; if the
+        catalog cannot be loaded or indexed every file is reported as failed
+    """
+    catalog_descriptions = 0
+    try:
+        # Models are loaded once and shared by every file
+        client = get_inference_client()
+        if client is not None:
+            client.warm_up()
+
+        catalog = load_catalog(args)
+        catalog_descriptions = len(catalog)
+        catalog_job = start_indexing(
+            catalog["description"].tolist(),
+            catalog["mean_value"].tolist(),
+            args.context,
+            args.catalog_name,
+            args.append,
+            catalog["quantity"].tolist(),
+            catalog["count"].tolist(),
+        )
+        catalog_job.attach(lambda **updates: updates.get("message") and tqdm.write(updates["message"], file=sys.stderr))
+    except Exception as e:
+        shutdown_inference()
+        error = f"Erro no catálogo: {e}"
+        files = [
+            {"file": str(path), "status": "failed", "queries": 0, "matched": 0, "error": error}
+            for path in args.queries
+        ]
+        return files, catalog_descriptions, error
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs), thread_name_prefix="cli-match") as executor:
+            futures = [
+                executor.submit(match_file, path, position, catalog, catalog_job, args)
+                for position, path in enumerate(args.queries)
+            ]
+            files = []
+            for path, future in zip(args.queries, futures):
+                try:
+                    files.append(future.result())
+                except Exception as e:
+                    files.append({"file": str(path), "status": "failed", "queries": 0, "matched": 0, "error": str(e)})
+    finally:
+        shutdown_inference()
+    return files, catalog_descriptions, None
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""Stage checkpoints of a matching task, for resuming after a crash.
+
+``run_matching_pipeline`` writes the output of each stage under
+``<task dir>/checkpoints``::
+
+    inputs.json        queries, catalog and parameters the task was started with
+    cache_hits.json    queries answered from the query cache (see ``services.query_cache``)
+    replacements.json  LLM replacements and the processed documents (stages 1–2)
+    candidates.npz     retrieved candidates and the cells to rerank (stage 3)
+    rerank/            rerank scores, one file per chunk of query rows (stage 4)
+    completed.json     written on success when checkpoints are retained
+
+A resumed task skips every stage whose checkpoint exists and reranks only
+the query rows without a score chunk. Stages 1–4 only process the
+queries that were not cache hits. Files are written under a temporary
+name and renamed, so an interrupted write never looks complete.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from utils.candidate_matrix import CandidateMatrix
+from utils.domain import PipelineParams
+from utils.preprocesssing import Replacement
+from services.task_results import TASKS_PATH
+
+_CHECKPOINT_DIR = "checkpoints"
+_INPUTS_FILE = "inputs.json"
+_CACHE_HITS_FILE = "cache_hits.json"
+_REPLACEMENTS_FILE = "replacements.json"
+_CANDIDATES_FILE = "candidates.npz"
+_RERANK_DIR = "rerank"
+_COMPLETED_FILE = "completed.json"
+
+
+@dataclass
+class TaskInputs:
+    """Everything ``run_matching_pipeline`` needs to run a task again."""
+
+    queries: list[str]
+    documents: list[str]
+    values: list[float]
+    context: str
+    excel_file_name: str | None
+    params: PipelineParams
+    quantities: list[float] | None = None
+    counts: list[int] | None = None
+    expected_values: list[float | None] | None = None
+
+
+def _write_atomic(path: Path, write: Callable[[Path], None]) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(Path(tmp_path))
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _write_json(path: Path, data) -> None:
+    def write(tmp: Path) -> None:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+    _write_atomic(path, write)
+
+
+def _read_json(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class TaskCheckpoints:
+    """
+    Checkpoints of one task.
+
+    Args:
+        task_id: Task whose checkpoints are read and written
+    """
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.path = TASKS_PATH / task_id / _CHECKPOINT_DIR
+
+    def exists(self) -> bool:
+        """True if the task's inputs were checkpointed (so it can be resumed)."""
+        return (self.path / _INPUTS_FILE).exists()
+
+    def reset(self) -> None:
+        """Delete every checkpoint of the task."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    # --- Inputs ---------------------------------------------------------------
+
+    def save_inputs(self, inputs: TaskInputs) -> None:
+        (self.path / _RERANK_DIR).mkdir(parents=True, exist_ok=True)
+        _write_json(self.path / _INPUTS_FILE, asdict(inputs))
+
+    def load_inputs(self) -> TaskInputs:
+        data = _read_json(self.path / _INPUTS_FILE)
+        data["params"] = PipelineParams(**data["params"])
+        return TaskInputs(**data)
+
+    # --- Query cache hits ----------------------------------------------------------
+
+    def save_cache_hits(self, cached: dict[int, list[tuple]]) -> None:
+        _write_json(self.path / _CACHE_HITS_FILE, {str(i): rows for i, rows in cached.items()})
+
+    def load_cache_hits(self) -> dict[int, list[tuple]] | None:
+        """Cached candidates by query index, or None if the lookup was not checkpointed."""
+        path = self.path / _CACHE_HITS_FILE
+        if not path.exists():
+            return None
+        return {int(i): [tuple(row) for row in rows] for i, rows in _read_json(path).items()}
+
+    # --- Stages 1–2: replacements ----------------------------------------------
+
+    def save_replacements(self, replacements: list[Replacement], processed_documents: list[str]) -> None:
+        _write_json(
+            self.path / _REPLACEMENTS_FILE,
+            {
+                "replacements": [replacement.model_dump() for replacement in replacements],
+                "processed_documents": processed_documents,
+            },
+        )
+
+    def load_replacements(self) -> list[Replacement] | None:
+        """Replacements of the catalog, or None if stage 1 was not checkpointed."""
+        path = self.path / _REPLACEMENTS_FILE
+        if not path.exists():
+            return None
+        return [Replacement(**replacement) for replacement in _read_json(path)["replacements"]]
+
+    # --- Stage 3: retrieval -----------------------------------------------------
+
+    def save_candidates(self, retrieved: CandidateMatrix, to_rerank: np.ndarray) -> None:
+        """Store the retrieved candidates and the cells (bool ``[Q, k]``) left in play for the reranker."""
+
+        def write(tmp: Path) -> None:
+            with open(tmp, "wb") as f:
+                np.savez(
+                    f,
+                    queries=np.array(retrieved.queries, dtype=str),
+                    documents=np.array(retrieved.documents, dtype=str),
+                    doc_index=retrieved.doc_index,
+                    distance=retrieved.distance,
+                    value=retrieved.value,
+                    mask=retrieved.mask,
+                    to_rerank=to_rerank,
+                )
+
+        _write_atomic(self.path / _CANDIDATES_FILE, write)
+
+    def load_candidates(self) -> tuple[CandidateMatrix, CandidateMatrix] | None:
+        """``(retrieved, to_rerank)`` matrices, or None if stage 3 was not checkpointed."""
+        path = self.path / _CANDIDATES_FILE
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            retrieved = CandidateMatrix(
+                queries=data["queries"].tolist(),
+                documents=data["documents"].tolist(),
+                doc_index=data["doc_index"],
+                distance=data["distance"],
+                score=np.full(data["doc_index"].shape, np.nan),
+                value=data["value"],
+                mask=data["mask"],
+            )
+            to_rerank = retrieved.exclude(~data["to_rerank"])
+        return retrieved, to_rerank
+
+    # --- Stage 4: rerank chunks ---------------------------------------------------
+
+    def save_scores(self, start: int, stop: int, scores: np.ndarray) -> None:
+        """Store the rerank scores of query rows ``[start, stop)``."""
+        path = self.path / _RERANK_DIR / f"{start:08d}-{stop:08d}.npy"
+
+        def write(tmp: Path) -> None:
+            # A file object, as np.save would append ".npy" to the temporary name
+            with open(tmp, "wb") as f:
+                np.save(f, scores, allow_pickle=False)
+
+        _write_atomic(path, write)
+
+    def load_scores(self, shape: tuple[int, int]) -> tuple[np.ndarray, int]:
+        """Scores of the rows reranked so far and the first row still to rerank.
+
+        Only chunks contiguous from row 0 count; cells without a score are NaN.
+        """
+        scores = np.full(shape, np.nan)
+        chunks = {}
+        for path in (self.path / _RERANK_DIR).glob("*.npy"):
+            start, stop = (int(bound) for bound in path.stem.split("-"))
+            chunks[start] = (stop, path)
+
+        done = 0
+        while done in chunks:
+            stop, path = chunks[done]
+            scores[done:stop] = np.load(path, allow_pickle=False)
+            done = stop
+        return scores, done
+
+    # --- Progress and cleanup -------------------------------------------------------
+
+    def last_stage(self) -> str | None:
+        """Most advanced stage checkpointed: ``rerank``, ``retrieval``, ``replacements``, ``inputs`` or None."""
+        if any((self.path / _RERANK_DIR).glob("*.npy")):
+            return "rerank"
+        if (self.path / _CANDIDATES_FILE).exists():
+            return "retrieval"
+        if (self.path / _REPLACEMENTS_FILE).exists():
+            return "replacements"
+        return "inputs" if self.exists() else None
+
+    def finish(self, retention_hours: float, interrupted_retention_hours: float = 0.0) -> None:
+        """Task succeeded: delete its checkpoints now, or mark them for ``prune_checkpoints``."""
+        if retention_hours <= 0:
+            self.reset()
+        else:
+            _write_json(self.path / _COMPLETED_FILE, {"finished_at": time.time()})
+        prune_checkpoints(retention_hours, interrupted_retention_hours)
+
+
+def interrupted_task_ids() -> list[str]:
+    """Tasks with checkpoints that never completed (crashed, killed or failed runs)."""
+    return sorted(
+        path.parent.parent.name
+        for path in TASKS_PATH.glob(f"*/{_CHECKPOINT_DIR}/{_INPUTS_FILE}")
+        if not (path.parent / _COMPLETED_FILE).exists()
+    )
+
+
+def _last_progress(path: Path) -> float:
+    """Modification time of the newest checkpoint file under *path*."""
+    return max((p.stat().st_mtime for p in path.rglob("*") if p.is_file()), default=path.stat().st_mtime)
+
+
+def prune_checkpoints(retention_hours: float, interrupted_retention_hours: float = 0.0) -> int:
+    """Delete checkpoints of tasks that completed more than *retention_hours* ago.
+
+    With *interrupted_retention_hours* > 0, also delete those of tasks that
+    never completed (failed, crashed or killed runs) and made no progress
+    for that long, so abandoned tasks do not keep their checkpoints forever.
+
+    Returns:
+        Number of tasks whose checkpoints were deleted
+    """
+    now = time.time()
+    cutoff = now - retention_hours * 3600
+    pruned = 0
+    for path in TASKS_PATH.glob(f"*/{_CHECKPOINT_DIR}"):
+        completed = path / _COMPLETED_FILE
+        try:
+            if completed.exists():
+                expired = _read_json(completed)["finished_at"] <= cutoff
+            elif interrupted_retention_hours > 0:
+                expired = _last_progress(path) <= now - interrupted_retention_hours * 3600
+            else:
+                continue
+        except (OSError, ValueError, KeyError):
+            continue
+        if expired:
+            shutil.rmtree(path, ignore_errors=True)
+            pruned += 1
+    return pruned
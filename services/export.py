@@ -0,0 +1,69 @@
+"""Export of a task's results as CSV or XLSX.
+
+One row per query: the best candidate among the first ``EXPORT_CANDIDATES``
+shown on the results page that the user did not deselect. Rows are
+produced lazily from the stored results, so the CSV is streamed in
+constant memory and the XLSX is written with openpyxl's write-only mode.
+"""
+
+import csv
+import io
+import tempfile
+from typing import Any, Iterator, Mapping
+
+from openpyxl import Workbook
+
+EXPORT_FORMATS = ("csv", "xlsx")
+# Candidates shown per query on the results page (the only ones that can be deselected)
+EXPORT_CANDIDATES = 3
+HEADER = ("Consulta", "Correspondência", "Score", "Valor Médio (R$)")
+
+# Deselected candidate positions per result index, e.g. {12: [0, 2]}
+Deselections = Mapping[int, list[int]]
+
+
+def export_rows(results: list[dict[str, Any]], deselected: Deselections) -> Iterator[tuple[str, str, float, float]]:
+    """Yield ``(query, description, score, value)`` for each result that keeps a candidate.
+
+    Args:
+        results: Serialized task results (see ``serialize_matches``)
+        deselected: Candidate positions excluded by the user, per result index
+    """
+    for index, result in enumerate(results):
+        excluded = set(deselected.get(index, ()))
+        for position, item in enumerate(result["matched_items"][:EXPORT_CANDIDATES]):
+            if position not in excluded:
+                yield result["query"], item["description"], item["score"], item["value"]
+                break
+
+
+def iter_csv(results: list[dict[str, Any]], deselected: Deselections, chunk_rows: int = 1000) -> Iterator[bytes]:
+    """Stream the export as tab-separated UTF-8, *chunk_rows* rows per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter="\t", lineterminator="\n")
+    writer.writerow(HEADER)
+    for n, (query, description, score, value) in enumerate(export_rows(results, deselected), start=1):
+        writer.writerow((query, description, f"{score:.4f}", f"{value:.2f}"))
+        if n % chunk_rows == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def iter_xlsx(results: list[dict[str, Any]], deselected: Deselections, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Write the export as an XLSX workbook and stream it in *chunk_size* pieces.
+
+    The workbook is built in a temporary file (in memory up to 8 MB, then on disk).
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Resultados")
+    sheet.append(HEADER)
+    for row in export_rows(results, deselected):
+        sheet.append(row)
+
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as output:
+        workbook.save(output)
+        output.seek(0)
+        while chunk := output.read(chunk_size):
+            yield chunk
@@ -0,0 +1,275 @@
+"""Catalog preparation, started as soon as the data arrives.
+
+``prepare_catalog`` runs the query-independent half of the pipeline
+(LLM replacements, preprocessing, embedding and ingestion). The routes
+start it in the background with ``start_indexing`` when the Excel file is
+accepted, and embed the queries with ``start_query_embedding`` when the
+pasted data arrives. ``run_matching_pipeline`` then attaches to the
+running (or finished) work instead of starting from zero.
+"""
+
+import threading
+import traceback
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict
+
+import numpy as np
+from slugify import slugify
+
+from utils.attributes import AttributeIndex, get_attribute_extractor, unit_metadata
+from utils.config import AppConfig, load_config
+from utils.inference import embed_texts
+from utils.preprocesssing import Replacement, apply_replacements, get_replacements_from_llm
+from utils.vector_store import IndexSettings, VectorStore, open_vector_store
+from services.ingestion import document_id, ingest_documents
+
+StatusUpdater = Callable[..., None]
+
+# Fields of an indexing job that are mirrored into an attached task
+_TASK_FIELDS = ("stage", "message", "shards")
+
+
+@dataclass
+class PreparedCatalog:
+    """A catalog embedded and stored, ready to be queried."""
+
+    file_name: str
+    documents: list[str]
+    processed_documents: list[str]
+    # Values come back with each hit, as metadata (see document_metadata)
+    store: VectorStore
+    # Attributes of the processed documents, when ``attribute_prefilter`` is on
+    attributes: AttributeIndex | None = None
+    # Replacements applied to the documents (checkpointed by matching tasks)
+    replacements: list[Replacement] = field(default_factory=list)
+
+
+def document_metadata(description: str, mean_value: float, quantity: float | None, count: int | None) -> dict[str, Any]:
+    """Vector-store metadata of a catalog document: price aggregates and unit (see ``utils.attributes``)."""
+    metadata: dict[str, Any] = {"mean_value": float(mean_value), **unit_metadata(description)}
+    if quantity is not None:
+        metadata["quantity"] = float(quantity)
+    if count is not None:
+        metadata["count"] = int(count)
+    return metadata
+
+
+def prepare_catalog(
+    documents: list[str],
+    values: list[float],
+    context: str,
+    file_name: str,
+    on_update: StatusUpdater,
+    config: AppConfig | None = None,
+    embed_only_new: bool = False,
+    quantities: list[float] | None = None,
+    counts: list[int] | None = None,
+    replacements: list[Replacement] | None = None,
+) -> PreparedCatalog:
+    """Run replacements, preprocessing and ingestion for a catalog.
+
+    Args:
+        documents: Catalog descriptions
+        values: Value of each description
+        context: Domain context for the LLM replacements
+        file_name: Catalog file name, used to name the vector store
+        on_update: Receives status fields (``stage``, ``message``, ``shards``,
+            ``indexed``, ``total_documents``) as keyword arguments
+        config: Settings to use (loaded from ``config.json`` if None)
+        embed_only_new: Skip documents already in the vector store (appended extracts);
+            their metadata is still refreshed
+        quantities: Total quantity of each description, stored as metadata
+        counts: Invoice rows of each description, stored as metadata
+        replacements: Replacements of an earlier run; skips the LLM call
+    """
+    config = config or load_config()
+
+    # --- Stage 1: LLM replacements -------------------------------------------
+    on_update(stage="llm_replacements", message="Obtendo replacements do LLM...")
+    if replacements is not None:
+        on_update(message=f"{len(replacements)} replacements recuperados do checkpoint")
+    elif config.use_llm and config.use_llm_abbreviation_expansion:
+        replacements = get_replacements_from_llm(
+            documents, context=context, status_callback=lambda msg: on_update(message=msg)
+        )
+    else:
+        replacements = []
+
+    on_update(stage="preprocessing", message="Aplicando replacements aos documentos...")
+    processed_documents = apply_replacements(documents, replacements)
+    metadatas = [
+        document_metadata(
+            doc, value, quantities[i] if quantities else None, counts[i] if counts else None
+        )
+        for i, (doc, value) in enumerate(zip(documents, values))
+    ]
+
+    # --- Stage 2: Vector DB --------------------------------------------------
+    on_update(stage="creating_db", message="Criando coleção vetorial...")
+    store = open_vector_store(
+        slugify(file_name),
+        backend=config.vector_backend,
+        shards=config.vector_shards,
+        shard_by=config.vector_shard_by,
+        settings=IndexSettings.from_config(config),
+    )
+    on_update(shards=max(1, config.vector_shards))
+
+    to_embed = range(len(documents))
+    if embed_only_new:
+        existing = store.existing_ids([document_id(doc) for doc in documents])
+        to_embed = [i for i, doc in enumerate(documents) if document_id(doc) not in existing]
+        print(f"{len(existing)} documentos já indexados; {len(to_embed)} novos para inserir")
+        # Known documents keep their vectors but get the updated aggregates
+        kept = [i for i, doc in enumerate(documents) if document_id(doc) in existing]
+        store.update_metadatas([document_id(documents[i]) for i in kept], [metadatas[i] for i in kept])
+
+    on_update(stage="inserting_db", message="Inserindo documentos no banco vetorial...", indexed=0, total_documents=len(to_embed))
+    ingest_documents(
+        store,
+        [processed_documents[i] for i in to_embed],
+        [documents[i] for i in to_embed],
+        [metadatas[i] for i in to_embed],
+        processes=config.embedding_processes,
+        message_callback=lambda msg: on_update(message=msg),
+        progress_callback=lambda done, total: on_update(indexed=done, total_documents=total),
+    )
+
+    attributes = None
+    if config.attribute_prefilter:
+        attributes = AttributeIndex.build(processed_documents, get_attribute_extractor(config.attribute_rules_path))
+    return PreparedCatalog(file_name, documents, processed_documents, store, attributes, replacements)
+
+
+class IndexingJob:
+    """
+    ``prepare_catalog`` running in a background thread.
+
+    ``snapshot`` returns the job's status for polling; ``attach`` mirrors
+    its stage and messages into a task while waiting for the result.
+    """
+
+    def __init__(
+        self,
+        documents: list[str],
+        values: list[float],
+        context: str,
+        file_name: str,
+        embed_only_new: bool = False,
+        quantities: list[float] | None = None,
+        counts: list[int] | None = None,
+    ):
+        self.job_id = str(uuid.uuid4())
+        self.documents = documents
+        self.values = values
+        self.context = context
+        self.file_name = file_name
+        self.embed_only_new = embed_only_new
+        self.quantities = quantities
+        self.counts = counts
+        self._future: Future[PreparedCatalog] = Future()
+        self._lock = threading.Lock()
+        self._listeners: list[StatusUpdater] = []
+        self._state: Dict[str, Any] = {
+            "job_id": self.job_id,
+            "file_name": file_name,
+            "status": "running",
+            "stage": "initializing",
+            "message": None,
+            "error": None,
+            "indexed": 0,
+            "total_documents": len(documents),
+        }
+
+    def start(self) -> "IndexingJob":
+        threading.Thread(target=self._run, name="catalog-indexer", daemon=True).start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            catalog = prepare_catalog(
+                self.documents,
+                self.values,
+                self.context,
+                self.file_name,
+                self._update,
+                embed_only_new=self.embed_only_new,
+                quantities=self.quantities,
+                counts=self.counts,
+            )
+        except Exception as e:
+            traceback.print_exc()
+            print(f"Error indexing catalog {self.file_name}: {e}")
+            self._update(status="failed", error=str(e))
+            self._future.set_exception(e)
+            return
+        self._update(status="completed", stage="indexed", message="Catálogo indexado.")
+        self._future.set_result(catalog)
+
+    def _update(self, **updates: Any) -> None:
+        with self._lock:
+            self._state.update(updates)
+            listeners = list(self._listeners)
+        forwarded = {k: v for k, v in updates.items() if k in _TASK_FIELDS}
+        if forwarded:
+            for listener in listeners:
+                listener(**forwarded)
+
+    def matches(
+        self,
+        documents: list[str],
+        values: list[float],
+        context: str,
+        file_name: str,
+        quantities: list[float] | None = None,
+        counts: list[int] | None = None,
+    ) -> bool:
+        """True if this job prepares exactly this catalog and has not failed."""
+        return (
+            self._state["status"] != "failed"
+            and self.file_name == file_name
+            and self.context == context
+            and self.documents == documents
+            and self.values == values
+            and self.quantities == quantities
+            and self.counts == counts
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._state)
+
+    def attach(self, on_update: StatusUpdater) -> PreparedCatalog:
+        """Forward the job's progress to *on_update* until it finishes, and return its result."""
+        with self._lock:
+            self._listeners.append(on_update)
+            current = {k: self._state[k] for k in _TASK_FIELDS if k in self._state}
+        try:
+            on_update(**current)
+            return self._future.result()
+        finally:
+            with self._lock:
+                self._listeners.remove(on_update)
+
+
+def start_indexing(
+    documents: list[str],
+    values: list[float],
+    context: str,
+    file_name: str,
+    embed_only_new: bool = False,
+    quantities: list[float] | None = None,
+    counts: list[int] | None = None,
+) -> IndexingJob:
+    """Start preparing a catalog in the background (see ``prepare_catalog``)."""
+    return IndexingJob(documents, values, context, file_name, embed_only_new, quantities, counts).start()
+
+
+_query_embedder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-embedder")
+
+
+def start_query_embedding(queries: list[str]) -> "Future[np.ndarray]":
+    """Embed *queries* in the background; the future resolves to the embedding matrix."""
+    return _query_embedder.submit(embed_texts, queries)
@@ -0,0 +1,144 @@
+"""Catalog ingestion: embed documents outside the vector DB and upsert them.
+
+Embedding runs in a producer thread (on the inference workers, or
+in-process, optionally fanned out to a sentence-transformers pool) while
+the consumer upserts the previous batch, so the CPU-bound and I/O-bound
+halves overlap.
+"""
+
+import hashlib
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from utils.inference import embedder
+
+
+@dataclass
+class BatchReport:
+    """Timing of one ingested batch."""
+
+    batch: int
+    total_batches: int
+    size: int
+    embed_seconds: float
+    upsert_seconds: float
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.size / max(self.embed_seconds, 1e-9)
+
+
+def document_id(original: str) -> str:
+    """Stable vector-DB ID of a document, derived from its original text."""
+    return hashlib.md5(original.encode()).hexdigest()
+
+
+def ingest_documents(
+    db,
+    processed_documents: list[str],
+    original_documents: list[str],
+    metadatas: list[dict] | None = None,
+    batch_size: int = 5000,
+    processes: int = 0,
+    message_callback: Callable[[str], None] | None = None,
+    progress_callback: Callable[[int, int], None] | None = None,
+) -> list[BatchReport]:
+    """Embed *processed_documents* and upsert them into *db* with precomputed embeddings.
+
+    Documents are sorted by length before batching so each batch holds
+    texts of similar length, which keeps padding inside the model low.
+
+    Args:
+        db: Vector store to write to (see ``utils.vector_store``)
+        processed_documents: Texts to embed and store
+        original_documents: Source texts, used to derive stable IDs
+        metadatas: Metadata stored with each document (price, unit; see ``services.indexing``)
+        batch_size: Documents per upsert
+        processes: Embedding worker processes in ``in_process`` inference mode (0 or 1 = in-process)
+        message_callback: Receives a progress message per batch
+        progress_callback: Receives (documents ingested, total documents) per batch
+
+    Returns:
+        A BatchReport per batch
+    """
+    total_docs = len(processed_documents)
+    order = sorted(range(total_docs), key=lambda i: len(processed_documents[i]))
+    batches = [order[i : i + batch_size] for i in range(0, total_docs, batch_size)]
+    total_batches = len(batches)
+
+    # Small buffer: embed batch N+1 while batch N is being written
+    embedded: queue.Queue = queue.Queue(maxsize=2)
+    done = object()
+    # Set when the consumer stops, even on an error, so the producer never blocks on a full queue
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        """Hand *item* to the consumer; False if it stopped listening."""
+        while not stop.is_set():
+            try:
+                embedded.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce() -> None:
+        try:
+            with embedder(processes) as embed:
+                for batch in batches:
+                    if stop.is_set():
+                        return
+                    start = time.perf_counter()
+                    embeddings = embed([processed_documents[i] for i in batch])
+                    if not _put((batch, embeddings, time.perf_counter() - start)):
+                        return
+        except BaseException as e:
+            _put(e)
+        finally:
+            _put(done)
+
+    producer = threading.Thread(target=_produce, name="catalog-embedder", daemon=True)
+    producer.start()
+
+    reports: list[BatchReport] = []
+    try:
+        # The NumPy store writes its files once, after the last batch
+        with db.bulk():
+            while (item := embedded.get()) is not done:
+                if isinstance(item, BaseException):
+                    raise item
+                batch, embeddings, embed_seconds = item
+
+                start = time.perf_counter()
+                db.upsert(
+                    ids=[document_id(original_documents[i]) for i in batch],
+                    documents=[processed_documents[i] for i in batch],
+                    embeddings=embeddings,
+                    metadatas=[metadatas[i] for i in batch] if metadatas else None,
+                )
+                report = BatchReport(
+                    batch=len(reports) + 1,
+                    total_batches=total_batches,
+                    size=len(batch),
+                    embed_seconds=embed_seconds,
+                    upsert_seconds=time.perf_counter() - start,
+                )
+                reports.append(report)
+
+                msg = (
+                    f"Inserindo batch {report.batch}/{report.total_batches} ({report.size} documentos, "
+                    f"{report.docs_per_second:.0f} docs/s)"
+                )
+                print(msg)
+                if message_callback:
+                    message_callback(msg)
+                if progress_callback:
+                    progress_callback(sum(r.size for r in reports), total_docs)
+    finally:
+        # Leaving early (upsert or callback error): the producer exits and closes the embedding pool
+        stop.set()
+        producer.join()
+    return reports
@@ -1,49 +1,47 @@
-import hashlib
-from pathlib import Path
-from typing import Callable, Dict
-
-import chromadb
-from slugify import slugify
-
-from utils.ai import PesquisaPrompt
-from utils.config import OUTPUT_PATH, load_config
-from utils.domain import QueryMatch
-from utils.embeddings import emb_fn_bge_m3
-from utils.preprocesssing import apply_replacements, get_replacements_from_llm, split_by_confidence
-from utils.reranker import filter_items_by_score, filter_items_by_score_gap, rerank_items
-from web.schemas import MatchedItem, MatchResult
+from concurrent.futures import Future
+from dataclasses import asdict
+from typing import Callable
+
+import numpy as np
+
+from utils.attributes import AttributeIndex, extract_unit, get_attribute_extractor
+from utils.candidate_matrix import CandidateMatrix
+from utils.config import AppConfig, load_config
+from utils.domain import PipelineParams
+from utils.inference import embed_texts, reranker_backend
+from utils.reranker import rerank_matrix
+from utils.vector_store import Where, convert_cosine_distance, query_with_filters
+from services.checkpoints import TaskCheckpoints, TaskInputs
+from services.indexing import IndexingJob, prepare_catalog
+from services.query_cache import catalog_fingerprint, load_cached_rows, save_rows
+from services.task_results import apply_filters, save_raw_matches, serialize_matches
 import traceback
 
 TaskUpdater = Callable[..., None]
 
-DB_STORAGE_PATH = OUTPUT_PATH / "chromadb_storage"
-DB_STORAGE_PATH.mkdir(parents=True, exist_ok=True)
-chroma_client = chromadb.PersistentClient(path=DB_STORAGE_PATH)
 
+def retrieval_filters(
+    queries: list[str], config: AppConfig, expected_values: list[float | None] | None = None
+) -> list[Where | None]:
+    """Metadata filter of each query, from the ``retrieval_*`` settings.
 
-def _insert_documents_in_batches(
-    db,
-    processed_documents: list[str],
-    original_documents: list[str],
-    batch_size: int = 5000,
-    message_callback: Callable[[str], None] | None = None,
-) -> None:
-    """Insert documents into ChromaDB in batches to avoid memory issues."""
-    total_docs = len(processed_documents)
-    total_batches = (total_docs + batch_size - 1) // batch_size
-
-    for i in range(0, total_docs, batch_size):
-        batch_docs = processed_documents[i : i + batch_size]
-        batch_originals = original_documents[i : i + batch_size]
-        # ID is derived from the original text — stable across replacement changes
-        batch_ids = [hashlib.md5(doc.encode()).hexdigest() for doc in batch_originals]
-        db.upsert(documents=batch_docs, ids=batch_ids)
-
-        current_batch = i // batch_size + 1
-        msg = f"Inserindo batch {current_batch}/{total_batches} ({len(batch_docs)} documentos)"
-        print(msg)
-        if message_callback:
-            message_callback(msg)
+    Args:
+        queries: Query texts; their unit family comes from ``extract_unit``
+        config: Settings with ``retrieval_unit_filter`` and ``retrieval_price_band``
+        expected_values: Reference price of each query (None = no price filter for it)
+    """
+    wheres: list[Where | None] = []
+    for i, query in enumerate(queries):
+        conditions: list[Where] = []
+        if config.retrieval_unit_filter and (unit := extract_unit(query)) is not None:
+            conditions.append({"unit_family": {"$in": [unit.family, ""]}})
+        expected = expected_values[i] if expected_values else None
+        if config.retrieval_price_band > 0 and expected:
+            band = config.retrieval_price_band
+            conditions.append({"mean_value": {"$gte": expected * (1 - band)}})
+            conditions.append({"mean_value": {"$lte": expected * (1 + band)}})
+        wheres.append(None if not conditions else conditions[0] if len(conditions) == 1 else {"$and": conditions})
+    return wheres
 
 
 def run_matching_pipeline(
@@ -54,6 +52,13 @@ def run_matching_pipeline(
     context: str,
     task_updater: TaskUpdater,
     excel_file_name: str | None = None,
+    params: PipelineParams | None = None,
+    catalog_job: IndexingJob | None = None,
+    query_embeddings: "Future[np.ndarray] | None" = None,
+    quantities: list[float] | None = None,
+    counts: list[int] | None = None,
+    expected_values: list[float | None] | None = None,
+    resume: bool = False,
 ) -> None:
     """Execute the full document-matching pipeline for *task_id*.
 
@@ -66,124 +71,207 @@ def run_matching_pipeline(
       3. Query — retrieve top-N candidates per query
       4. Rerank → filter by score → filter by score gap
       5. Confidence split — only high-confidence matches are returned
-    """
-    try:
-        task_updater(task_id, status="running", progress=0, total=len(queries))
-
-        config = load_config()
 
-        # --- Stage 1: LLM replacements ---------------------------------------
-        task_updater(task_id, stage="llm_replacements", message="Obtendo replacements do LLM...")
+    The reranked scores are persisted so stages 4–5 can later be re-run with
+    other thresholds (see ``services.task_results.refilter_task``).
 
-        def _llm_status(msg: str) -> None:
-            task_updater(task_id, message=msg)
+    Stages 1–2 and the query embeddings may already be running in the
+    background (see ``services.indexing``): pass *catalog_job* and
+    *query_embeddings* to attach to them. *quantities* and *counts* are
+    stored with the documents; *expected_values* (a reference price per
+    query) enables the ``retrieval_price_band`` filter.
 
-        if config.use_llm and config.use_llm_abbreviation_expansion:
-            replacements = get_replacements_from_llm(documents, context=context, status_callback=_llm_status)
-        else:
-            replacements = []
-
-        task_updater(task_id, stage="preprocessing", message="Aplicando replacements aos documentos...")
-        processed_documents = apply_replacements(documents, replacements)
+    Queries answered before for the same catalog, models and retrieval
+    settings are served from the query cache (see ``services.query_cache``)
+    and only the others go through stages 1–4; the task reports
+    ``cache_hit_ratio``.
 
-        # Map each processed description back to its source value so we can
-        # annotate candidates retrieved from the vector DB.
-        doc_value_map: Dict[str, float] = {
-            processed: value for processed, value in zip(processed_documents, values)
-        }
+    The output of each stage is checkpointed (see ``services.checkpoints``);
+    with *resume* the stages already checkpointed are skipped and reranking
+    continues from the last chunk stored.
+    """
+    checkpoints = TaskCheckpoints(task_id)
+    try:
+        task_updater(task_id, status="running", error=None, progress=0, total=len(queries))
 
-        # --- Stage 2: Vector DB ----------------------------------------------
-        task_updater(task_id, stage="creating_db", message="Criando coleção vetorial...")
+        config = load_config()
+        if params is None:
+            params = PipelineParams(
+                # The default cutoff was calibrated on cosine distances
+                max_distance=convert_cosine_distance(PipelineParams.max_distance, config.vector_space),
+                high_confidence_threshold=config.high_confidence_threshold,
+            )
+        task_updater(task_id, params=asdict(params))
 
-        db = chroma_client.get_or_create_collection(
-            name=slugify(excel_file_name), embedding_function=emb_fn_bge_m3  # type: ignore
-        )
+        if not resume:
+            checkpoints.reset()
+            checkpoints.save_inputs(
+                TaskInputs(queries, documents, values, context, excel_file_name, params, quantities, counts, expected_values)
+            )
 
-        task_updater(task_id, stage="inserting_db", message="Inserindo documentos no banco vetorial...")
-        _insert_documents_in_batches(
-            db,
-            processed_documents,
-            documents,
-            message_callback=lambda msg: task_updater(task_id, message=msg),
+        # --- Query cache: queries already answered for this catalog and settings
+        fingerprint = None
+        if config.query_result_cache:
+            fingerprint = catalog_fingerprint(
+                documents, values, context, excel_file_name, params, config, quantities, counts
+            )
+        cached = checkpoints.load_cache_hits() if resume else None
+        if cached is None:
+            cached = load_cached_rows(fingerprint, queries, config, expected_values) if fingerprint else {}
+            checkpoints.save_cache_hits(cached)
+        task_updater(
+            task_id,
+            cache_hits=len(cached),
+            cache_hit_ratio=round(len(cached) / len(queries), 4) if queries else 0.0,
         )
-
-        # --- Stage 3: Query --------------------------------------------------
-        task_updater(task_id, stage="querying_db", message="Consultando documentos relevantes...")
-        raw = db.query(query_texts=queries, n_results=5)
-        docs = raw.get("documents") or []
-        distances = raw.get("distances") or []
-
-        matches: list[QueryMatch] = [
-            QueryMatch(
-                query=query,
-                candidates=[
-                    PesquisaPrompt.Item(
-                        description=doc,
-                        distance=dist,
-                        score=0.0,
-                        value=doc_value_map.get(doc, 0.0),
+        if cached:
+            print(f"Cache de consultas: {len(cached)}/{len(queries)} consultas reaproveitadas")
+
+        # Stages 1–4 only run for the queries missing from the cache
+        pending = [i for i in range(len(queries)) if i not in cached]
+        pending_queries = [queries[i] for i in pending]
+        pending_expected = [expected_values[i] for i in pending] if expected_values else None
+        rows = [cached.get(i, []) for i in range(len(queries))]
+
+        if pending:
+            stored = checkpoints.load_candidates() if resume else None
+            if stored is not None:
+                retrieved, candidates = stored
+                task_updater(task_id, message="Candidatos recuperados do checkpoint")
+            else:
+                # --- Stages 1–2: replacements, preprocessing, ingestion -----
+                def _task_status(**updates) -> None:
+                    task_updater(task_id, **updates)
+
+                replacements = checkpoints.load_replacements() if resume else None
+                if catalog_job is not None and replacements is None:
+                    catalog = catalog_job.attach(_task_status)
+                else:
+                    # A resumed catalog was (at least partly) ingested already: only missing documents are embedded
+                    catalog = prepare_catalog(
+                        documents, values, context, excel_file_name, _task_status, config,
+                        embed_only_new=resume, quantities=quantities, counts=counts, replacements=replacements,
+                    )
+                checkpoints.save_replacements(catalog.replacements, catalog.processed_documents)
+
+                # --- Stage 3: Query ------------------------------------------
+                task_updater(task_id, stage="querying_db", message="Consultando documentos relevantes...")
+                if query_embeddings is not None:
+                    embeddings = query_embeddings.result()[pending]
+                else:
+                    embeddings = embed_texts(pending_queries)
+                wheres = retrieval_filters(pending_queries, config, pending_expected)
+                if any(wheres):
+                    raw = query_with_filters(catalog.store, embeddings, params.n_results, wheres)
+                else:
+                    raw = catalog.store.query(embeddings, n_results=params.n_results)
+                retrieved = CandidateMatrix.from_query_result(pending_queries, raw)
+                candidates = retrieved.within_distance(params.max_distance)
+
+                # --- Attribute pre-filter: contradicting sizes/brands never reach the reranker
+                if config.attribute_prefilter:
+                    attributes = catalog.attributes or AttributeIndex.build(
+                        catalog.processed_documents, get_attribute_extractor(config.attribute_rules_path)
+                    )
+                    conflicts = (
+                        attributes.conflict_mask(pending_queries, candidates.documents, candidates.doc_index)
+                        & candidates.mask
+                    )
+                    candidates = candidates.exclude(conflicts)
+                    pruned = int(conflicts.sum())
+                    print(f"Pré-filtro de atributos: {pruned} candidatos descartados")
+                    task_updater(
+                        task_id,
+                        message=f"{pruned} candidatos com atributos conflitantes descartados",
+                        attribute_pruned=pruned,
                     )
-                    for doc, dist in zip(doc_list, dist_list)
-                    if dist <= 0.955
-                ],
-            )
-            for query, doc_list, dist_list in zip(queries, docs, distances)
-        ]
 
-        if not any(m.has_candidates for m in matches):
-            raise ValueError("Nenhum documento relevante encontrado para as descrições fornecidas.")
+                checkpoints.save_candidates(retrieved, candidates.mask)
+
+            # --- Stage 4: Rerank ---------------------------------------------
+            task_updater(task_id, stage="reranking", message="Reordenando e filtrando resultados...")
+
+            def _progress(current: int, total: int) -> None:
+                # Cached queries count as done
+                done = len(cached) + current
+                task_updater(
+                    task_id,
+                    progress=done,
+                    total=len(queries),
+                    percentage=round((done / len(queries)) * 100, 2),
+                )
+
+            scores, first_row = checkpoints.load_scores(candidates.mask.shape) if resume else (None, 0)
+            if first_row:
+                print(f"Retomando o reranking da tarefa {task_id} na consulta {first_row}/{len(pending)}")
+                _progress(first_row, len(pending))
+            candidates = rerank_matrix(
+                candidates,
+                progress_callback=_progress,
+                pool=reranker_backend(),
+                adapt_max_length=config.reranker_adaptive_max_length,
+                scores=scores,
+                first_row=first_row,
+                chunk_callback=checkpoints.save_scores,
+            )
 
-        # --- Stage 4: Rerank + filter ----------------------------------------
-        task_updater(task_id, stage="reranking", message="Reordenando e filtrando resultados...")
+            # Candidates beyond max_distance (or pruned) were not reranked and keep a NaN score
+            computed = retrieved.with_scores(candidates.score).to_rows()
+            if fingerprint:
+                save_rows(fingerprint, pending_queries, computed, config, pending_expected)
+            for i, query_rows in zip(pending, computed):
+                rows[i] = query_rows
+        else:
+            task_updater(task_id, message="Todas as consultas recuperadas do cache")
 
-        def _progress(current: int, total: int) -> None:
-            task_updater(
-                task_id,
-                progress=current,
-                total=total,
-                percentage=round((current / total) * 100, 2),
-            )
+        # Every retrieved candidate of every query, in distance order
+        retrieved = CandidateMatrix.from_rows(queries, rows)
+        if not retrieved.scored().mask.any():
+            raise ValueError("Nenhum documento relevante encontrado para as descrições fornecidas.")
 
-        matches = rerank_items(matches, progress_callback=_progress)
-        matches = filter_items_by_score(matches, threshold=0.8)
-        matches = filter_items_by_score_gap(matches, gap_threshold=0.1)
+        # Kept for re-filtering (see services.task_results.refilter_task)
+        save_raw_matches(task_id, retrieved, params)
 
-        # --- Stage 5: Confidence split ---------------------------------------
-        _, high_confidence = split_by_confidence(matches, max_score_threshold=config.high_confidence_threshold)
+        # --- Stage 5: Filter + confidence split ------------------------------
+        high_confidence = apply_filters(retrieved, params)
 
         # --- LLM judge stub (gated on config) --------------------------------
         if config.use_llm and config.use_llm_judge:
             # TODO: implement execution logic for LLM judge on low-confidence candidates
             pass
 
-        # --- Serialise results -----------------------------------------------
-        match_results = [
-            MatchResult(
-                query=match.query,
-                matched_items=[
-                    MatchedItem(
-                        description=c.description,
-                        distance=c.distance,
-                        score=c.score,
-                        value=c.value,
-                    )
-                    for c in match.candidates
-                ],
-            )
-            for match in high_confidence
-        ]
-
         task_updater(
             task_id,
             status="completed",
             progress=len(queries),
             total=len(queries),
             percentage=100.0,
-            results=[r.model_dump() for r in match_results],
+            results=serialize_matches(high_confidence),
+            resumable=False,
         )
+        checkpoints.finish(config.checkpoint_retention_hours, config.interrupted_checkpoint_retention_hours)
 
 
     except Exception as e:
         traceback.print_exc()
         print(f"Error in matching pipeline for task {task_id}: {e}")
-        task_updater(task_id, status="failed", error=str(e))
+        task_updater(task_id, status="failed", error=str(e), resumable=checkpoints.exists())
+
+
+def resume_matching_pipeline(task_id: str, task_updater: TaskUpdater) -> None:
+    """Run *task_id* again from its last complete checkpoint (see ``services.checkpoints``)."""
+    inputs = TaskCheckpoints(task_id).load_inputs()
+    run_matching_pipeline(
+        task_id,
+        inputs.queries,
+        inputs.documents,
+        inputs.values,
+        inputs.context,
+        task_updater,
+        inputs.excel_file_name,
+        params=inputs.params,
+        quantities=inputs.quantities,
+        counts=inputs.counts,
+        expected_values=inputs.expected_values,
+        resume=True,
+    )
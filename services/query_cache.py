@@ -0,0 +1,140 @@
+"""Memoized per-query results across tasks.
+
+Re-running a pesquisa sheet against an unchanged catalog repeats the
+whole pipeline for queries whose answer is already known. Every reranked
+query is stored with its retrieved candidates (distance, score and value,
+before the score filters) under a key made of:
+
+- the normalized query text (see ``normalize_description``),
+- a fingerprint of the catalog: its documents, values and everything
+  that changes how they are processed and indexed,
+- the embedding and reranker model names,
+- the retrieval parameters and filters (plus the query's expected value
+  when ``retrieval_price_band`` is on).
+
+Score and confidence thresholds are not part of the key: the filters are
+re-applied to the cached candidates, as ``refilter_task`` does.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict
+
+from pydantic import BaseModel
+
+from utils.attributes import get_attribute_extractor
+from utils.cache import DEFAULT_CACHE_DB, SqliteCacheManager
+from utils.config import AppConfig
+from utils.dedup import normalize_description
+from utils.domain import PipelineParams
+from utils.embeddings import embedding_model_name
+from utils.reranker import reranker_model_name
+
+# Bump when the cached candidates would differ for the same key
+_CACHE_FORMAT = 1
+
+# (description, distance, score or None if not reranked, value)
+Row = tuple[str, float, float | None, float]
+
+
+class CachedCandidate(BaseModel):
+    description: str
+    distance: float
+    score: float | None = None
+    value: float = 0.0
+
+
+_query_cache = SqliteCacheManager(
+    db_path=DEFAULT_CACHE_DB,
+    result_type=CachedCandidate,
+    namespace="query_results",
+    max_entries=200_000,
+    memory_items=4096,
+)
+
+
+def catalog_fingerprint(
+    documents: list[str],
+    values: list[float],
+    context: str,
+    file_name: str | None,
+    params: PipelineParams,
+    config: AppConfig,
+    quantities: list[float] | None = None,
+    counts: list[int] | None = None,
+) -> str:
+    """Hash of everything but the query that determines a query's candidates and scores."""
+    settings = {
+        "format": _CACHE_FORMAT,
+        "models": [embedding_model_name, reranker_model_name],
+        # Truncated pairs score differently
+        "rerank_truncation": config.reranker_adaptive_max_length,
+        "catalog": file_name,
+        # Replacements depend on the context only when the LLM expands abbreviations
+        "replacements": context if config.use_llm and config.use_llm_abbreviation_expansion else None,
+        "index": [
+            config.vector_backend,
+            config.vector_space,
+            config.vector_shards,
+            config.vector_shard_by,
+            config.hnsw_max_neighbors,
+            config.hnsw_ef_construction,
+            config.hnsw_ef_search,
+        ],
+        "retrieval": [params.n_results, params.max_distance, config.retrieval_unit_filter, config.retrieval_price_band],
+        "attributes": (
+            [asdict(rule) for rule in get_attribute_extractor(config.attribute_rules_path).rules]
+            if config.attribute_prefilter
+            else None
+        ),
+    }
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode())
+    for column in (documents, values, quantities or [], counts or []):
+        digest.update(json.dumps(column, ensure_ascii=False, default=float).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _key(fingerprint: str, query: str, expected_value: float | None) -> str:
+    return json.dumps([fingerprint, normalize_description(query), expected_value], ensure_ascii=False)
+
+
+def _expected(expected_values: list[float | None] | None, i: int, config: AppConfig) -> float | None:
+    # The expected value only changes the candidates through the price band
+    return expected_values[i] if expected_values and config.retrieval_price_band > 0 else None
+
+
+def load_cached_rows(
+    fingerprint: str, queries: list[str], config: AppConfig, expected_values: list[float | None] | None = None
+) -> dict[int, list[Row]]:
+    """Cached candidates of the queries that have them, by query index."""
+    cached: dict[int, list[Row]] = {}
+    for i, query in enumerate(queries):
+        entry = _query_cache.load(_key(fingerprint, query, _expected(expected_values, i, config)))
+        if entry is not None:
+            cached[i] = [(c.description, c.distance, c.score, c.value) for c in entry]
+    return cached
+
+
+def save_rows(
+    fingerprint: str,
+    queries: list[str],
+    rows: list[list[Row]],
+    config: AppConfig,
+    expected_values: list[float | None] | None = None,
+) -> None:
+    """Store the candidates of *queries* (one list of rows per query, see ``CandidateMatrix.to_rows``)."""
+    _query_cache.save_many(
+        [
+            (
+                _key(fingerprint, query, _expected(expected_values, i, config)),
+                [
+                    CachedCandidate(description=description, distance=distance, score=score, value=value)
+                    for description, distance, score, value in query_rows
+                ],
+            )
+            for i, (query, query_rows) in enumerate(zip(queries, rows))
+        ]
+    )
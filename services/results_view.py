@@ -0,0 +1,158 @@
+"""Paged, sorted and filtered views over a task's results.
+
+The results of a task are addressed by ``results_version``, which changes
+whenever the task's results are replaced (completion, re-filtering). A
+view — the result indices matching a sort and filter — is computed once
+per version and cached, so paging through it only slices a list.
+Cursors carry the version they were issued for, so a page is never mixed
+from two different result sets.
+"""
+
+import base64
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional: faster serialization of large pages
+    orjson = None
+
+SORT_KEYS = ("index", "score", "-score", "query")
+
+
+class StaleCursorError(ValueError):
+    """The cursor was issued for results that have since been replaced."""
+
+
+@dataclass(frozen=True)
+class ResultsQuery:
+    """Sort and filter of a results view.
+
+    Attributes:
+        sort: ``index`` (pipeline order), ``score`` / ``-score`` (best candidate's score) or ``query``
+        min_score: Keep results whose best candidate scores at least this
+        matched: Keep only results with (True) or without (False) a matched candidate
+        text: Case-insensitive substring of the query or of a candidate description
+    """
+
+    sort: str = "index"
+    min_score: float | None = None
+    matched: bool | None = None
+    text: str | None = None
+
+
+def _best_score(result: dict[str, Any]) -> float:
+    items = result["matched_items"]
+    return items[0]["score"] if items else 0.0
+
+
+def _is_matched(result: dict[str, Any]) -> bool:
+    return any(item.get("matched") for item in result["matched_items"])
+
+
+def _contains(result: dict[str, Any], needle: str) -> bool:
+    return needle in result["query"].casefold() or any(
+        needle in item["description"].casefold() for item in result["matched_items"]
+    )
+
+
+def _select(results: list[dict[str, Any]], query: ResultsQuery) -> list[int]:
+    indices = range(len(results))
+    if query.min_score is not None:
+        indices = [i for i in indices if _best_score(results[i]) >= query.min_score]
+    if query.matched is not None:
+        indices = [i for i in indices if _is_matched(results[i]) == query.matched]
+    if query.text:
+        needle = query.text.casefold()
+        indices = [i for i in indices if _contains(results[i], needle)]
+
+    if query.sort == "score":
+        return sorted(indices, key=lambda i: _best_score(results[i]))
+    if query.sort == "-score":
+        return sorted(indices, key=lambda i: _best_score(results[i]), reverse=True)
+    if query.sort == "query":
+        return sorted(indices, key=lambda i: results[i]["query"].casefold())
+    return list(indices)
+
+
+# Views of the most recently browsed tasks
+_views: OrderedDict[tuple[str, int, ResultsQuery], list[int]] = OrderedDict()
+_views_size = 16
+_views_lock = threading.Lock()
+
+
+def select_results(task_id: str, version: int, results: list[dict[str, Any]], query: ResultsQuery) -> list[int]:
+    """Indices of *results* matching *query*, in its sort order (cached per version)."""
+    if query.sort not in SORT_KEYS:
+        raise ValueError(f"Ordenação inválida: {query.sort}")
+    key = (task_id, version, query)
+    with _views_lock:
+        view = _views.get(key)
+        if view is not None:
+            _views.move_to_end(key)
+            return view
+
+    view = _select(results, query)
+    with _views_lock:
+        _views[key] = view
+        while len(_views) > _views_size:
+            _views.popitem(last=False)
+    return view
+
+
+def encode_cursor(version: int, offset: int) -> str:
+    raw = json.dumps([version, offset], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        version, offset = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(version), int(offset)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def page_results(
+    task_id: str,
+    version: int,
+    results: list[dict[str, Any]],
+    query: ResultsQuery,
+    cursor: str | None = None,
+    limit: int = 100,
+) -> dict[str, Any]:
+    """One page of a results view.
+
+    Returns:
+        ``items`` (each result with its pipeline ``index``), ``next_cursor``
+        (None on the last page), ``total`` (size of the view) and ``version``
+
+    Raises:
+        StaleCursorError: *cursor* belongs to an older version of the results
+        ValueError: Malformed cursor or unknown sort
+    """
+    offset = 0
+    if cursor:
+        cursor_version, offset = decode_cursor(cursor)
+        if cursor_version != version:
+            raise StaleCursorError("Os resultados mudaram; recarregue a página.")
+
+    view = select_results(task_id, version, results, query)
+    page = view[offset : offset + limit]
+    end = offset + len(page)
+    return {
+        "items": [{"index": i, **results[i]} for i in page],
+        "next_cursor": encode_cursor(version, end) if end < len(view) else None,
+        "total": len(view),
+        "version": version,
+    }
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize *content* to JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
@@ -0,0 +1,202 @@
+"""Persisted per-task scores and re-filtering of finished tasks.
+
+After reranking, every retrieved candidate is stored with its retrieval
+distance and rerank score under the task directory. The filter and split
+stages can then be re-applied with different thresholds without running
+embedding, retrieval or reranking again.
+"""
+
+import itertools
+import json
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, fields, replace
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from utils.candidate_matrix import CandidateMatrix
+from utils.config import OUTPUT_PATH
+from utils.domain import PipelineParams, QueryMatch
+from web.schemas import MatchedItem, MatchResult
+
+TASKS_PATH = OUTPUT_PATH / "tasks"
+TASKS_PATH.mkdir(parents=True, exist_ok=True)
+
+_RAW_MATCHES_FILE = "raw_matches.json"
+
+# Parsed raw matches of the most recently used tasks
+_raw_cache: OrderedDict[str, tuple[PipelineParams, CandidateMatrix]] = OrderedDict()
+_raw_cache_size = 4
+_raw_cache_lock = threading.Lock()
+
+# Largest threshold grid sweep_task evaluates in one request
+MAX_SWEEP_COMBINATIONS = 1000
+
+
+def get_task_dir(task_id: str) -> Path:
+    """Return (and create) the directory holding *task_id*'s persisted data."""
+    path = TASKS_PATH / task_id
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_raw_matches(task_id: str, candidates: CandidateMatrix, params: PipelineParams) -> None:
+    """Persist every retrieved candidate of *task_id* with its distance and score.
+
+    Candidates that were not reranked (beyond ``params.max_distance``) are
+    kept with a ``None`` score, so re-filtering can tighten the distance
+    cutoff but not loosen it past the original one.
+
+    Args:
+        task_id: Task the candidates belong to
+        candidates: Retrieved candidates in distance order, with rerank scores
+        params: Parameters the task was run with
+    """
+    data = {
+        "params": asdict(params),
+        "matches": [
+            {"query": query, "candidates": [list(row) for row in rows]}
+            for query, rows in zip(candidates.queries, candidates.to_rows())
+        ],
+    }
+    path = get_task_dir(task_id) / _RAW_MATCHES_FILE
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+    with _raw_cache_lock:
+        _raw_cache.pop(task_id, None)
+
+
+def _load_raw(task_id: str) -> tuple[PipelineParams, CandidateMatrix]:
+    with _raw_cache_lock:
+        cached = _raw_cache.get(task_id)
+        if cached is not None:
+            _raw_cache.move_to_end(task_id)
+            return cached
+
+    path = TASKS_PATH / task_id / _RAW_MATCHES_FILE
+    if not path.exists():
+        raise FileNotFoundError(f"Nenhum score armazenado para a tarefa {task_id}")
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    cached = (
+        PipelineParams(**data["params"]),
+        CandidateMatrix.from_rows(
+            [match["query"] for match in data["matches"]],
+            [match["candidates"] for match in data["matches"]],
+        ),
+    )
+
+    with _raw_cache_lock:
+        _raw_cache[task_id] = cached
+        while len(_raw_cache) > _raw_cache_size:
+            _raw_cache.popitem(last=False)
+    return cached
+
+
+def load_stored_params(task_id: str) -> PipelineParams:
+    """Return the parameters *task_id* was run with."""
+    return _load_raw(task_id)[0]
+
+
+def load_raw_matches(task_id: str) -> CandidateMatrix:
+    """Return every stored candidate of *task_id*, in distance order.
+
+    The matrix is shared between callers; its filters return new matrices.
+    """
+    return _load_raw(task_id)[1]
+
+
+def _filter(candidates: CandidateMatrix, params: PipelineParams) -> tuple[CandidateMatrix, np.ndarray]:
+    filtered = (
+        candidates.head(params.n_results)
+        .within_distance(params.max_distance)
+        .scored()
+        .filter_by_score(params.score_threshold)
+        .filter_by_score_gap(params.gap_threshold)
+        .sort_by_score()
+    )
+    _, high_rows = filtered.split_by_confidence(params.high_confidence_threshold)
+    return filtered, high_rows
+
+
+def apply_filters(candidates: CandidateMatrix, params: PipelineParams) -> list[QueryMatch]:
+    """Apply the retrieval cutoffs and the score, score-gap and confidence stages.
+
+    Returns:
+        The high-confidence matches, candidates sorted by score with the best one marked
+    """
+    filtered, high_rows = _filter(candidates, params)
+    return filtered.to_matches(high_rows, mark_best=True)
+
+
+def serialize_matches(matches: list[QueryMatch]) -> list[dict[str, Any]]:
+    """Convert matches to the JSON shape stored in the task record."""
+    return [
+        MatchResult(
+            query=match.query,
+            matched_items=[
+                MatchedItem(
+                    description=c.description,
+                    distance=c.distance,
+                    score=c.score,
+                    value=c.value,
+                    matched=c.matched,
+                )
+                for c in match.candidates
+            ],
+        ).model_dump()
+        for match in matches
+    ]
+
+
+def refilter_task(task_id: str, **overrides: Any) -> tuple[PipelineParams, list[dict[str, Any]]]:
+    """Re-apply the filter stages of *task_id* with some parameters overridden.
+
+    Args:
+        task_id: Task whose stored scores are used
+        **overrides: PipelineParams fields to change; None values are ignored
+
+    Returns:
+        ``(params, results)`` — the effective parameters and serialised high-confidence results
+    """
+    params = replace(load_stored_params(task_id), **{k: v for k, v in overrides.items() if v is not None})
+    high_confidence = apply_filters(load_raw_matches(task_id), params)
+    return params, serialize_matches(high_confidence)
+
+
+def sweep_task(task_id: str, grid: dict[str, list[Any]]) -> list[dict[str, Any]]:
+    """Count high-confidence matches for every combination of the values in *grid*.
+
+    Args:
+        task_id: Task whose stored scores are used
+        grid: Mapping of PipelineParams field name to the values to try;
+            fields not in *grid* keep the task's original value
+
+    Returns:
+        One ``{"params": {...}, "matched_count": n}`` row per combination
+
+    Raises:
+        ValueError: On unknown fields or more than ``MAX_SWEEP_COMBINATIONS`` combinations
+    """
+    valid = {f.name for f in fields(PipelineParams)}
+    unknown = set(grid) - valid
+    if unknown:
+        raise ValueError(f"Parâmetros desconhecidos: {', '.join(sorted(unknown))}")
+    names = [name for name, values in grid.items() if values]
+    combinations = math.prod(len(grid[name]) for name in names)
+    if combinations > MAX_SWEEP_COMBINATIONS:
+        raise ValueError(
+            f"A grade tem {combinations} combinações; o máximo é {MAX_SWEEP_COMBINATIONS}"
+        )
+
+    base, candidates = _load_raw(task_id)
+    rows = []
+    for combination in itertools.product(*(grid[name] for name in names)):
+        params = replace(base, **dict(zip(names, combination)))
+        _, high_rows = _filter(candidates, params)
+        rows.append({"params": asdict(params), "matched_count": len(high_rows)})
+    return rows
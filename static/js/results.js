@@ -2,8 +2,18 @@
 
 let taskId = null;
 let pollingInterval = null;
-let resultsData = null;
+let resultsTotal = 0;
 const deselectedItems = new Set();
+// Version of the results the deselections refer to (indices change on a refilter)
+let resultsVersion = null;
+
+// Incremental loading: results are fetched page by page as the table is scrolled
+const PAGE_SIZE = 100;
+let nextCursor = null;
+let loadingPage = false;
+let resultsLoaded = false;
+let viewGeneration = 0;
+let sentinelObserver = null;
 
 // Extract task ID from URL parameters on page load
 document.addEventListener('DOMContentLoaded', () => {
@@ -58,8 +68,8 @@ async function pollTaskStatus() {
         const data = await response.json();
         updateUI(data);
         
-        // Stop polling if completed or failed
-        if (data.status === 'completed' || data.status === 'failed') {
+        // Stop polling if completed, failed or interrupted
+        if (data.status === 'completed' || data.status === 'failed' || data.status === 'interrupted') {
             stopPolling();
         }
         
@@ -72,7 +82,7 @@ async function pollTaskStatus() {
 
 // Update UI based on task status
 function updateUI(data) {
-    const { status, progress, total, percentage, results, error, stage, message } = data;
+    const { status, progress, total, percentage, results_count, error, stage, message, shards, resumable, cache_hit_ratio } = data;
     
     // Update progress bar
     const progressBar = document.getElementById('progressBar');
@@ -81,6 +91,8 @@ function updateUI(data) {
     const statusText = document.getElementById('statusText');
     const stageText = document.getElementById('stageText');
     const messageText = document.getElementById('messageText');
+    const shardsText = document.getElementById('shardsText');
+    const cacheText = document.getElementById('cacheText');
     
     if (progressBar && percentage !== undefined) {
         progressBar.style.width = `${percentage}%`;
@@ -99,7 +111,8 @@ function updateUI(data) {
         'pending': 'Aguardando início...',
         'running': 'Processando...',
         'completed': 'Concluído!',
-        'failed': 'Falhou'
+        'failed': 'Falhou',
+        'interrupted': 'Interrompida'
     };
     
     if (statusText) {
@@ -120,7 +133,12 @@ function updateUI(data) {
             'creating_db': 'Criando banco de dados vetorial...',
             'inserting_db': 'Inserindo documentos no banco vetorial...',
             'querying_db': 'Consultando documentos relevantes...',
-            'reranking': 'Reordenando resultados...'
+            'reranking': 'Reordenando resultados...',
+            // Last checkpoint of an interrupted task
+            'inputs': 'Checkpoint: dados de entrada',
+            'replacements': 'Checkpoint: documentos pré-processados',
+            'retrieval': 'Checkpoint: candidatos recuperados',
+            'rerank': 'Checkpoint: reordenação parcial'
         };
         stageText.textContent = stageMap[stage] || stage;
     }
@@ -129,26 +147,60 @@ function updateUI(data) {
     if (messageText) {
         messageText.textContent = message || '';
     }
+
+    // Catalog partitioning
+    if (shardsText) {
+        shardsText.textContent = shards > 1 ? `Catálogo dividido em ${shards} shards` : '';
+    }
+
+    // Queries answered by earlier tasks
+    if (cacheText) {
+        cacheText.textContent = cache_hit_ratio > 0
+            ? `${(cache_hit_ratio * 100).toFixed(1)}% das consultas reaproveitadas do cache`
+            : '';
+    }
     
     // Handle completion
-    if (status === 'completed' && results) {
-        displayResults(results);
+    if (status === 'completed' && !resultsLoaded) {
+        resultsLoaded = true;
+        resultsTotal = results_count || 0;
+        displayResults();
     }
     
     // Handle error
-    if (status === 'failed' && error) {
-        showError(error);
+    if ((status === 'failed' || status === 'interrupted') && (error || message)) {
+        showError(error || message);
+    }
+
+    // Failed and interrupted tasks with checkpoints can continue where they stopped
+    const resumeBtn = document.getElementById('resumeBtn');
+    if (resumeBtn) {
+        resumeBtn.classList.toggle('hidden', !(resumable && (status === 'failed' || status === 'interrupted')));
     }
 }
 
-// Display results in table
-function displayResults(results) {
-    resultsData = results;
-    
+// Continue the task from its last checkpoint
+async function resumeTask() {
+    try {
+        const response = await fetch(`/api/tasks/${taskId}/resume`, { method: 'POST' });
+        if (!response.ok) {
+            const body = await response.json().catch(() => ({}));
+            throw new Error(body.detail || `HTTP ${response.status}`);
+        }
+
+        document.getElementById('errorSection')?.classList.add('hidden');
+        document.getElementById('resumeBtn')?.classList.add('hidden');
+        document.getElementById('progressSection')?.classList.remove('hidden');
+        startPolling();
+    } catch (error) {
+        alert(`Erro ao retomar a tarefa: ${error.message}`);
+    }
+}
+
+// Show the results section and load the first page
+function displayResults() {
     const progressSection = document.getElementById('progressSection');
     const resultsSection = document.getElementById('resultsSection');
-    const resultsCount = document.getElementById('resultsCount');
-    const resultsBody = document.getElementById('resultsBody');
     
     // Hide progress, show results
     if (progressSection) {
@@ -158,64 +210,190 @@ function displayResults(results) {
         resultsSection.classList.remove('hidden');
     }
     
-    // Update count
-    if (resultsCount) {
-        resultsCount.textContent = `${results.length} correspondência(s) encontrada(s) com alta confiança`;
+    // Sort and filter controls reload the view from the first page
+    ['sortSelect', 'matchedSelect'].forEach(id => {
+        const el = document.getElementById(id);
+        if (el) el.addEventListener('change', resetResults);
+    });
+    ['minScoreInput', 'searchInput'].forEach(id => {
+        const el = document.getElementById(id);
+        if (el) el.addEventListener('input', debounce(resetResults, 300));
+    });
+    
+    // Load the next page when the end of the table comes into view
+    const sentinel = document.getElementById('resultsSentinel');
+    if (sentinel && 'IntersectionObserver' in window) {
+        sentinelObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage();
+            }
+        }, { rootMargin: '400px' });
+        sentinelObserver.observe(sentinel);
+    }
+    
+    // Setup download buttons
+    const downloadBtn = document.getElementById('downloadBtn');
+    if (downloadBtn) {
+        downloadBtn.onclick = () => downloadExport('csv');
+    }
+    const downloadXlsxBtn = document.getElementById('downloadXlsxBtn');
+    if (downloadXlsxBtn) {
+        downloadXlsxBtn.onclick = () => downloadExport('xlsx');
     }
     
-    // Populate table
+    resetResults();
+}
+
+// Current sort and filter as query parameters of the results endpoint
+function viewParams() {
+    const params = new URLSearchParams();
+    const sort = document.getElementById('sortSelect')?.value;
+    const matched = document.getElementById('matchedSelect')?.value;
+    const minScore = document.getElementById('minScoreInput')?.value;
+    const search = document.getElementById('searchInput')?.value.trim();
+    if (sort) params.set('sort', sort);
+    if (matched) params.set('matched', matched);
+    if (minScore) params.set('min_score', minScore);
+    if (search) params.set('q', search);
+    return params;
+}
+
+// Clear the table and load the first page of the current view
+function resetResults() {
+    viewGeneration++;
+    nextCursor = null;
+    loadingPage = false;
+    const resultsBody = document.getElementById('resultsBody');
     if (resultsBody) {
         resultsBody.innerHTML = '';
-        
-        results.forEach((result, index) => {
-            const row = document.createElement('tr');
-            row.className = 'border-b border-gray-300 hover:bg-gray-50';
-            
-            const { query, matched_items } = result;
-            const bestScore = matched_items.length > 0 ? matched_items[0].score : 0;
-            const bestValue = matched_items.length > 0 ? matched_items[0].value : 0;
-            
-            // Format matched items
-            const matchedItemsHTML = matched_items.slice(0, 3).map((item, itemIndex) => {
-                return `<div class="mb-1 cursor-pointer select-none" data-result-index="${index}" data-item-index="${itemIndex}" onclick="toggleItem(${index}, ${itemIndex})">
-                    <span class="font-medium text-gray-700">${escapeHtml(item.description)}</span>
-                    <span class="text-xs text-gray-500 ml-2">(score: ${item.score.toFixed(3)}, R$ ${item.value.toFixed(2)})</span>
-                </div>`;
-            }).join('');
-            
-            const moreItems = matched_items.length > 3 ? 
-                `<div class="text-xs text-gray-400">+${matched_items.length - 3} mais...</div>` : '';
-            
-            row.innerHTML = `
-                <td class="py-3 px-4 text-sm text-gray-600 border-r border-gray-200">${index + 1}</td>
-                <td class="py-3 px-4 text-sm text-gray-800 border-r border-gray-200">${escapeHtml(query)}</td>
-                <td class="py-3 px-4 text-sm border-r border-gray-200">
-                    ${matchedItemsHTML}
-                    ${moreItems}
-                </td>
-                <td class="py-3 px-4 text-sm text-center border-r border-gray-200">
-                    <span class="inline-block px-2 py-1 bg-green-100 text-green-800 rounded-full text-xs font-medium">
-                        ${bestScore.toFixed(3)}
-                    </span>
-                </td>
-                <td class="py-3 px-4 text-sm text-center">
-                    <span class="inline-block px-2 py-1 bg-blue-50 text-blue-800 rounded text-xs font-medium">
-                        R$ ${bestValue.toFixed(2)}
-                    </span>
-                </td>
-            `;
-            
-            resultsBody.appendChild(row);
-        });
     }
+    loadNextPage(true);
+}
+
+// Fetch one page of results and append it to the table
+async function loadNextPage(first = false) {
+    if (loadingPage || (!first && !nextCursor)) {
+        return;
+    }
+    loadingPage = true;
+    const generation = viewGeneration;
     
-    // Setup download button
-    const downloadBtn = document.getElementById('downloadBtn');
-    if (downloadBtn) {
-        downloadBtn.onclick = downloadCSV;
+    const params = viewParams();
+    params.set('limit', PAGE_SIZE);
+    if (nextCursor) params.set('cursor', nextCursor);
+    
+    try {
+        const response = await fetch(`/api/tasks/${taskId}/results?${params}`);
+        if (response.status === 409) {
+            // Results were replaced (e.g. re-filtered) while scrolling: start over
+            resetResults();
+            return;
+        }
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        }
+        const page = await response.json();
+        // A newer sort/filter was requested while this page was in flight
+        if (generation !== viewGeneration) {
+            return;
+        }
+        
+        // Results were replaced: deselections pointed at the old indices
+        if (page.version !== resultsVersion) {
+            deselectedItems.clear();
+            resultsVersion = page.version;
+        }
+        appendRows(page.items);
+        nextCursor = page.next_cursor;
+        updateResultsCount(page.total);
+        loadingPage = false;
+        
+        // Keep filling while the sentinel is still visible (short pages, tall screens)
+        if (nextCursor && isSentinelVisible()) {
+            loadNextPage();
+        }
+    } catch (error) {
+        console.error('Erro ao carregar resultados:', error);
+        showError(`Erro ao carregar resultados: ${error.message}`);
+    } finally {
+        if (generation === viewGeneration) {
+            loadingPage = false;
+        }
     }
 }
 
+function isSentinelVisible() {
+    const sentinel = document.getElementById('resultsSentinel');
+    if (!sentinel) return false;
+    return sentinel.getBoundingClientRect().top < window.innerHeight + 400;
+}
+
+function updateResultsCount(shown) {
+    const resultsCount = document.getElementById('resultsCount');
+    if (!resultsCount) return;
+    resultsCount.textContent = shown === resultsTotal
+        ? `${resultsTotal} correspondência(s) encontrada(s) com alta confiança`
+        : `${shown} de ${resultsTotal} correspondência(s) com alta confiança`;
+}
+
+// Append result rows to the table; rows are numbered by their pipeline index
+function appendRows(items) {
+    const resultsBody = document.getElementById('resultsBody');
+    if (!resultsBody) return;
+    
+    const fragment = document.createDocumentFragment();
+    items.forEach(result => {
+        const row = document.createElement('tr');
+        row.className = 'border-b border-gray-300 hover:bg-gray-50';
+        
+        const { index, query, matched_items } = result;
+        const bestScore = matched_items.length > 0 ? matched_items[0].score : 0;
+        const bestValue = matched_items.length > 0 ? matched_items[0].value : 0;
+        
+        // Format matched items
+        const matchedItemsHTML = matched_items.slice(0, 3).map((item, itemIndex) => {
+            const deselected = deselectedItems.has(`${index}-${itemIndex}`) ? ' line-through text-gray-400 opacity-50 bg-red-50' : '';
+            return `<div class="mb-1 cursor-pointer select-none${deselected}" data-result-index="${index}" data-item-index="${itemIndex}" onclick="toggleItem(${index}, ${itemIndex})">
+                <span class="font-medium text-gray-700">${escapeHtml(item.description)}</span>
+                <span class="text-xs text-gray-500 ml-2">(score: ${item.score.toFixed(3)}, R$ ${item.value.toFixed(2)})</span>
+            </div>`;
+        }).join('');
+        
+        const moreItems = matched_items.length > 3 ? 
+            `<div class="text-xs text-gray-400">+${matched_items.length - 3} mais...</div>` : '';
+        
+        row.innerHTML = `
+            <td class="py-3 px-4 text-sm text-gray-600 border-r border-gray-200">${index + 1}</td>
+            <td class="py-3 px-4 text-sm text-gray-800 border-r border-gray-200">${escapeHtml(query)}</td>
+            <td class="py-3 px-4 text-sm border-r border-gray-200">
+                ${matchedItemsHTML}
+                ${moreItems}
+            </td>
+            <td class="py-3 px-4 text-sm text-center border-r border-gray-200">
+                <span class="inline-block px-2 py-1 bg-green-100 text-green-800 rounded-full text-xs font-medium">
+                    ${bestScore.toFixed(3)}
+                </span>
+            </td>
+            <td class="py-3 px-4 text-sm text-center">
+                <span class="inline-block px-2 py-1 bg-blue-50 text-blue-800 rounded text-xs font-medium">
+                    R$ ${bestValue.toFixed(2)}
+                </span>
+            </td>
+        `;
+        
+        fragment.appendChild(row);
+    });
+    resultsBody.appendChild(fragment);
+}
+
+function debounce(fn, wait) {
+    let timer = null;
+    return (...args) => {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn(...args), wait);
+    };
+}
+
 // Show error message
 function showError(message) {
     const progressSection = document.getElementById('progressSection');
@@ -233,44 +411,53 @@ function showError(message) {
     }
 }
 
-// Download results as CSV
-function downloadCSV() {
-    if (!resultsData || resultsData.length === 0) {
+// Deselected candidates as {resultIndex: [itemIndex, ...]}
+function compactDeselections() {
+    const compact = {};
+    deselectedItems.forEach(key => {
+        const [resultIndex, itemIndex] = key.split('-').map(Number);
+        (compact[resultIndex] ||= []).push(itemIndex);
+    });
+    return compact;
+}
+
+// Download the export built on the server (best non-deselected match per query)
+async function downloadExport(format) {
+    if (resultsTotal === 0) {
         alert('Nenhum resultado para baixar');
         return;
     }
     
-    // Build CSV content with tab separators
-    let csv = 'Consulta\tCorrespondência\tScore\tValor Médio (R$)\n';
-    
-    resultsData.forEach((result, resultIndex) => {
-        const { query, matched_items } = result;
-        const visibleItems = matched_items.slice(0, 3);
-        const bestItem = visibleItems.find((_, itemIndex) => !deselectedItems.has(`${resultIndex}-${itemIndex}`));
-        if (bestItem) {
-            console.log('Adding to CSV:', query, bestItem.description, bestItem.score, bestItem.value);
-            const row = [
-                query,
-                bestItem.description,
-                bestItem.score.toFixed(4),
-                bestItem.value.toFixed(2)
-            ].join('\t');
-            csv += row + '\n';
+    try {
+        const response = await fetch(`/api/tasks/${taskId}/export`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ format, deselected: compactDeselections(), results_version: resultsVersion })
+        });
+        if (response.status === 409) {
+            const { detail } = await response.json();
+            alert(detail);
+            resetResults();
+            return;
         }
-    });
-    
-    // Create download link
-    const blob = new Blob([csv], { type: 'text/csv;charset=utf-8;' });
-    const link = document.createElement('a');
-    const url = URL.createObjectURL(blob);
-    
-    link.setAttribute('href', url);
-    link.setAttribute('download', `resultados_${new Date().getTime()}.csv`);
-    link.style.visibility = 'hidden';
-    
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        }
+        const blob = await response.blob();
+        const link = document.createElement('a');
+        const url = URL.createObjectURL(blob);
+        
+        link.setAttribute('href', url);
+        link.setAttribute('download', `resultados_${new Date().getTime()}.${format}`);
+        link.style.visibility = 'hidden';
+        
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+        URL.revokeObjectURL(url);
+    } catch (error) {
+        alert(`Erro ao baixar resultados: ${error.message}`);
+    }
 }
 
 // Toggle selection state of a matched item
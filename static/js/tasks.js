@@ -59,11 +59,12 @@ function renderTasks(tasks) {
 
     tasksBody.innerHTML = '';
     tasks.forEach(task => {
-        const { task_id, file_name, status, progress, total, percentage } = task;
+        const { task_id, file_name, status, progress, total, percentage, shards } = task;
         const statusLabel = STATUS_MAP[status] || status;
         const statusColor = STATUS_COLORS[status] || 'bg-gray-100 text-gray-700';
         const pct = typeof percentage === 'number' ? percentage.toFixed(1) : '0.0';
-        const progressLabel = `${progress ?? 0} / ${total ?? 0} (${pct}%)`;
+        const shardsLabel = shards > 1 ? ` · ${shards} shards` : '';
+        const progressLabel = `${progress ?? 0} / ${total ?? 0} (${pct}%)${shardsLabel}`;
 
         const tr = document.createElement('tr');
         tr.className = 'border-b border-gray-200 hover:bg-gray-50';
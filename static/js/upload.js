@@ -8,6 +8,41 @@ const fileInput = document.getElementById('fileInput');
 const columnSelection = document.getElementById('columnSelection');
 const submitBtn = document.getElementById('submitBtn');
 const statusDiv = document.getElementById('status');
+const indexingSection = document.getElementById('indexingSection');
+let indexingInterval = null;
+
+// Append mode: pick the stored catalog the extract is added to
+const appendModeInput = document.getElementById('appendMode');
+const catalogNameGroup = document.getElementById('catalogNameGroup');
+const catalogNameInput = document.getElementById('catalogName');
+
+appendModeInput.addEventListener('change', () => {
+    catalogNameGroup.classList.toggle('hidden', !appendModeInput.checked);
+    if (appendModeInput.checked) {
+        loadCatalogOptions();
+    }
+});
+
+async function loadCatalogOptions() {
+    try {
+        const response = await fetch('/api/catalogs');
+        const catalogs = await response.json();
+        const options = document.getElementById('catalogOptions');
+        options.innerHTML = '';
+        catalogs.forEach(({ catalog, descriptions }) => {
+            const option = document.createElement('option');
+            option.value = catalog;
+            option.label = `${descriptions} descrições`;
+            options.appendChild(option);
+        });
+        // Default to the most recently updated catalog
+        if (!catalogNameInput.value && catalogs.length > 0) {
+            catalogNameInput.value = catalogs[0].catalog;
+        }
+    } catch (error) {
+        console.error('Erro ao carregar catálogos:', error);
+    }
+}
 
 // Click to upload
 uploadArea.addEventListener('click', () => {
@@ -57,64 +92,87 @@ function processFile(file) {
 
     currentFileName = file.name;
 
+    NProgress.set(0.4);
+    parseOnServer(file)
+        .catch(error => {
+            // The server could not read it (or is unreachable): parse it here instead
+            console.warn('Leitura no servidor falhou, lendo no navegador:', error);
+            return parseInBrowser(file);
+        })
+        .then(({ sheetName, rows }) => showSheet(sheetName, rows))
+        .catch(error => {
+            showStatus('Erro ao processar arquivo: ' + error.message, 'error');
+            console.error('Error processing file:', error);
+        })
+        .finally(() => NProgress.done());
+}
 
-    const reader = new FileReader();
-    reader.onload = (e) => {
-        try {
-            const data = new Uint8Array(e.target.result);
-            const workbook = XLSX.read(data, { type: 'array' });
-
-            // Get the first sheet
-            const firstSheetName = workbook.SheetNames[0];
-            const worksheet = workbook.Sheets[firstSheetName];
-
-            // Store sheet name for display
-            currentSheetName = firstSheetName;
-
-            // Convert to JSON
-            const jsonData = XLSX.utils.sheet_to_json(worksheet, { header: 1 });
+// Parse the spreadsheet on the server, which caches parsed files by content
+async function parseOnServer(file) {
+    const formData = new FormData();
+    formData.append('file', file);
+    const response = await fetch('/api/upload-excel', { method: 'POST', body: formData });
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${await response.text()}`);
+    }
+    return response.json();
+}
 
-            if (jsonData.length === 0) {
-                showStatus('Erro: O arquivo está vazio', 'error');
-                return;
+// Parse the first sheet with SheetJS
+function parseInBrowser(file) {
+    return new Promise((resolve, reject) => {
+        const reader = new FileReader();
+        reader.onload = (e) => {
+            try {
+                const data = new Uint8Array(e.target.result);
+                const workbook = XLSX.read(data, { type: 'array' });
+
+                // Get the first sheet
+                const sheetName = workbook.SheetNames[0];
+                const worksheet = workbook.Sheets[sheetName];
+
+                // Convert to JSON
+                resolve({ sheetName, rows: XLSX.utils.sheet_to_json(worksheet, { header: 1 }) });
+            } catch (error) {
+                reject(error);
             }
+        };
+        reader.onerror = () => reject(new Error('Erro ao ler o arquivo'));
+        reader.readAsArrayBuffer(file);
+    });
+}
 
-            currentFullData = jsonData;
-            currentFileData = jsonData;
-
-            // Get column names (first row by default)
-            const skipRows = 0;
-            const columns = jsonData[skipRows];
-            console.log('Columns:', columns);
-
-            // Update file info
-            document.getElementById('fileName').textContent = currentFileName;
-            document.getElementById('sheetName').textContent = currentSheetName || 'Sheet1';
-            document.getElementById('rowCount').textContent = jsonData.length - 1 - skipRows; // Exclude header and skipped rows
-            document.getElementById('colCount').textContent = columns.length;
-            document.getElementById('skipRows').value = skipRows;
+// Show the parsed sheet and let the user pick its columns
+function showSheet(sheetName, jsonData) {
+    if (jsonData.length === 0) {
+        showStatus('Erro: O arquivo está vazio', 'error');
+        return;
+    }
 
-            // Populate column selectors
-            populateColumnSelectors(columns);
+    // Store sheet name for display
+    currentSheetName = sheetName;
+    currentFullData = jsonData;
+    currentFileData = jsonData;
 
-            // Show column selection section
-            columnSelection.classList.remove('hidden');
+    // Get column names (first row by default)
+    const skipRows = 0;
+    const columns = jsonData[skipRows];
+    console.log('Columns:', columns);
 
-            showStatus('Arquivo carregado com sucesso! Agora selecione as colunas.', 'success');
+    // Update file info
+    document.getElementById('fileName').textContent = currentFileName;
+    document.getElementById('sheetName').textContent = currentSheetName || 'Sheet1';
+    document.getElementById('rowCount').textContent = jsonData.length - 1 - skipRows; // Exclude header and skipped rows
+    document.getElementById('colCount').textContent = columns.length;
+    document.getElementById('skipRows').value = skipRows;
 
-        } catch (error) {
-            showStatus('Erro ao processar arquivo: ' + error.message, 'error');
-            console.error('Error processing file:', error);
-        }
-    };
+    // Populate column selectors
+    populateColumnSelectors(columns);
 
-    reader.onerror = () => {
-        showStatus('Erro ao ler o arquivo', 'error');
-    };
+    // Show column selection section
+    columnSelection.classList.remove('hidden');
 
-    NProgress.set(0.4);
-    reader.readAsArrayBuffer(file);
-    NProgress.done();
+    showStatus('Arquivo carregado com sucesso! Agora selecione as colunas.', 'success');
 }
 
 // Populate column selectors with available columns
@@ -215,6 +273,8 @@ submitBtn.addEventListener('click', async () => {
         skipRows: skipRows,
         filterText: filterText || null,
         isRegex: isRegex,
+        appendMode: appendModeInput.checked,
+        catalogName: appendModeInput.checked ? (catalogNameInput.value.trim() || null) : null,
         columns: {
             description: headers[descCol],
             value: headers[valCol],
@@ -246,13 +306,21 @@ submitBtn.addEventListener('click', async () => {
 
         if (response.ok) {
             const result = await response.json();
-            showStatus('Dados processados com sucesso!', 'success');
+            const { distinct_descriptions, output_rows, shrink_ratio } = result.dedup;
+            const dedupText = output_rows < distinct_descriptions
+                ? ` ${distinct_descriptions} descrições agrupadas em ${output_rows} produtos (${(shrink_ratio * 100).toFixed(1)}% a menos).`
+                : '';
+            const { catalog, new_descriptions, updated_descriptions, duplicate } = result.catalog;
+            const appendText = !appendModeInput.checked
+                ? ''
+                : duplicate
+                    ? ` Catálogo "${catalog}": este extrato já havia sido incorporado e foi ignorado.`
+                    : ` Catálogo "${catalog}": ${new_descriptions} descrições novas, ${updated_descriptions} atualizadas.`;
+            showStatus(`Dados processados com sucesso!${dedupText}${appendText} O catálogo está sendo indexado.`, 'success');
             console.log('Resultado:', result);
 
-            // Redirect to results page
-            setTimeout(() => {
-                window.location.href = `/results`;
-            }, 2000);
+            // The catalog is indexed in the background; results can be requested at any time
+            startIndexingPolling();
         } else {
             const error = await response.text();
             showStatus('Erro ao processar: ' + error, 'error');
@@ -265,6 +333,62 @@ submitBtn.addEventListener('click', async () => {
     }
 });
 
+// Catalog indexing progress
+const INDEXING_STAGES = {
+    initializing: 'Inicializando...',
+    llm_replacements: 'Obtendo replacements do LLM...',
+    preprocessing: 'Pré-processando documentos...',
+    creating_db: 'Criando banco de dados vetorial...',
+    inserting_db: 'Inserindo documentos no banco vetorial...',
+    indexed: 'Catálogo indexado',
+};
+
+document.getElementById('resultsBtn').addEventListener('click', () => {
+    stopIndexingPolling();
+    window.location.href = '/results';
+});
+
+function startIndexingPolling() {
+    indexingSection.classList.remove('hidden');
+    stopIndexingPolling();
+    pollIndexingStatus();
+    indexingInterval = setInterval(pollIndexingStatus, 1000);
+}
+
+function stopIndexingPolling() {
+    if (indexingInterval) {
+        clearInterval(indexingInterval);
+        indexingInterval = null;
+    }
+}
+
+async function pollIndexingStatus() {
+    try {
+        const response = await fetch('/api/indexing-status');
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        updateIndexingUI(await response.json());
+    } catch (error) {
+        console.error('Erro ao buscar status da indexação:', error);
+        stopIndexingPolling();
+    }
+}
+
+function updateIndexingUI(job) {
+    const { status, stage, message, error, indexed, total_documents } = job;
+    const pct = status === 'completed' ? 100 : (total_documents ? (indexed / total_documents) * 100 : 0);
+
+    document.getElementById('indexingBar').style.width = `${pct}%`;
+    document.getElementById('indexingPercentage').textContent = `${pct.toFixed(1)}%`;
+    document.getElementById('indexingStage').textContent =
+        status === 'failed' ? 'Falha na indexação' : (INDEXING_STAGES[stage] || stage);
+    document.getElementById('indexingMessage').textContent =
+        status === 'failed' ? `${error} — a indexação será refeita ao ver os resultados.` : (message || '');
+
+    if (status === 'completed' || status === 'failed') {
+        stopIndexingPolling();
+    }
+}
+
 // Show status message
 function showStatus(message, type) {
     statusDiv.textContent = message;
@@ -286,6 +410,8 @@ function resetForm() {
     fileInput.value = '';
     columnSelection.classList.add('hidden');
     statusDiv.classList.add('hidden');
+    indexingSection.classList.add('hidden');
+    stopIndexingPolling();
     submitBtn.disabled = true;
 
     // Reset selectors
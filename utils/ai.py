@@ -1,5 +1,5 @@
 from collections.abc import Generator
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Hashable
 from pydantic import BaseModel
 
@@ -30,10 +30,12 @@ class PesquisaPrompt(BasePrompt):
         matched: bool = False
 
     def build(self) -> str:
-        items_str = "\n".join(item.description for item in self.items)
+        items_str = "\n".join(
+            f"[{item_id}] {item.description}" for item_id, item in enumerate(self.items)
+        )
         return f"""
     Preciso saber quais dos seguintes itens correspondem a este "{self.item_description}".
-    Dê-me uma lista de até {self.limit} melhores candidatos junto com o seu rank.
+    Dê-me uma lista de até {self.limit} melhores candidatos junto com o seu rank, usando o número entre colchetes como id.
     Se as marcas dos itens, modelos, tamanhos, ou outras características não corresponderem, desconsidere-os. Seja crítico, se não houver correspondência retorne uma lista vazia.
     Aqui estão os itens para escolher:
 
@@ -51,32 +53,166 @@ class Candidates(BaseModel):
     candidates: list[Candidate] = []
 
 
+class QueryCandidates(BaseModel):
+    query_id: int
+    candidates: list[Candidate] = []
+
+
+class PackedCandidates(BaseModel):
+    results: list[QueryCandidates] = []
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting prompts."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class PackedPesquisaPrompt(BasePrompt):
+    """Several PesquisaPrompts answered by a single LLM request.
+
+    Each packed query is addressed by its position in ``prompts`` (the
+    ``query_id`` in the response) and each of its items by its position in
+    that query's item list (the candidate ``id``).
+    """
+
+    prompts: list[PesquisaPrompt]
+
+    PromptResult = PackedCandidates
+
+    def build(self) -> str:
+        limit = max((p.limit for p in self.prompts), default=3)
+        sections = []
+        for query_id, prompt in enumerate(self.prompts):
+            items_str = "\n".join(
+                f"      [{item_id}] {item.description}" for item_id, item in enumerate(prompt.items)
+            )
+            sections.append(f'    Consulta {query_id}: "{prompt.item_description}"\n{items_str}')
+        queries_str = "\n\n".join(sections)
+        return f"""
+    Para cada consulta abaixo, preciso saber quais dos itens listados correspondem a ela.
+    Para cada consulta, dê-me uma lista de até {limit} melhores candidatos junto com o seu rank, usando o número entre colchetes como id.
+    Se as marcas dos itens, modelos, tamanhos, ou outras características não corresponderem, desconsidere-os. Seja crítico, se não houver correspondência retorne uma lista vazia.
+    Responda com um resultado por consulta, usando o número da consulta como query_id.
+
+{queries_str}
+    """
+
+
+def pack_prompts(prompts: list[PesquisaPrompt], token_budget: int) -> list[PackedPesquisaPrompt]:
+    """Greedily group *prompts* so that each packed prompt stays under *token_budget*.
+
+    A prompt that alone exceeds the budget still gets a pack of its own.
+    """
+    packs: list[PackedPesquisaPrompt] = []
+    current: list[PesquisaPrompt] = []
+    current_tokens = 0
+    for prompt in prompts:
+        tokens = estimate_tokens(prompt.build())
+        if current and current_tokens + tokens > token_budget:
+            packs.append(PackedPesquisaPrompt(id=len(packs), prompts=current))
+            current, current_tokens = [], 0
+        current.append(prompt)
+        current_tokens += tokens
+    if current:
+        packs.append(PackedPesquisaPrompt(id=len(packs), prompts=current))
+    return packs
+
+
 @dataclass
 class PromptResult:
     prompt: PesquisaPrompt
     candidates: list["Candidate"]
 
 
+@dataclass
+class QueryResult:
+    """LLM-confirmed items for one query, streamed by ``get_candidates``."""
+
+    index: int
+    query: str
+    items: list[PesquisaPrompt.Item]
+
+
+@dataclass
+class ResolutionStats:
+    """Counts of LLM answers that could / could not be mapped back to a candidate."""
+
+    answers: int = 0
+    resolved: int = 0
+    unresolved: int = 0
+    unresolved_examples: list[str] = field(default_factory=list)
+
+    def record_unresolved(self, prompt_id: Hashable, candidate: Candidate) -> None:
+        self.unresolved += 1
+        if len(self.unresolved_examples) < 20:
+            self.unresolved_examples.append(f"{prompt_id}: [{candidate.id}] {candidate.description}")
+
+
+def resolve_candidates(
+    prompt: PesquisaPrompt, candidates: list[Candidate], stats: ResolutionStats | None = None
+) -> list[PesquisaPrompt.Item]:
+    """Map LLM answers back to *prompt*'s items by candidate ID.
+
+    The ID is the item's position in ``prompt.items`` (as numbered by
+    ``build``), so each lookup is O(1). Out-of-range and repeated IDs are
+    dropped and counted as unresolved in *stats*.
+    """
+    resolved: list[PesquisaPrompt.Item] = []
+    seen: set[int] = set()
+    for candidate in candidates:
+        if stats is not None:
+            stats.answers += 1
+        if 0 <= candidate.id < len(prompt.items) and candidate.id not in seen:
+            seen.add(candidate.id)
+            resolved.append(prompt.items[candidate.id])
+            if stats is not None:
+                stats.resolved += 1
+        elif stats is not None:
+            stats.record_unresolved(prompt.id, candidate)
+    return resolved
+
+
 def get_candidates(
-    queries: list[str], results: list[list["PesquisaPrompt.Item"]], provider: str
-) -> Generator[tuple[list[str], list[list["PesquisaPrompt.Item"]]], None, None]:
+    queries: list[str],
+    results: list[list["PesquisaPrompt.Item"]],
+    provider: str,
+    stats: ResolutionStats | None = None,
+    **options,
+) -> Generator[QueryResult, None, None]:
     """Fetch candidates from the specified provider.
 
+    Results are streamed one query at a time as soon as the provider has
+    them, so they do not necessarily arrive in input order; use
+    ``QueryResult.index`` to place them.
+
     Args:
       queries: List of query strings
       results: List of lists of PesquisaPrompt.Item objects
       provider: Provider name ('gemini' or 'ollama')
+      stats: Optional ResolutionStats updated with resolved/unresolved answer counts
+      **options: Provider-specific options (e.g. ``concurrency`` and
+        ``pack_token_budget`` for Ollama)
 
     Yields:
-      Tuples of (queries, results) representing processed queries and their filtered results
+      A QueryResult per query with the items the LLM confirmed
     """
-    if provider == "gemini":
-        from .models.gemini import get_candidates_gemini
+    prompts = [
+        PesquisaPrompt(id=i, item_description=query, items=result_items)
+        for i, (query, result_items) in enumerate(zip(queries, results))
+    ]
 
-        yield from get_candidates_gemini(queries, results)
+    if provider == "gemini":
+        from .models.gemini import stream_prompt_results_gemini as stream
     elif provider == "ollama":
-        from .models.ollama import get_candidates_ollama
-
-        yield from get_candidates_ollama(queries, results)
+        from .models.ollama import stream_prompt_results_ollama as stream
     else:
         raise ValueError(f"Unknown provider: {provider}")
+
+    for prompt_result in stream(prompts, **options):
+        index = prompt_result.prompt.id
+        yield QueryResult(
+            index=index,
+            query=queries[index],
+            items=resolve_candidates(prompts[index], prompt_result.candidates, stats),
+        )
@@ -0,0 +1,275 @@
+"""Retail attributes extracted from product descriptions.
+
+``extract_unit`` reads a size such as ``500G`` or ``1,5 L`` into a
+canonical unit. ``AttributeExtractor`` applies configurable rules (tire
+sizes, volumes, weights, brand tokens, ...) and ``AttributeIndex`` caches
+those attributes for every document of a catalog, used to prune
+candidates whose hard attributes contradict the query before reranking.
+
+Rules are read from ``attribute_rules.json`` in the output folder (or
+``attribute_rules_path`` in ``config.json``); ``DEFAULT_RULES`` applies
+when there is none. Three kinds of rule exist::
+
+    {"name": "tire_size", "pattern": "(\\d{3})/(\\d{2})R(\\d{2})", "format": "{0}/{1}R{2}"}
+    {"name": "volume", "unit_family": "volume"}
+    {"name": "brand", "tokens": ["PIRELLI", "MICHELIN"]}
+
+Patterns are matched case-insensitively; ``format`` builds the canonical
+value from the groups. ``"hard": false`` extracts an attribute without
+pruning on it.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from utils.config import OUTPUT_PATH
+from utils.dedup import normalize_description
+
+# Spelling -> (canonical unit, factor to the canonical unit, unit family)
+_UNITS: dict[str, tuple[str, float, str]] = {
+    "mg": ("g", 0.001, "mass"),
+    "g": ("g", 1.0, "mass"),
+    "gr": ("g", 1.0, "mass"),
+    "grs": ("g", 1.0, "mass"),
+    "kg": ("g", 1000.0, "mass"),
+    "ml": ("ml", 1.0, "volume"),
+    "l": ("ml", 1000.0, "volume"),
+    "lt": ("ml", 1000.0, "volume"),
+    "lts": ("ml", 1000.0, "volume"),
+    "litro": ("ml", 1000.0, "volume"),
+    "litros": ("ml", 1000.0, "volume"),
+    "mm": ("m", 0.001, "length"),
+    "cm": ("m", 0.01, "length"),
+    "m": ("m", 1.0, "length"),
+    "mt": ("m", 1.0, "length"),
+    "mts": ("m", 1.0, "length"),
+    "un": ("un", 1.0, "count"),
+    "und": ("un", 1.0, "count"),
+    "unid": ("un", 1.0, "count"),
+    "pc": ("un", 1.0, "count"),
+    "pcs": ("un", 1.0, "count"),
+}
+
+# A number glued to or followed by a unit: "500G", "1,5 L", "2.5kg"; longest spellings first
+_QUANTITY = re.compile(
+    r"(?<![\w.,])(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(_UNITS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class UnitInfo:
+    """Size of a product in a canonical unit.
+
+    Attributes:
+        unit: Canonical unit (``g``, ``ml``, ``m`` or ``un``)
+        size: Size in *unit* (``1,5 L`` -> 1500.0)
+        family: ``mass``, ``volume``, ``length`` or ``count``
+    """
+
+    unit: str
+    size: float
+    family: str
+
+
+def extract_units(description: str) -> list[UnitInfo]:
+    """Every ``<number> <unit>`` in *description*, converted to its canonical unit."""
+    units = []
+    for number, spelling in _QUANTITY.findall(description):
+        unit, factor, family = _UNITS[spelling.lower()]
+        units.append(UnitInfo(unit=unit, size=float(number.replace(",", ".")) * factor, family=family))
+    return units
+
+
+def extract_unit(description: str) -> UnitInfo | None:
+    """First ``<number> <unit>`` in *description*, converted to its canonical unit (None if absent)."""
+    units = extract_units(description)
+    return units[0] if units else None
+
+
+def unit_metadata(description: str) -> dict[str, str | float]:
+    """Vector-store metadata of a description's unit.
+
+    ``unit_family`` is always present ("" when no unit was found) so a
+    unit-family filter can keep unit-less documents with ``$in``.
+    """
+    info = extract_unit(description)
+    if info is None:
+        return {"unit_family": ""}
+    return {"unit": info.unit, "size": info.size, "unit_family": info.family}
+
+
+# --- Rule-based attribute extraction ------------------------------------------
+
+DEFAULT_ATTRIBUTE_RULES_PATH = OUTPUT_PATH / "attribute_rules.json"
+
+DEFAULT_RULES: list[dict[str, Any]] = [
+    # 175/70R13, 175/70 R13, 205/55ZR16
+    {"name": "tire_size", "pattern": r"\b(\d{3})\s*/\s*(\d{2})\s*Z?R\s*(\d{2})\b", "format": "{0}/{1}R{2}"},
+    {"name": "volume", "unit_family": "volume"},
+    {"name": "weight", "unit_family": "mass"},
+    {
+        "name": "brand",
+        "tokens": [
+            "BRIDGESTONE", "CONTINENTAL", "DUNLOP", "FIRESTONE", "GOODYEAR",
+            "HANKOOK", "KUMHO", "MICHELIN", "PIRELLI", "YOKOHAMA",
+        ],
+    },
+]
+
+Attributes = dict[str, frozenset[str]]
+
+
+@dataclass
+class AttributeRule:
+    """One attribute and how to read it (see the module docstring for the JSON form)."""
+
+    name: str
+    pattern: str | None = None
+    format: str | None = None
+    unit_family: str | None = None
+    tokens: list[str] = field(default_factory=list)
+    hard: bool = True
+
+    def __post_init__(self) -> None:
+        if sum(x is not None and x != [] for x in (self.pattern, self.unit_family, self.tokens)) != 1:
+            raise ValueError(f"Regra '{self.name}': defina exatamente um de pattern, unit_family ou tokens")
+        self._regex = re.compile(self.pattern, re.IGNORECASE) if self.pattern else None
+        self._tokens = {normalize_description(token) for token in self.tokens}
+
+    def extract(self, description: str, words: set[str]) -> set[str]:
+        if self._regex is not None:
+            values = set()
+            for match in self._regex.finditer(description):
+                groups = [g.upper() for g in match.groups() if g is not None] or [match.group(0).upper()]
+                values.add(self.format.format(*groups) if self.format else " ".join(groups))
+            return values
+        if self.unit_family is not None:
+            return {f"{u.size:g}{u.unit}" for u in extract_units(description) if u.family == self.unit_family}
+        return self._tokens & words
+
+
+class AttributeExtractor:
+    """
+    Deterministic extraction of retail attributes with a list of rules.
+
+    Args:
+        rules: Rules as dicts (the JSON form) or AttributeRule objects
+    """
+
+    def __init__(self, rules: Iterable[dict[str, Any] | AttributeRule] = DEFAULT_RULES):
+        self.rules = [rule if isinstance(rule, AttributeRule) else AttributeRule(**rule) for rule in rules]
+        self.hard = frozenset(rule.name for rule in self.rules if rule.hard)
+
+    @classmethod
+    def from_file(cls, path: Path) -> "AttributeExtractor":
+        """Load rules from a JSON file: ``{"rules": [...]}`` or a bare list."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["rules"] if isinstance(data, dict) else data)
+
+    def extract(self, description: str) -> Attributes:
+        """Attribute name -> canonical values found in *description* (attributes not found are absent)."""
+        words = set(normalize_description(description).split())
+        attributes = {}
+        for rule in self.rules:
+            values = rule.extract(description, words)
+            if values:
+                attributes[rule.name] = frozenset(values)
+        return attributes
+
+    def conflicts(self, query: Attributes, document: Attributes) -> bool:
+        """True if some hard attribute is present on both sides with no value in common."""
+        return any(
+            name in document and not (values & document[name]) for name, values in query.items() if name in self.hard
+        )
+
+
+_extractors: dict[str, AttributeExtractor] = {}
+_extractors_lock = threading.Lock()
+
+
+def get_attribute_extractor(rules_path: str = "") -> AttributeExtractor:
+    """Extractor for *rules_path*, the default rules file, or ``DEFAULT_RULES`` (cached per file)."""
+    path = Path(rules_path) if rules_path else DEFAULT_ATTRIBUTE_RULES_PATH
+    key = f"{path}:{path.stat().st_mtime if path.exists() else 0}"
+    with _extractors_lock:
+        if key not in _extractors:
+            if path.exists():
+                _extractors[key] = AttributeExtractor.from_file(path)
+            elif rules_path:
+                raise FileNotFoundError(f"Arquivo de regras de atributos não encontrado: {path}")
+            else:
+                _extractors[key] = AttributeExtractor()
+        return _extractors[key]
+
+
+class AttributeIndex:
+    """
+    Attributes of every catalog document, extracted once.
+
+    A document conflicts with a query's hard attribute when it has the
+    attribute but none of the query's values (see
+    ``AttributeExtractor.conflicts``); only the candidates of each query
+    are checked.
+
+    Args:
+        extractor: Extractor used for the catalog and the queries
+    """
+
+    def __init__(self, extractor: AttributeExtractor):
+        self.extractor = extractor
+        # Document text -> its attributes
+        self.attributes: dict[str, Attributes] = {}
+        # Tasks sharing a catalog may extend the index concurrently
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, documents: Iterable[str], extractor: AttributeExtractor) -> "AttributeIndex":
+        index = cls(extractor)
+        index.add(documents)
+        return index
+
+    def add(self, documents: Iterable[str]) -> None:
+        missing = {document for document in documents if document not in self.attributes}
+        extracted = {document: self.extractor.extract(document) for document in missing}
+        with self._lock:
+            self.attributes.update(extracted)
+
+    def __len__(self) -> int:
+        return len(self.attributes)
+
+    def conflict_mask(self, queries: list[str], documents: list[str], doc_index: np.ndarray) -> np.ndarray:
+        """Cells of a ``[queries, k]`` candidate grid whose document conflicts with its query.
+
+        Args:
+            queries: Query texts, one per row
+            documents: Candidate texts indexed by *doc_index*
+            doc_index: ``[Q, k]`` index into *documents* (-1 = padding)
+        """
+        # Candidates missing from the catalog index (e.g. stored under an older text) are indexed now
+        self.add(documents[d] for d in np.unique(doc_index[doc_index >= 0]).tolist())
+        conflicts = np.zeros(doc_index.shape, dtype=bool)
+        hard_of: dict[str, Attributes] = {}
+
+        for q, query in enumerate(queries):
+            if query not in hard_of:
+                hard_of[query] = {
+                    name: values for name, values in self.extractor.extract(query).items() if name in self.extractor.hard
+                }
+            hard = hard_of[query]
+            if not hard:
+                continue
+            for j, d in enumerate(doc_index[q].tolist()):
+                if d >= 0 and self.extractor.conflicts(hard, self.attributes[documents[d]]):
+                    conflicts[q, j] = True
+        return conflicts
@@ -0,0 +1,136 @@
+"""
+Persistent registry of Gemini batch jobs.
+
+Every batch submission is written to disk together with the prompts it was
+built from, so a job that is still running when the app stops can be picked
+up again on the next start instead of being paid for twice.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from utils.config import OUTPUT_PATH
+
+DEFAULT_BATCH_DIR = OUTPUT_PATH / "gemini_batches"
+
+COMPLETED_STATES = frozenset(
+    {
+        "JOB_STATE_SUCCEEDED",
+        "JOB_STATE_FAILED",
+        "JOB_STATE_CANCELLED",
+        "JOB_STATE_EXPIRED",
+    }
+)
+
+
+@dataclass
+class BatchRecord:
+    """A submitted batch job and everything needed to interpret its responses.
+
+    ``prompts`` keeps the serialised prompts in submission order, which is
+    also the order of the inline responses returned by the API. ``results``
+    stays ``None`` until the job finishes; afterwards it holds one list of
+    candidate dicts per prompt.
+    """
+
+    name: str
+    fingerprint: str
+    model: str
+    prompts: list[dict[str, Any]]
+    state: str = "JOB_STATE_PENDING"
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    results: list[list[dict[str, Any]]] | None = None
+
+    @property
+    def prompt_ids(self) -> list[Any]:
+        """Prompt IDs in submission order."""
+        return [p["id"] for p in self.prompts]
+
+    @property
+    def is_completed(self) -> bool:
+        """True when the remote job reached a terminal state."""
+        return self.state in COMPLETED_STATES
+
+
+class BatchStore:
+    """
+    Stores one JSON file per batch job.
+
+    Args:
+        directory: Directory where batch records are kept
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _get_path(self, name: str) -> Path:
+        # Job names look like "batches/abc123"
+        return self.directory / f"{name.replace('/', '_')}.json"
+
+    def save(self, record: BatchRecord) -> None:
+        """Write *record* atomically, replacing any previous version."""
+        record.updated_at = time.time()
+        path = self._get_path(record.name)
+        with self._lock:
+            tmp_fd, tmp_path = tempfile.mkstemp(
+                dir=self.directory, suffix=".tmp", prefix="batch_"
+            )
+            try:
+                with os.fdopen(tmp_fd, "w", encoding="utf-8") as f:
+                    json.dump(asdict(record), f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except Exception:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+
+    def load(self, name: str) -> BatchRecord | None:
+        """Return the record for job *name*, or None if unknown."""
+        return self._read(self._get_path(name))
+
+    def delete(self, name: str) -> None:
+        """Forget job *name*."""
+        with self._lock:
+            self._get_path(name).unlink(missing_ok=True)
+
+    def all(self) -> list[BatchRecord]:
+        """Return every stored record, oldest first."""
+        records = [self._read(path) for path in self.directory.glob("*.json")]
+        return sorted(
+            (r for r in records if r is not None), key=lambda r: r.created_at
+        )
+
+    def pending(self) -> list[BatchRecord]:
+        """Return records whose remote job has not finished yet."""
+        return [r for r in self.all() if not r.is_completed]
+
+    def find_by_fingerprint(self, fingerprint: str) -> BatchRecord | None:
+        """Return the newest record submitted for the same set of prompts."""
+        matches = [r for r in self.all() if r.fingerprint == fingerprint]
+        return matches[-1] if matches else None
+
+    def _read(self, path: Path) -> BatchRecord | None:
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return BatchRecord(**json.load(f))
+        except (json.JSONDecodeError, TypeError) as e:
+            print(f"Error loading batch record from {path}: {e}")
+            return None
+
+
+batch_store = BatchStore(DEFAULT_BATCH_DIR)
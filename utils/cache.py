@@ -3,10 +3,24 @@ Cache utility module for storing and retrieving LLM results.
 
 This module provides functionality to cache LLM responses based on context strings,
 reducing API calls and improving performance.
+
+Two backends share the same ``load/save/clear/exists`` API:
+
+- ``CacheManager``: one JSON file per key (legacy format)
+- ``SqliteCacheManager``: a single SQLite database with an in-process LRU
+  front cache, TTL and max-size eviction
 """
 
+import asyncio
+import concurrent.futures
 import hashlib
+import inspect
 import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Callable, Generic, TypeVar
 
@@ -16,10 +30,46 @@ from utils.config import OUTPUT_PATH
 
 T = TypeVar("T", bound=BaseModel)
 
-# Default cache directory
+# Default cache directory (JSON backend)
 DEFAULT_CACHE_DIR = OUTPUT_PATH / "cache" / "llm_results"
 DEFAULT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+# Default cache database (SQLite backend)
+DEFAULT_CACHE_DB = OUTPUT_PATH / "cache" / "cache.sqlite3"
+
+
+@dataclass
+class CacheStats:
+    """Lookup counters for a cache, updated by ``with_cache``.
+
+    Attributes:
+        hits: Calls answered from the cache
+        misses: Calls that ran the wrapped function
+        coalesced: Calls that waited on another caller's in-flight computation
+        stale: Hits served past ``stale_after`` while a refresh ran in the background
+        refresh_errors: Background refreshes that raised (the stale entry was kept)
+    """
+
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    stale: int = 0
+    refresh_errors: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def increment(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stale": self.stale,
+            "refresh_errors": self.refresh_errors,
+        }
+
 
 class CacheManager(Generic[T]):
     """
@@ -34,6 +84,7 @@ class CacheManager(Generic[T]):
         self.cache_dir = Path(cache_dir)
         self.result_type = result_type
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.stats = CacheStats()
 
     def _get_cache_key(self, context: str) -> str:
         """
@@ -126,6 +177,26 @@ class CacheManager(Generic[T]):
                 cache_file.unlink()
             print(f"✓ Cleared all cache files in {self.cache_dir}")
 
+    def load_with_age(self, context: str) -> tuple[list[T], float] | None:
+        """
+        Load cached results together with their age in seconds.
+
+        Args:
+            context: Context string to look up
+
+        Returns:
+            ``(results, age_seconds)`` if cache exists, None otherwise
+        """
+        cache_path = self._get_cache_path(context)
+        try:
+            modified = cache_path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        results = self.load(context)
+        if results is None:
+            return None
+        return results, time.time() - modified
+
     def exists(self, context: str) -> bool:
         """
         Check if a cache entry exists for the given context.
@@ -170,18 +241,400 @@ class CacheManager(Generic[T]):
             return None
 
 
+class SqliteCacheManager(Generic[T]):
+    """
+    Cache manager backed by a single SQLite database.
+
+    Entries are stored as compact JSON in one row per key, so a lookup reads
+    a single row instead of a whole file. Recently used entries are also kept
+    in memory, in an LRU of *memory_items* entries; their access times are
+    written back in batches of *touch_batch*, so eviction still sees them as
+    recently used. Writes are transactional, so readers never see a
+    half-written entry.
+
+    Args:
+        db_path: Path to the SQLite database file (created if missing)
+        result_type: Pydantic model class for the cached data
+        namespace: Name separating this cache from others in the same database
+            (defaults to the result type name)
+        ttl_seconds: Entries older than this are treated as missing and evicted.
+            None keeps entries forever.
+        max_entries: Maximum number of entries in the namespace; the least
+            recently used ones are evicted beyond that. None means unbounded.
+        memory_items: Size of the in-process LRU front cache (0 disables it)
+        touch_batch: Memory hits buffered before their access times are written
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        result_type: type[T],
+        namespace: str | None = None,
+        ttl_seconds: float | None = None,
+        max_entries: int | None = None,
+        memory_items: int = 128,
+        touch_batch: int = 256,
+    ):
+        self.db_path = Path(db_path)
+        self.result_type = result_type
+        self.namespace = namespace or result_type.__name__
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_items = memory_items
+        self.touch_batch = touch_batch
+        self.stats = CacheStats()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, tuple[float, list[T]]] = OrderedDict()
+        # cache_key -> accessed_at of memory hits not yet written to the database
+        self._touched: dict[str, float] = {}
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                context TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                num_results INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, cache_key)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (namespace, accessed_at)"
+        )
+
+    def _get_cache_key(self, context: str) -> str:
+        """
+        Generate a cache key based on the context string.
+
+        Args:
+            context: Context string to hash
+
+        Returns:
+            SHA256 hash of the context
+        """
+        return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, cache_key: str, created_at: float, results: list[T]) -> None:
+        if self.memory_items <= 0:
+            return
+        self._memory[cache_key] = (created_at, results)
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self) -> None:
+        """Write the buffered access times of memory hits (called with the lock held)."""
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND cache_key = ?",
+            [(accessed_at, self.namespace, cache_key) for cache_key, accessed_at in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _load_entry(self, context: str) -> tuple[float, list[T]] | None:
+        """Return ``(created_at, results)`` for *context*, evicting it if expired."""
+        cache_key = self._get_cache_key(context)
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is not None:
+                if not self._is_expired(entry[0]):
+                    self._memory.move_to_end(cache_key)
+                    self._touched[cache_key] = time.time()
+                    if len(self._touched) >= self.touch_batch:
+                        self._flush_touched()
+                    return entry
+                self._memory.pop(cache_key, None)
+                self._touched.pop(cache_key, None)
+
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM cache_entries WHERE namespace = ? AND cache_key = ?",
+                (self.namespace, cache_key),
+            ).fetchone()
+            if row is None:
+                return None
+
+            payload, created_at = row
+            if self._is_expired(created_at):
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND cache_key = ?",
+                    (self.namespace, cache_key),
+                )
+                return None
+
+            try:
+                results = [self.result_type(**item) for item in json.loads(payload)]
+            except (json.JSONDecodeError, TypeError, ValueError) as e:
+                print(f"Error loading cache entry {cache_key}: {e}")
+                return None
+
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND cache_key = ?",
+                (time.time(), self.namespace, cache_key),
+            )
+            self._remember(cache_key, created_at, results)
+            return created_at, results
+
+    def load(self, context: str) -> list[T] | None:
+        """
+        Load cached results.
+
+        Args:
+            context: Context string to look up
+
+        Returns:
+            List of result objects if a live entry exists, None otherwise
+        """
+        entry = self._load_entry(context)
+        return list(entry[1]) if entry is not None else None
+
+    def load_with_age(self, context: str) -> tuple[list[T], float] | None:
+        """
+        Load cached results together with their age in seconds.
+
+        Args:
+            context: Context string to look up
+
+        Returns:
+            ``(results, age_seconds)`` if a live entry exists, None otherwise
+        """
+        entry = self._load_entry(context)
+        if entry is None:
+            return None
+        created_at, results = entry
+        return list(results), time.time() - created_at
+
+    def save(self, context: str, results: list[T]) -> None:
+        """
+        Save results to cache, then evict expired and excess entries.
+
+        Args:
+            context: Context string (used as cache key)
+            results: List of result objects to cache
+        """
+        self.save_many([(context, results)])
+
+    def save_many(self, entries: list[tuple[str, list[T]]]) -> None:
+        """
+        Save several ``(context, results)`` entries in one transaction, then evict once.
+
+        Args:
+            entries: Context strings (used as cache keys) and their results
+        """
+        now = time.time()
+        rows = [
+            (
+                self.namespace,
+                self._get_cache_key(context),
+                context,
+                json.dumps([r.model_dump() for r in results], ensure_ascii=False, separators=(",", ":")),
+                len(results),
+                now,
+                now,
+            )
+            for context, results in entries
+        ]
+        if not rows:
+            return
+
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Memory hits count as recent uses for the eviction below
+                    self._flush_touched()
+                    self._conn.executemany(
+                        """
+                        INSERT OR REPLACE INTO cache_entries
+                            (namespace, cache_key, context, payload, num_results, created_at, accessed_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        rows,
+                    )
+                    self._evict()
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                for (_, cache_key, _, _, _, _, _), (_, results) in zip(rows, entries):
+                    self._remember(cache_key, now, list(results))
+        except Exception as e:
+            print(f"✗ Error saving {len(rows)} cache entries ({rows[0][1]}...): {e}")
+
+    def _evict(self) -> None:
+        """Delete expired entries and the least recently used ones beyond *max_entries*."""
+        evicted: set[str] = set()
+        if self.ttl_seconds is not None:
+            evicted.update(
+                cache_key
+                for (cache_key,) in self._conn.execute(
+                    "SELECT cache_key FROM cache_entries WHERE namespace = ? AND created_at < ?",
+                    (self.namespace, time.time() - self.ttl_seconds),
+                )
+            )
+        if self.max_entries is not None:
+            evicted.update(
+                cache_key
+                for (cache_key,) in self._conn.execute(
+                    """
+                    SELECT cache_key FROM cache_entries WHERE namespace = ?
+                    ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    """,
+                    (self.namespace, self.max_entries),
+                )
+            )
+        if not evicted:
+            return
+        self._conn.executemany(
+            "DELETE FROM cache_entries WHERE namespace = ? AND cache_key = ?",
+            [(self.namespace, cache_key) for cache_key in evicted],
+        )
+        # Keep the front cache consistent with what survived on disk
+        for cache_key in evicted:
+            self._memory.pop(cache_key, None)
+            self._touched.pop(cache_key, None)
+
+    def clear(self, context: str | None = None) -> None:
+        """
+        Clear cached results.
+
+        Args:
+            context: Specific context to clear. If None, clears the whole namespace.
+        """
+        with self._lock:
+            if context is not None:
+                cache_key = self._get_cache_key(context)
+                self._memory.pop(cache_key, None)
+                self._touched.pop(cache_key, None)
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND cache_key = ?",
+                    (self.namespace, cache_key),
+                )
+                print(f"✓ Cleared cache: {cache_key}")
+            else:
+                self._memory.clear()
+                self._touched.clear()
+                self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+                print(f"✓ Cleared all '{self.namespace}' entries in {self.db_path}")
+
+    def exists(self, context: str) -> bool:
+        """
+        Check if a live cache entry exists for the given context.
+
+        Args:
+            context: Context string to check
+
+        Returns:
+            True if cache exists, False otherwise
+        """
+        cache_key = self._get_cache_key(context)
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is not None and not self._is_expired(entry[0]):
+                return True
+            row = self._conn.execute(
+                "SELECT created_at FROM cache_entries WHERE namespace = ? AND cache_key = ?",
+                (self.namespace, cache_key),
+            ).fetchone()
+        return row is not None and not self._is_expired(row[0])
+
+    def get_cache_info(self, context: str) -> dict[str, Any] | None:
+        """
+        Get metadata about a cached entry without decoding its results.
+
+        Args:
+            context: Context string
+
+        Returns:
+            Dictionary with cache metadata or None if not found
+        """
+        cache_key = self._get_cache_key(context)
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT length(payload), created_at, num_results FROM cache_entries
+                WHERE namespace = ? AND cache_key = ?
+                """,
+                (self.namespace, cache_key),
+            ).fetchone()
+        if row is None:
+            return None
+        size_bytes, created_at, num_results = row
+        return {
+            "cache_key": cache_key,
+            "path": str(self.db_path),
+            "size_bytes": size_bytes,
+            "modified": created_at,
+            "num_results": num_results,
+        }
+
+
+def migrate_json_cache(json_dir: Path, target: SqliteCacheManager[T]) -> int:
+    """
+    Import entries written by the JSON ``CacheManager`` into *target*.
+
+    Each migrated file is renamed to ``*.json.migrated`` so the import runs
+    only once; entries already present in *target* are not overwritten.
+
+    Args:
+        json_dir: Directory containing the legacy ``<sha256>.json`` files
+        target: Cache to import into
+
+    Returns:
+        Number of entries imported
+    """
+    imported = 0
+    for cache_file in sorted(Path(json_dir).glob("*.json")):
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            context = data["context"]
+            results = [target.result_type(**item) for item in data["results"]]
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            print(f"Skipping cache file {cache_file.name}: {e}")
+            continue
+
+        if not target.exists(context):
+            target.save(context, results)
+            imported += 1
+        cache_file.rename(cache_file.with_name(cache_file.name + ".migrated"))
+
+    if imported:
+        print(f"✓ Migrated {imported} cache entries from {json_dir}")
+    return imported
+
+
 def with_cache(
-    cache_manager: CacheManager[T],
+    cache_manager: CacheManager[T] | SqliteCacheManager[T],
     context_getter: Callable[..., str],
     use_cache: bool = True,
+    stale_after: float | None = None,
 ) -> Callable:
     """
     Decorator to add caching to a function that returns list[T].
 
+    Works on plain and ``async def`` functions. Concurrent calls that miss the
+    same key share a single computation (single-flight): the first caller
+    runs the function, the others wait for its result. Lookups are counted in
+    ``cache_manager.stats``.
+
     Args:
-        cache_manager: CacheManager instance to use
+        cache_manager: CacheManager or SqliteCacheManager instance to use
         context_getter: Function to extract context string from function arguments
         use_cache: Whether to enable caching
+        stale_after: If set, entries older than this many seconds are still
+            returned immediately, but trigger a background refresh
+            (stale-while-revalidate)
 
     Returns:
         Decorated function with caching
@@ -193,8 +646,55 @@ def with_cache(
         >>>     # ... expensive operation
         >>>     return results
     """
+    stats = cache_manager.stats
+
+    def _lookup(context: str) -> tuple[list[T] | None, bool]:
+        """Return ``(cached, is_stale)``."""
+        entry = cache_manager.load_with_age(context)
+        if entry is None:
+            return None, False
+        cached, age = entry
+        return cached, stale_after is not None and age > stale_after
+
+    def _report_refresh(future: "concurrent.futures.Future | asyncio.Future") -> None:
+        """Done-callback of a background refresh: nobody awaits it, so surface its failure here."""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            stats.increment("refresh_errors")
+            print(f"✗ Background cache refresh failed, keeping the stale entry: {error!r}")
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(func):
+            return _async_wrapper(func)
+        return _sync_wrapper(func)
+
+    def _sync_wrapper(func: Callable[..., list[T]]) -> Callable[..., list[T]]:
+        in_flight: dict[str, concurrent.futures.Future] = {}
+        lock = threading.Lock()
+
+        def claim(context: str) -> tuple[concurrent.futures.Future, bool]:
+            """Return the in-flight future for *context* and whether this caller owns it."""
+            with lock:
+                future = in_flight.get(context)
+                if future is not None:
+                    return future, False
+                future = concurrent.futures.Future()
+                in_flight[context] = future
+                return future, True
+
+        def run(context: str, future: concurrent.futures.Future, args: tuple, kwargs: dict) -> None:
+            try:
+                result = func(*args, **kwargs)
+                cache_manager.save(context, result)
+                future.set_result(result)
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with lock:
+                    in_flight.pop(context, None)
 
-    def decorator(func: Callable[..., list[T]]) -> Callable[..., list[T]]:
         def wrapper(*args: Any, **kwargs: Any) -> list[T]:
             if not use_cache:
                 return func(*args, **kwargs)
@@ -203,19 +703,81 @@ def with_cache(
             context = context_getter(*args, **kwargs)
 
             # Try to load from cache
-            cached = cache_manager.load(context)
+            cached, is_stale = _lookup(context)
             if cached is not None:
-                print(f"✓ Loaded {len(cached)} items from cache")
+                if is_stale:
+                    stats.increment("stale")
+                    future, owner = claim(context)
+                    if owner:
+                        print("↻ Stale cache entry - refreshing in background...")
+                        future.add_done_callback(_report_refresh)
+                        threading.Thread(target=run, args=(context, future, args, kwargs), daemon=True).start()
+                else:
+                    stats.increment("hits")
+                    print(f"✓ Loaded {len(cached)} items from cache")
                 return cached
 
+            future, owner = claim(context)
+            if not owner:
+                stats.increment("coalesced")
+                print("⧗ Waiting for in-flight computation of the same key...")
+                return future.result()
+
             # Cache miss - call original function
+            stats.increment("misses")
             print("○ Cache miss - executing function...")
-            result = func(*args, **kwargs)
+            run(context, future, args, kwargs)
+            return future.result()
+
+        return wrapper
+
+    def _async_wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
+        in_flight: dict[str, asyncio.Task] = {}
+
+        def compute(context: str, args: tuple, kwargs: dict) -> tuple[asyncio.Task, bool]:
+            task = in_flight.get(context)
+            if task is not None:
+                return task, False
 
-            # Save to cache
-            cache_manager.save(context, result)
+            async def run() -> list[T]:
+                try:
+                    result = await func(*args, **kwargs)
+                    cache_manager.save(context, result)
+                    return result
+                finally:
+                    in_flight.pop(context, None)
+
+            task = asyncio.ensure_future(run())
+            in_flight[context] = task
+            return task, True
+
+        async def wrapper(*args: Any, **kwargs: Any) -> list[T]:
+            if not use_cache:
+                return await func(*args, **kwargs)
+
+            context = context_getter(*args, **kwargs)
+
+            cached, is_stale = _lookup(context)
+            if cached is not None:
+                if is_stale:
+                    stats.increment("stale")
+                    task, owner = compute(context, args, kwargs)
+                    if owner:
+                        print("↻ Stale cache entry - refreshing in background...")
+                        task.add_done_callback(_report_refresh)
+                else:
+                    stats.increment("hits")
+                    print(f"✓ Loaded {len(cached)} items from cache")
+                return cached
 
-            return result
+            task, owner = compute(context, args, kwargs)
+            if owner:
+                stats.increment("misses")
+                print("○ Cache miss - executing function...")
+            else:
+                stats.increment("coalesced")
+            # Shield so a cancelled caller does not cancel the shared computation
+            return await asyncio.shield(task)
 
         return wrapper
 
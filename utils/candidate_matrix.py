@@ -0,0 +1,251 @@
+"""Columnar candidates for the rerank, filter and split stages.
+
+Instead of a ``QueryMatch`` with ``PesquisaPrompt.Item`` objects per
+candidate, the middle of the pipeline works on ``[queries, k]`` NumPy
+arrays. Filters only narrow a boolean mask, sorting is an ``argsort``,
+and ``QueryMatch`` objects are built once, at serialization.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from typing import Any, Iterable, Mapping
+
+import numpy as np
+
+from utils.ai import PesquisaPrompt
+from utils.domain import QueryMatch
+
+
+@dataclass(frozen=True)
+class CandidateMatrix:
+    """
+    Retrieved candidates of a batch of queries.
+
+    Row ``q`` holds the candidates of ``queries[q]``; rows shorter than
+    ``k`` are padded with ``doc_index == -1``. Unscored candidates have a
+    NaN score.
+
+    Attributes:
+        queries: Query texts, one per row
+        documents: Distinct candidate texts, indexed by ``doc_index``
+        doc_index: int32 ``[Q, k]`` index into *documents* (-1 = padding)
+        distance: float64 ``[Q, k]`` retrieval distance
+        score: float64 ``[Q, k]`` rerank score
+        value: float64 ``[Q, k]`` catalog value
+        mask: bool ``[Q, k]`` candidates still in play
+    """
+
+    queries: list[str]
+    documents: list[str]
+    doc_index: np.ndarray
+    distance: np.ndarray
+    score: np.ndarray
+    value: np.ndarray
+    mask: np.ndarray
+
+    @classmethod
+    def from_rows(
+        cls,
+        queries: list[str],
+        rows: Iterable[Iterable[tuple[str, float, float | None, float]]],
+        k: int | None = None,
+    ) -> "CandidateMatrix":
+        """Build from ``(description, distance, score, value)`` rows per query.
+
+        Args:
+            queries: Query texts
+            rows: Candidates of each query; a None score means not scored
+            k: Columns to keep (default: the longest row)
+        """
+        rows = [list(row) for row in rows]
+        width = max((len(row) for row in rows), default=0) if k is None else k
+        shape = (len(queries), width)
+
+        documents: list[str] = []
+        position: dict[str, int] = {}
+        doc_index = np.full(shape, -1, dtype=np.int32)
+        distance = np.full(shape, np.inf, dtype=np.float64)
+        score = np.full(shape, np.nan, dtype=np.float64)
+        value = np.zeros(shape, dtype=np.float64)
+
+        for q, row in enumerate(rows):
+            for j, (description, dist, sc, val) in enumerate(row[:width]):
+                index = position.get(description)
+                if index is None:
+                    index = position[description] = len(documents)
+                    documents.append(description)
+                doc_index[q, j] = index
+                distance[q, j] = dist
+                if sc is not None:
+                    score[q, j] = sc
+                value[q, j] = val
+
+        return cls(queries, documents, doc_index, distance, score, value, doc_index >= 0)
+
+    @classmethod
+    def from_query_result(
+        cls, queries: list[str], raw: Mapping[str, list[list[Any]]], values: Mapping[str, float] | None = None
+    ) -> "CandidateMatrix":
+        """Build from a vector-store query result (see ``utils.vector_store``).
+
+        Values are read from each hit's ``mean_value`` metadata, falling
+        back to *values* for documents stored without it.
+
+        Args:
+            queries: The queried texts
+            raw: Result with ``ids``, ``documents``, ``distances`` and ``metadatas`` lists per query
+            values: Catalog value of each document ID
+        """
+        values = values or {}
+
+        def value_of(doc_id: str, metadata: Mapping[str, Any] | None) -> float:
+            if metadata and "mean_value" in metadata:
+                return float(metadata["mean_value"])
+            return values.get(doc_id, 0.0)
+
+        metadatas = raw.get("metadatas") or [None] * len(queries)
+        return cls.from_rows(
+            queries,
+            (
+                [
+                    (doc, dist, None, value_of(doc_id, metadata))
+                    for doc_id, doc, dist, metadata in zip(ids, docs, dists, metas or [None] * len(ids))
+                ]
+                for ids, docs, dists, metas in zip(raw["ids"], raw["documents"], raw["distances"], metadatas)
+            ),
+        )
+
+    @property
+    def valid(self) -> np.ndarray:
+        """Non-padding cells."""
+        return self.doc_index >= 0
+
+    @property
+    def has_candidates(self) -> np.ndarray:
+        """Per-row flag: at least one candidate in play."""
+        return self.mask.any(axis=1)
+
+    # --- Filters (mask only) ------------------------------------------------
+
+    def head(self, n: int) -> "CandidateMatrix":
+        """Keep only the first *n* columns in play (the *n* nearest, before sorting)."""
+        mask = self.mask.copy()
+        mask[:, n:] = False
+        return replace(self, mask=mask)
+
+    def within_distance(self, max_distance: float) -> "CandidateMatrix":
+        return replace(self, mask=self.mask & (self.distance <= max_distance))
+
+    def exclude(self, cells: np.ndarray) -> "CandidateMatrix":
+        """Take the *cells* (bool ``[Q, k]``) out of play."""
+        return replace(self, mask=self.mask & ~cells)
+
+    def scored(self) -> "CandidateMatrix":
+        """Drop candidates without a rerank score."""
+        return replace(self, mask=self.mask & ~np.isnan(self.score))
+
+    def filter_by_score(self, threshold: float) -> "CandidateMatrix":
+        """Same rule as ``filter_items_by_score``."""
+        return replace(self, mask=self.mask & (self.score >= threshold))
+
+    def filter_by_score_gap(self, gap_threshold: float) -> "CandidateMatrix":
+        """Same rule as ``filter_items_by_score_gap``."""
+        best = self.best_score()
+        return replace(self, mask=self.mask & ((best[:, None] - self.score) <= gap_threshold))
+
+    def best_score(self) -> np.ndarray:
+        """Highest score in play per row (-inf for empty rows)."""
+        if self.score.shape[1] == 0:
+            return np.full(len(self.queries), -np.inf)
+        return np.where(self.mask, self.score, -np.inf).max(axis=1)
+
+    def split_by_confidence(self, threshold: float) -> tuple[np.ndarray, np.ndarray]:
+        """Same rule as ``split_by_confidence``, on row indices.
+
+        Returns:
+            ``(low_rows, high_rows)`` — indices of rows with candidates
+        """
+        has = self.has_candidates
+        high = has & (self.best_score() >= threshold)
+        return np.flatnonzero(has & ~high), np.flatnonzero(high)
+
+    # --- Reordering ---------------------------------------------------------
+
+    def with_scores(self, scores: np.ndarray) -> "CandidateMatrix":
+        return replace(self, score=np.asarray(scores, dtype=np.float64))
+
+    def sort_by_score(self) -> "CandidateMatrix":
+        """Order each row by score (descending); cells out of play go last."""
+        key = np.where(self.mask, -np.nan_to_num(self.score, nan=-np.inf), np.inf)
+        order = np.argsort(key, axis=1, kind="stable")
+
+        def take(a: np.ndarray) -> np.ndarray:
+            return np.take_along_axis(a, order, axis=1)
+
+        return replace(
+            self,
+            doc_index=take(self.doc_index),
+            distance=take(self.distance),
+            score=take(self.score),
+            value=take(self.value),
+            mask=take(self.mask),
+        )
+
+    # --- Materialization ----------------------------------------------------
+
+    def to_rows(self) -> list[list[tuple[str, float, float | None, float]]]:
+        """Inverse of ``from_rows``: ``(description, distance, score, value)`` of every retrieved cell, per query."""
+        valid = self.valid
+        return [
+            [
+                (
+                    self.documents[self.doc_index[q, j]],
+                    float(self.distance[q, j]),
+                    None if np.isnan(self.score[q, j]) else float(self.score[q, j]),
+                    float(self.value[q, j]),
+                )
+                for j in np.flatnonzero(valid[q]).tolist()
+            ]
+            for q in range(len(self.queries))
+        ]
+
+    def pairs(self, rows: slice | np.ndarray | None = None) -> tuple[list[list[str]], np.ndarray]:
+        """(query, document) pairs of the cells in play, and their flat cell indices."""
+        cells = np.flatnonzero(self.mask if rows is None else self._row_mask(rows))
+        width = self.mask.shape[1]
+        pairs = [
+            [self.queries[cell // width], self.documents[self.doc_index.flat[cell]]] for cell in cells.tolist()
+        ]
+        return pairs, cells
+
+    def _row_mask(self, rows: slice | np.ndarray) -> np.ndarray:
+        selected = np.zeros_like(self.mask)
+        selected[rows] = self.mask[rows]
+        return selected
+
+    def to_matches(self, rows: Iterable[int] | None = None, mark_best: bool = False) -> list[QueryMatch]:
+        """Build QueryMatch objects for *rows* (default: all) from the cells in play, in column order.
+
+        Args:
+            rows: Row indices to materialize
+            mark_best: Set ``matched`` on each row's highest-scoring candidate
+        """
+        rows = range(len(self.queries)) if rows is None else rows
+        best = self.best_score() if mark_best else None
+        matches = []
+        for q in rows:
+            candidates = []
+            marked = False
+            for j in np.flatnonzero(self.mask[q]).tolist():
+                item = PesquisaPrompt.Item(
+                    description=self.documents[self.doc_index[q, j]],
+                    distance=float(self.distance[q, j]),
+                    score=0.0 if np.isnan(self.score[q, j]) else float(self.score[q, j]),
+                    value=float(self.value[q, j]),
+                )
+                if best is not None and not marked and self.score[q, j] == best[q]:
+                    item.matched = marked = True
+                candidates.append(item)
+            matches.append(QueryMatch(query=self.queries[q], candidates=candidates))
+        return matches
@@ -0,0 +1,210 @@
+"""
+Persistent per-description price aggregates of each catalog.
+
+Monthly invoice extracts are merged into running sums instead of
+re-uploading the full history: per catalog and normalized description the
+table keeps the total quantity, total value, number of invoice rows and
+when the description was first and last seen. ``mean_value`` is always
+``total_value / quantity`` over everything merged so far.
+
+A digest of every merged extract is kept too, so submitting the same
+extract twice does not count it twice.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+from utils.config import OUTPUT_PATH
+from utils.dedup import normalize_description
+
+DEFAULT_CATALOG_DB = OUTPUT_PATH / "catalogs.sqlite3"
+
+
+@dataclass
+class MergeReport:
+    """What a merge changed in a catalog."""
+
+    catalog: str
+    new_descriptions: int
+    updated_descriptions: int
+    total_descriptions: int
+    duplicate: bool = False
+
+
+class CatalogStore:
+    """
+    Running aggregates of catalogs, in a SQLite database.
+
+    Rows are keyed by ``(catalog, normalize_description(description))``, so
+    a spelling variant in a later extract adds to the existing row. The
+    spelling first merged is kept as the row's description (and so as its
+    vector-DB document).
+
+    Args:
+        db_path: Path to the SQLite database file (created if missing)
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_CATALOG_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS catalog_aggregates (
+                catalog TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                description TEXT NOT NULL,
+                quantity REAL NOT NULL,
+                total_value REAL NOT NULL,
+                row_count INTEGER NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (catalog, normalized)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS catalog_extracts (
+                catalog TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                merged_at REAL NOT NULL,
+                PRIMARY KEY (catalog, digest)
+            )
+            """
+        )
+
+    def merge(self, catalog: str, df: pd.DataFrame, replace: bool = False) -> MergeReport:
+        """Add an extract to *catalog*'s running sums.
+
+        An extract already merged into *catalog* (same rows, in any order) is
+        skipped and reported as ``duplicate``.
+
+        Args:
+            catalog: Catalog name
+            df: One row per description with ``description``, ``quantity``,
+                ``total_value`` and ``rows`` (see ``collapse_catalog``)
+            replace: Drop the catalog's aggregates first, in the same transaction
+        """
+        now = time.time()
+        records = [
+            (catalog, normalize_description(description), description, float(quantity), float(total_value), int(rows), now, now)
+            for description, quantity, total_value, rows in df[["description", "quantity", "total_value", "rows"]].itertuples(
+                index=False
+            )
+        ]
+        digest = hashlib.sha256(
+            json.dumps(sorted(record[1:6] for record in records), ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if replace:
+                    self._delete(catalog)
+                elif self._conn.execute(
+                    "SELECT 1 FROM catalog_extracts WHERE catalog = ? AND digest = ?", (catalog, digest)
+                ).fetchone():
+                    (total,) = self._conn.execute(
+                        "SELECT COUNT(*) FROM catalog_aggregates WHERE catalog = ?", (catalog,)
+                    ).fetchone()
+                    self._conn.execute("COMMIT")
+                    return MergeReport(catalog, 0, 0, total, duplicate=True)
+                known = {
+                    normalized
+                    for (normalized,) in self._conn.execute(
+                        "SELECT normalized FROM catalog_aggregates WHERE catalog = ?", (catalog,)
+                    )
+                }
+                self._conn.executemany(
+                    """
+                    INSERT INTO catalog_aggregates
+                        (catalog, normalized, description, quantity, total_value, row_count, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (catalog, normalized) DO UPDATE SET
+                        quantity = quantity + excluded.quantity,
+                        total_value = total_value + excluded.total_value,
+                        row_count = row_count + excluded.row_count,
+                        last_seen = excluded.last_seen
+                    """,
+                    records,
+                )
+                self._conn.execute(
+                    "INSERT INTO catalog_extracts (catalog, digest, merged_at) VALUES (?, ?, ?)", (catalog, digest, now)
+                )
+                (total,) = self._conn.execute(
+                    "SELECT COUNT(*) FROM catalog_aggregates WHERE catalog = ?", (catalog,)
+                ).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        incoming = {record[1] for record in records}
+        return MergeReport(
+            catalog=catalog,
+            new_descriptions=len(incoming - known),
+            updated_descriptions=len(incoming & known),
+            total_descriptions=total,
+        )
+
+    def load(self, catalog: str) -> pd.DataFrame:
+        """All descriptions of *catalog* with ``quantity``, ``total_value``, ``count``, ``first_seen`` and ``last_seen``."""
+        with self._lock:
+            return pd.read_sql_query(
+                """
+                SELECT description, quantity, total_value, row_count AS count, first_seen, last_seen
+                FROM catalog_aggregates WHERE catalog = ? ORDER BY first_seen, description
+                """,
+                self._conn,
+                params=(catalog,),
+            )
+
+    def catalogs(self) -> list[dict]:
+        """Stored catalogs, most recently updated first."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT catalog, COUNT(*), MAX(last_seen) FROM catalog_aggregates
+                GROUP BY catalog ORDER BY MAX(last_seen) DESC
+                """
+            ).fetchall()
+        return [{"catalog": name, "descriptions": count, "updated_at": updated} for name, count, updated in rows]
+
+    def _delete(self, catalog: str) -> None:
+        self._conn.execute("DELETE FROM catalog_aggregates WHERE catalog = ?", (catalog,))
+        self._conn.execute("DELETE FROM catalog_extracts WHERE catalog = ?", (catalog,))
+
+    def clear(self, catalog: str) -> None:
+        """Forget *catalog*'s aggregates and merged extracts (a full re-upload starts over)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete(catalog)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+_catalog_store: CatalogStore | None = None
+_catalog_store_lock = threading.Lock()
+
+
+def get_catalog_store() -> CatalogStore:
+    """Shared CatalogStore on the default database."""
+    global _catalog_store
+    with _catalog_store_lock:
+        if _catalog_store is None:
+            _catalog_store = CatalogStore()
+        return _catalog_store
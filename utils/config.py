@@ -22,6 +22,29 @@ _DEFAULTS: dict = {
     "use_llm_abbreviation_expansion": False,
     "use_llm_judge": False,
     "high_confidence_threshold": 0.9,
+    "reranker_processes": 0,
+    "reranker_threads_per_process": 0,
+    "reranker_adaptive_max_length": False,
+    "embedding_processes": 0,
+    "vector_backend": "chroma",
+    "vector_shards": 1,
+    "vector_shard_by": "hash",
+    "vector_space": "cosine",
+    "hnsw_max_neighbors": 16,
+    "hnsw_ef_construction": 100,
+    "hnsw_ef_search": 100,
+    "inference_mode": "process",
+    "inference_workers": 1,
+    "inference_threads_per_worker": 0,
+    "dedup_near_duplicates": False,
+    "dedup_similarity": 0.9,
+    "retrieval_unit_filter": False,
+    "retrieval_price_band": 0.0,
+    "attribute_prefilter": False,
+    "attribute_rules_path": "",
+    "checkpoint_retention_hours": 0.0,
+    "interrupted_checkpoint_retention_hours": 72.0,
+    "query_result_cache": True,
 }
 
 
@@ -32,6 +55,96 @@ class AppConfig:
     use_llm_abbreviation_expansion: bool = False
     use_llm_judge: bool = False
     high_confidence_threshold: float = 0.9
+    # 0 or 1 = rerank in-process; N > 1 = pool of N worker processes
+    reranker_processes: int = 0
+    # torch intra-op threads per reranker worker (0 = torch default)
+    reranker_threads_per_process: int = 0
+    # Truncate the longest query-candidate pairs to a length covering the observed ones (faster, slightly lossy)
+    reranker_adaptive_max_length: bool = False
+    # 0 or 1 = embed catalog in-process; N > 1 = sentence-transformers pool of N processes
+    embedding_processes: int = 0
+    # "chroma" (persistent HNSW) or "numpy" (exact search over a memory-mapped matrix)
+    vector_backend: str = "chroma"
+    # Split each catalog over N stores queried in parallel (1 = unsharded)
+    vector_shards: int = 1
+    # "hash" (even spread by document ID) or "family" (first word of the description)
+    vector_shard_by: str = "hash"
+    # Distance space of new collections: "cosine" (Chroma's default for our embeddings), "l2" or "ip"
+    vector_space: str = "cosine"
+    # HNSW graph degree (M) and build beam width; changing either builds a new collection
+    hnsw_max_neighbors: int = 16
+    hnsw_ef_construction: int = 100
+    # HNSW query beam width (higher = better recall, slower queries)
+    hnsw_ef_search: int = 100
+    # "process" = models live in worker processes, off the web server; "in_process" = load them here
+    inference_mode: str = "process"
+    # Worker processes in "process" mode (reranker_/embedding_processes apply to "in_process" mode)
+    inference_workers: int = 1
+    # torch intra-op threads per inference worker (0 = torch default)
+    inference_threads_per_worker: int = 0
+    # Merge catalog descriptions that differ by more than accents/case/punctuation (MinHash over character 3-grams)
+    dedup_near_duplicates: bool = False
+    # Estimated Jaccard similarity of two descriptions' 3-grams to merge them
+    dedup_similarity: float = 0.9
+    # Retrieve only documents of the query's unit family (mass, volume, ...) or without a unit
+    retrieval_unit_filter: bool = False
+    # Retrieve only documents priced within ±band (fraction) of the query's expected value; 0 = off
+    retrieval_price_band: float = 0.0
+    # Drop candidates whose hard attributes (tire size, volume, brand, ...) contradict the query before reranking
+    attribute_prefilter: bool = False
+    # JSON rules for the attribute extractor ("" = attribute_rules.json in the output folder, else built-in rules)
+    attribute_rules_path: str = ""
+    # Keep a finished task's stage checkpoints this many hours (0 = delete them as soon as it succeeds)
+    checkpoint_retention_hours: float = 0.0
+    # Keep the checkpoints of a failed or interrupted task this many hours after its last progress (0 = until resumed)
+    interrupted_checkpoint_retention_hours: float = 72.0
+    # Reuse the reranked candidates of queries already run against the same catalog and settings
+    query_result_cache: bool = True
+
+
+# Settings forced for the running process (see ``override_config``)
+_overrides: dict = {}
+
+
+def override_config(**overrides) -> None:
+    """Force settings for this process on top of ``config.json``, without writing it.
+
+    Used by the command line (``cli.py --set key=value``); each value is
+    checked against the type of the setting's default, so text such as
+    ``"False"`` is read as a boolean instead of being truthy.
+
+    Raises:
+        KeyError: If a setting does not exist
+        ValueError: If a value does not fit the setting's type
+    """
+    unknown = sorted(set(overrides) - set(_DEFAULTS))
+    if unknown:
+        raise KeyError(f"Configurações desconhecidas: {', '.join(unknown)}")
+    _overrides.update({key: _coerce(key, value) for key, value in overrides.items()})
+
+
+_TRUE = ("true", "1", "yes", "sim")
+_FALSE = ("false", "0", "no", "nao", "não")
+
+
+def _coerce(key: str, value):
+    default = _DEFAULTS[key]
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in _TRUE or text in _FALSE:
+            return text in _TRUE
+        raise ValueError(f"{key} deve ser true ou false, não {value!r}")
+    if isinstance(default, (int, float)):
+        try:
+            number = type(default)(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} deve ser numérico, não {value!r}") from None
+        if isinstance(default, int) and number != float(value):
+            raise ValueError(f"{key} deve ser inteiro, não {value!r}")
+        return number
+    return str(value)
 
 
 def load_config() -> AppConfig:
@@ -39,19 +152,43 @@ def load_config() -> AppConfig:
     if not _CONFIG_PATH.exists():
         cfg = AppConfig()
         save_config(cfg)
-        return cfg
+        if not _overrides:
+            return cfg
 
     with _CONFIG_PATH.open("r", encoding="utf-8") as f:
         data: dict = json.load(f)
 
     # Merge with defaults so new fields added in the future don't break old files
-    merged = {**_DEFAULTS, **data}
+    merged = {**_DEFAULTS, **data, **_overrides}
     return AppConfig(
         use_llm=bool(merged["use_llm"]),
         gemini_api_key=str(merged["gemini_api_key"]),
         use_llm_abbreviation_expansion=bool(merged["use_llm_abbreviation_expansion"]),
         use_llm_judge=bool(merged["use_llm_judge"]),
         high_confidence_threshold=float(merged["high_confidence_threshold"]),
+        reranker_processes=int(merged["reranker_processes"]),
+        reranker_threads_per_process=int(merged["reranker_threads_per_process"]),
+        reranker_adaptive_max_length=bool(merged["reranker_adaptive_max_length"]),
+        embedding_processes=int(merged["embedding_processes"]),
+        vector_backend=str(merged["vector_backend"]),
+        vector_shards=int(merged["vector_shards"]),
+        vector_shard_by=str(merged["vector_shard_by"]),
+        vector_space=str(merged["vector_space"]),
+        hnsw_max_neighbors=int(merged["hnsw_max_neighbors"]),
+        hnsw_ef_construction=int(merged["hnsw_ef_construction"]),
+        hnsw_ef_search=int(merged["hnsw_ef_search"]),
+        inference_mode=str(merged["inference_mode"]),
+        inference_workers=int(merged["inference_workers"]),
+        inference_threads_per_worker=int(merged["inference_threads_per_worker"]),
+        dedup_near_duplicates=bool(merged["dedup_near_duplicates"]),
+        dedup_similarity=float(merged["dedup_similarity"]),
+        retrieval_unit_filter=bool(merged["retrieval_unit_filter"]),
+        retrieval_price_band=float(merged["retrieval_price_band"]),
+        attribute_prefilter=bool(merged["attribute_prefilter"]),
+        attribute_rules_path=str(merged["attribute_rules_path"]),
+        checkpoint_retention_hours=float(merged["checkpoint_retention_hours"]),
+        interrupted_checkpoint_retention_hours=float(merged["interrupted_checkpoint_retention_hours"]),
+        query_result_cache=bool(merged["query_result_cache"]),
     )
 
 
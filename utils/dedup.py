@@ -0,0 +1,183 @@
+"""Collapse of near-duplicate catalog descriptions before embedding.
+
+Invoice descriptions of the same product often differ only in accents,
+casing, punctuation or spacing ("CAFÉ  PILÃO 500G" / "cafe pilao 500g.").
+``collapse_catalog`` merges rows whose normalized descriptions are equal
+and, optionally, rows whose character n-gram sets are nearly equal
+(MinHash with LSH banding, merged with union-find). Quantities and values
+are summed per cluster, so the mean value stays weighted by quantity.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+_NON_WORD = re.compile(r"[^\w]+")
+_DIGITS = re.compile(r"\d+")
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_description(text: str) -> str:
+    """Casefold, strip accents, and turn punctuation and runs of spaces into single spaces."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", without_accents.casefold()).replace("_", " ").strip()
+
+
+@dataclass
+class DedupReport:
+    """How much a catalog shrank."""
+
+    input_rows: int
+    # Distinct descriptions before any merge
+    distinct_descriptions: int
+    # Groups after exact-after-normalization merge
+    normalized_groups: int
+    # Groups after the optional near-duplicate merge
+    output_rows: int
+
+    @property
+    def shrink_ratio(self) -> float:
+        """Fraction of distinct descriptions removed by the collapse."""
+        return 1 - self.output_rows / max(1, self.distinct_descriptions)
+
+    def summary(self) -> str:
+        return (
+            f"{self.distinct_descriptions} descrições distintas → {self.normalized_groups} após normalização"
+            f" → {self.output_rows} após agrupar quase-duplicatas ({self.shrink_ratio:.1%} a menos)"
+        )
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = np.arange(size)
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return int(root)
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _shingles(text: str, ngram: int) -> set[int]:
+    padded = f" {text} "
+    if len(padded) <= ngram:
+        return {zlib.crc32(padded.encode())}
+    return {zlib.crc32(padded[i : i + ngram].encode()) for i in range(len(padded) - ngram + 1)}
+
+
+def minhash_signatures(texts: list[str], num_perm: int = 64, ngram: int = 3, seed: int = 0) -> np.ndarray:
+    """MinHash signature ``[len(texts), num_perm]`` of each text's character n-grams."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for row, text in enumerate(texts):
+        shingles = np.fromiter(_shingles(text, ngram), dtype=np.uint64)
+        # Universal hashing (a*x + b) mod p; the product wraps at 2**64, which keeps it a valid hash family
+        hashed = (shingles[:, None] * a[None, :] + b[None, :]) % np.uint64(_MERSENNE_PRIME)
+        signatures[row] = hashed.min(axis=0)
+    return signatures
+
+
+def near_duplicate_clusters(
+    texts: list[str], threshold: float = 0.9, num_perm: int = 64, bands: int = 16, ngram: int = 3
+) -> np.ndarray:
+    """Cluster label of each text; texts with estimated n-gram Jaccard >= *threshold* share one.
+
+    Candidate pairs come from LSH banding of the MinHash signatures and are
+    confirmed on the signature estimate, so only similar texts are compared.
+    Texts are only merged when their numbers agree — same digit tokens, or
+    the same quantities once units are converted — so "500G" and "600G"
+    stay apart however similar the rest is.
+    """
+    # utils.attributes imports this module
+    from utils.attributes import extract_units
+
+    if not texts:
+        return np.empty(0, dtype=np.int64)
+    digits = [sorted(_DIGITS.findall(text)) for text in texts]
+    units = [sorted((unit.family, round(unit.size, 6)) for unit in extract_units(text)) for text in texts]
+    signatures = minhash_signatures(texts, num_perm, ngram)
+    rows_per_band = num_perm // bands
+    clusters = _UnionFind(len(texts))
+
+    for band in range(bands):
+        buckets: dict[bytes, list[int]] = {}
+        chunk = signatures[:, band * rows_per_band : (band + 1) * rows_per_band]
+        for i in range(len(texts)):
+            buckets.setdefault(chunk[i].tobytes(), []).append(i)
+        for members in buckets.values():
+            first = members[0]
+            for other in members[1:]:
+                if clusters.find(first) == clusters.find(other):
+                    continue
+                same_numbers = digits[first] == digits[other] or (units[first] and units[first] == units[other])
+                if same_numbers and np.mean(signatures[first] == signatures[other]) >= threshold:
+                    clusters.union(first, other)
+
+    return np.array([clusters.find(i) for i in range(len(texts))])
+
+
+def collapse_catalog(
+    df: pd.DataFrame, near_duplicates: bool = False, threshold: float = 0.9
+) -> tuple[pd.DataFrame, DedupReport]:
+    """Merge rows describing the same product.
+
+    Args:
+        df: Rows with ``description``, ``quantity`` and ``value`` (line total)
+        near_duplicates: Also merge descriptions with similar character n-grams
+        threshold: Estimated Jaccard similarity for a near-duplicate merge
+
+    Returns:
+        One row per product with ``description`` (the most frequent original
+        spelling), ``quantity``, ``total_value`` and ``rows`` (sums), and the report
+    """
+    grouped = df.groupby("description", as_index=False, sort=False).agg(
+        quantity=("quantity", "sum"),
+        total_value=("value", "sum"),
+        rows=("value", "size"),
+    )
+    grouped["normalized"] = grouped["description"].map(normalize_description)
+    normalized = grouped["normalized"].unique().tolist()
+
+    cluster_of = dict(zip(normalized, range(len(normalized))))
+    if near_duplicates:
+        labels = near_duplicate_clusters(normalized, threshold)
+        cluster_of = dict(zip(normalized, labels.tolist()))
+    grouped["cluster"] = grouped["normalized"].map(cluster_of)
+
+    # The spelling seen on most rows represents its cluster
+    representative = (
+        grouped.sort_values(["rows", "description"], ascending=[False, True])
+        .drop_duplicates("cluster")
+        .set_index("cluster")["description"]
+    )
+    collapsed = grouped.groupby("cluster", as_index=False, sort=False).agg(
+        quantity=("quantity", "sum"),
+        total_value=("total_value", "sum"),
+        rows=("rows", "sum"),
+    )
+    collapsed.insert(0, "description", collapsed["cluster"].map(representative))
+    collapsed = collapsed.drop(columns="cluster")
+
+    report = DedupReport(
+        input_rows=len(df),
+        distinct_descriptions=len(grouped),
+        normalized_groups=len(normalized),
+        output_rows=len(collapsed),
+    )
+    return collapsed, report
@@ -6,6 +6,23 @@ from typing import Optional
 from utils.ai import PesquisaPrompt
 
 
+@dataclass
+class PipelineParams:
+    """Tunable thresholds of the matching pipeline.
+
+    ``n_results`` and ``max_distance`` drive retrieval; the remaining fields
+    only drive the filter and split stages, so they can be changed after a
+    run by re-filtering the stored scores. ``max_distance`` is in the
+    collection's distance space; the default is for cosine distance.
+    """
+
+    n_results: int = 5
+    max_distance: float = 0.955
+    score_threshold: float = 0.8
+    gap_threshold: float = 0.1
+    high_confidence_threshold: float = 0.9
+
+
 @dataclass
 class QueryMatch:
     """A query paired with its candidate document matches.
@@ -1,5 +1,57 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+import numpy as np
 from chromadb.utils import embedding_functions
 
-emb_fn_bge_m3 = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="BAAI/bge-m3"
-)
\ No newline at end of file
+embedding_model_name = "BAAI/bge-m3"
+_emb_fn_bge_m3: embedding_functions.SentenceTransformerEmbeddingFunction | None = None
+_emb_fn_lock = threading.Lock()
+
+
+def get_embedding_function() -> embedding_functions.SentenceTransformerEmbeddingFunction:
+    """The bge-m3 embedding function, loaded on first use (so importing this module stays cheap)."""
+    global _emb_fn_bge_m3
+    with _emb_fn_lock:
+        if _emb_fn_bge_m3 is None:
+            _emb_fn_bge_m3 = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=embedding_model_name)
+        return _emb_fn_bge_m3
+
+
+def embed_documents(texts: list[str], pool: Any = None, batch_size: int = 32) -> np.ndarray:
+    """Embed *texts* exactly as the bge-m3 embedding function would, optionally on a multi-process *pool*.
+
+    Args:
+        texts: Documents to embed
+        pool: Pool from ``embedding_pool``; None encodes in this process
+        batch_size: Model batch size
+
+    Returns:
+        float32 array of shape ``(len(texts), dim)``
+    """
+    emb_fn = get_embedding_function()
+    embeddings = emb_fn._model.encode(
+        texts,
+        pool=pool,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=emb_fn.normalize_embeddings,
+        show_progress_bar=False,
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+@contextmanager
+def embedding_pool(processes: int) -> Iterator[Any]:
+    """Start a sentence-transformers pool of *processes* CPU workers (None if processes <= 1)."""
+    if processes <= 1:
+        yield None
+        return
+
+    model = get_embedding_function()._model
+    pool = model.start_multi_process_pool(target_devices=["cpu"] * processes)
+    try:
+        yield pool
+    finally:
+        model.stop_multi_process_pool(pool)
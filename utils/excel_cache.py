@@ -0,0 +1,128 @@
+"""
+Cache of parsed spreadsheets.
+
+Parsing XLSX is by far the slowest way to load a table, and the same
+files are read again and again. ``read_excel_cached`` keys the parsed
+DataFrame by the SHA-256 of the file's content plus the read parameters
+and stores it as Parquet, so later reads take milliseconds. Frames Parquet
+cannot hold (mixed-type columns, non-string column names, the dict
+returned for ``sheet_name=None``) are pickled instead. A single frame
+carries the name of the sheet it came from in ``attrs["sheet_name"]``, so
+``sheet_name=0`` callers learn the first sheet's name from a cache hit.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pyarrow
+
+from utils.config import OUTPUT_PATH
+
+DEFAULT_EXCEL_CACHE_DIR = OUTPUT_PATH / "cache" / "excel"
+# Bump when the stored format changes, so old entries are ignored
+_CACHE_FORMAT = 2
+# What a damaged or incompatible cache file raises when read, and what a frame Parquet cannot hold raises when written
+_UNREADABLE = (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError, pyarrow.ArrowException)
+_NOT_PARQUET = (pyarrow.ArrowException, TypeError, ValueError)
+
+
+def content_digest(source: str | os.PathLike | bytes, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's content (*source* is a path or the bytes themselves)."""
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_key(digest: str, read_kwargs: dict[str, Any]) -> str:
+    params = json.dumps(read_kwargs, sort_keys=True, default=str)
+    return hashlib.sha256(f"{_CACHE_FORMAT}|{digest}|{params}".encode()).hexdigest()
+
+
+def _write_atomic(path: Path, write) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _prune(cache_dir: Path, max_entries: int) -> None:
+    entries = sorted(
+        (p for p in cache_dir.iterdir() if p.suffix in (".parquet", ".pkl")),
+        key=lambda p: p.stat().st_mtime,
+    )
+    for stale in entries[: max(0, len(entries) - max_entries)]:
+        try:
+            stale.unlink()
+        except OSError:
+            pass
+
+
+def read_excel_cached(
+    source: str | os.PathLike | bytes,
+    cache_dir: Path = DEFAULT_EXCEL_CACHE_DIR,
+    max_entries: int = 64,
+    **read_kwargs: Any,
+) -> pd.DataFrame | dict[str, pd.DataFrame]:
+    """``pd.read_excel(source, **read_kwargs)``, served from the cache when possible.
+
+    Args:
+        source: Path of the spreadsheet, or its bytes
+        cache_dir: Where parsed frames are stored
+        max_entries: Cached frames kept; the least recently used are deleted
+        **read_kwargs: Passed to ``pd.read_excel`` and part of the cache key
+
+    Returns:
+        Whatever ``pd.read_excel`` returns for these arguments
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    key = _cache_key(content_digest(source), read_kwargs)
+    parquet_path = cache_dir / f"{key}.parquet"
+    pickle_path = cache_dir / f"{key}.pkl"
+
+    for path, load in ((parquet_path, pd.read_parquet), (pickle_path, pd.read_pickle)):
+        if path.exists():
+            try:
+                result = load(path)
+                os.utime(path)
+                return result
+            except _UNREADABLE as e:
+                print(f"Error loading cached spreadsheet {path.name}: {e}")
+
+    read_kwargs = dict(read_kwargs)
+    engine = read_kwargs.pop("engine", None)
+    with pd.ExcelFile(io.BytesIO(source) if isinstance(source, bytes) else source, engine=engine) as workbook:
+        result = workbook.parse(**read_kwargs)
+        sheet = read_kwargs.get("sheet_name", 0)
+        if isinstance(result, pd.DataFrame):
+            result.attrs["sheet_name"] = workbook.sheet_names[sheet] if isinstance(sheet, int) else sheet
+
+    try:
+        if not isinstance(result, pd.DataFrame):
+            raise TypeError("not a single DataFrame")
+        _write_atomic(parquet_path, lambda tmp: result.to_parquet(tmp, engine="pyarrow", index=True))
+    except _NOT_PARQUET:
+        # Mixed-type columns, non-string column names or several sheets
+        _write_atomic(pickle_path, lambda tmp: pd.to_pickle(result, tmp, protocol=pickle.HIGHEST_PROTOCOL))
+    _prune(cache_dir, max_entries)
+    return result
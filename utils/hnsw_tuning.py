@@ -0,0 +1,169 @@
+"""HNSW tuning report on a real catalog.
+
+Rebuilds the catalog's vectors into throw-away Chroma collections with
+different HNSW parameters and compares each against exact search:
+
+    python -m utils.hnsw_tuning <collection-name> [--space cosine] [--target-recall 0.99]
+
+For each (max_neighbors, ef_construction) it reports the build time, and
+for each ef_search the mean query latency and recall@k. It then suggests
+the fastest setting that reaches the target recall, as ``config.json`` keys.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import chromadb
+import numpy as np
+
+from utils.vector_store import ChromaVectorStore, IndexSettings, NumpyVectorStore, get_chroma_client
+
+
+def load_collection_vectors(name: str, page_size: int = 5000) -> tuple[list[str], np.ndarray]:
+    """Read every ID and embedding of the Chroma collection *name*."""
+    collection = get_chroma_client().get_collection(name)
+    ids: list[str] = []
+    vectors: list[np.ndarray] = []
+    for offset in range(0, collection.count(), page_size):
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+    return ids, np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+
+def _recall(approx: list[list[str]], exact: list[list[str]]) -> float:
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+    return hits / max(1, sum(len(e) for e in exact))
+
+
+def tune(
+    ids: list[str],
+    vectors: np.ndarray,
+    space: str = "cosine",
+    k: int = 5,
+    num_queries: int = 200,
+    max_neighbors: tuple[int, ...] = (8, 16, 32),
+    ef_construction: tuple[int, ...] = (100, 200),
+    ef_search: tuple[int, ...] = (10, 20, 50, 100, 200),
+    seed: int = 0,
+) -> list[dict[str, Any]]:
+    """Measure every parameter combination on *vectors*.
+
+    A random sample of *num_queries* catalog rows is held out as queries
+    and the rest is indexed, so queries are realistic but not trivially
+    matched to themselves.
+
+    Returns:
+        One row per combination with the settings, ``build_seconds``,
+        ``query_ms`` (per query) and ``recall``
+    """
+    rng = np.random.default_rng(seed)
+    held_out = rng.choice(len(ids), size=min(num_queries, len(ids) // 10 or 1), replace=False)
+    is_query = np.zeros(len(ids), dtype=bool)
+    is_query[held_out] = True
+    queries = vectors[is_query]
+    doc_ids = [doc_id for doc_id, q in zip(ids, is_query) if not q]
+    docs = vectors[~is_query]
+
+    rows: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        exact_store = NumpyVectorStore(Path(tmp), space=space)
+        exact_store.upsert(doc_ids, doc_ids, docs)
+        exact = exact_store.query(queries, k)["ids"]
+
+        client = chromadb.EphemeralClient()
+        for m, efc in itertools.product(max_neighbors, ef_construction):
+            settings = IndexSettings(space=space, max_neighbors=m, ef_construction=efc)
+            name = f"tuning-m{m}-c{efc}"
+            collection = client.create_collection(
+                name=name, configuration=settings.hnsw_configuration(), embedding_function=None  # type: ignore
+            )
+            store = ChromaVectorStore(collection)
+
+            start = time.perf_counter()
+            for i in range(0, len(doc_ids), 5000):
+                store.upsert(doc_ids[i : i + 5000], doc_ids[i : i + 5000], docs[i : i + 5000])
+            build_seconds = time.perf_counter() - start
+
+            for ef in ef_search:
+                collection.modify(configuration={"hnsw": {"ef_search": ef}})
+                start = time.perf_counter()
+                approx = store.query(queries, k)["ids"]
+                query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+                rows.append(
+                    {
+                        "max_neighbors": m,
+                        "ef_construction": efc,
+                        "ef_search": ef,
+                        "build_seconds": build_seconds,
+                        "query_ms": query_ms,
+                        "recall": _recall(approx, exact),
+                    }
+                )
+            client.delete_collection(name)
+    return rows
+
+
+def suggest(rows: list[dict[str, Any]], target_recall: float = 0.99) -> dict[str, Any]:
+    """Pick the fastest-querying row reaching *target_recall* (the best recall if none does)."""
+    good = [row for row in rows if row["recall"] >= target_recall]
+    if good:
+        return min(good, key=lambda row: (row["query_ms"], row["build_seconds"]))
+    return max(rows, key=lambda row: (row["recall"], -row["query_ms"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HNSW recall/latency tuning on a catalog collection")
+    parser.add_argument("collection", help="Chroma collection name (slugified file name)")
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], default="cosine")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-neighbors", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[10, 20, 50, 100, 200])
+    parser.add_argument("--target-recall", type=float, default=0.99)
+    args = parser.parse_args()
+
+    ids, vectors = load_collection_vectors(args.collection)
+    print(f"{len(ids)} vetores carregados de {args.collection}")
+
+    rows = tune(
+        ids,
+        vectors,
+        space=args.space,
+        k=args.k,
+        num_queries=args.queries,
+        max_neighbors=tuple(args.max_neighbors),
+        ef_construction=tuple(args.ef_construction),
+        ef_search=tuple(args.ef_search),
+    )
+
+    print(f"{'M':>4} {'ef_c':>5} {'ef_s':>5} {'build s':>8} {'ms/query':>9} {'recall@' + str(args.k):>9}")
+    for row in rows:
+        print(
+            f"{row['max_neighbors']:>4} {row['ef_construction']:>5} {row['ef_search']:>5} "
+            f"{row['build_seconds']:>8.2f} {row['query_ms']:>9.3f} {row['recall']:>9.3f}"
+        )
+
+    best = suggest(rows, args.target_recall)
+    if best["recall"] < args.target_recall:
+        print(f"Nenhuma combinação atingiu recall {args.target_recall}; usando a de maior recall.")
+    print("Sugestão para config.json:")
+    print(
+        json.dumps(
+            {
+                "vector_space": args.space,
+                "hnsw_max_neighbors": best["max_neighbors"],
+                "hnsw_ef_construction": best["ef_construction"],
+                "hnsw_ef_search": best["ef_search"],
+            },
+            indent=2,
+        )
+    )
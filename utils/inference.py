@@ -0,0 +1,297 @@
+"""Model inference off the web server process.
+
+With ``inference_mode = "process"`` in ``config.json`` the web process never
+loads a model: embedding and reranking requests travel over multiprocessing
+queues to ``inference_workers`` worker processes, which load each model once
+and keep it. A monitor thread restarts a worker that dies and resubmits the
+requests it was holding. With ``inference_mode = "in_process"`` everything
+runs in the calling process, as before (optionally on the process pools of
+``utils.reranker_pool`` and ``utils.embeddings``).
+
+Callers use the facade and don't care which mode is active:
+``embed_texts``, ``embedder`` (for bulk ingestion) and ``reranker_backend``
+(passed as ``pool`` to ``rerank_matrix``).
+"""
+
+import itertools
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator
+
+import numpy as np
+
+from utils.config import load_config
+
+INFERENCE_MODES = ("process", "in_process")
+
+
+class InferenceError(RuntimeError):
+    """An inference request failed in a worker process."""
+
+
+def _worker_main(requests, responses, threads: int) -> None:
+    """Worker loop: answer ``(request_id, op, args)`` messages until a None arrives."""
+    if threads > 0:
+        import torch
+
+        torch.set_num_threads(threads)
+
+    from utils.embeddings import embed_documents, get_embedding_function
+    from utils.reranker import get_reranker, predict_bucketed
+
+    while (message := requests.get()) is not None:
+        request_id, op, args = message
+        try:
+            if op == "embed":
+                result: Any = embed_documents(*args)
+            elif op == "score":
+                result = predict_bucketed(*args)
+            elif op == "warmup":
+                get_embedding_function()
+                get_reranker()
+                result = None
+            else:
+                raise ValueError(f"Unknown inference op: {op}")
+            responses.put((request_id, True, result))
+        except Exception as e:
+            responses.put((request_id, False, f"{type(e).__name__}: {e}"))
+
+
+@dataclass
+class _Request:
+    future: Future
+    worker: int
+    message: tuple
+    attempts: int = 1
+
+
+class InferenceClient:
+    """
+    Pool of inference worker processes.
+
+    Args:
+        workers: Number of worker processes (each holds its own model copies)
+        threads_per_worker: torch intra-op threads per worker (0 = torch default)
+        start_method: multiprocessing start method (``spawn`` works everywhere)
+        max_attempts: Times a request is sent before a crashing worker fails it
+    """
+
+    def __init__(self, workers: int = 1, threads_per_worker: int = 0, start_method: str = "spawn", max_attempts: int = 2):
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker
+        self.max_attempts = max_attempts
+        self._ctx = multiprocessing.get_context(start_method)
+        self._responses = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending: dict[int, _Request] = {}
+        self._closed = False
+        # Restart backoff per worker: a worker that dies right after starting is not respawned in a tight loop
+        self._restart_delay = [1.0] * self.workers
+        self._next_restart = [0.0] * self.workers
+        self._procs = [self._spawn(i) for i in range(self.workers)]
+
+        self._reader = threading.Thread(target=self._read_responses, name="inference-responses", daemon=True)
+        self._reader.start()
+        threading.Thread(target=self._monitor, name="inference-monitor", daemon=True).start()
+
+    def _spawn(self, index: int):
+        requests = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(requests, self._responses, self.threads_per_worker),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        return process, requests
+
+    # --- request plumbing ---------------------------------------------------
+
+    def _submit(self, op: str, *args: Any) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise InferenceError("Pool de inferência encerrado")
+            request_id = next(self._ids)
+            load = [0] * self.workers
+            for request in self._pending.values():
+                load[request.worker] += 1
+            worker = load.index(min(load))
+            message = (request_id, op, args)
+            self._pending[request_id] = _Request(future, worker, message)
+            self._procs[worker][1].put(message)
+        return future
+
+    def _read_responses(self) -> None:
+        while (item := self._responses.get()) is not None:
+            request_id, ok, result = item
+            with self._lock:
+                request = self._pending.pop(request_id, None)
+                if request is not None:
+                    self._restart_delay[request.worker] = 1.0
+            # None: already answered before a restart resubmitted it
+            if request is None:
+                continue
+            if ok:
+                request.future.set_result(result)
+            else:
+                request.future.set_exception(InferenceError(result))
+
+    def _monitor(self) -> None:
+        while not self._closed:
+            time.sleep(0.5)
+            for index in range(self.workers):
+                with self._lock:
+                    process, requests = self._procs[index]
+                    if self._closed or process.is_alive() or time.monotonic() < self._next_restart[index]:
+                        continue
+                    print(f"Worker de inferência {index} encerrou (código {process.exitcode}); reiniciando...")
+                    requests.cancel_join_thread()
+                    requests.close()
+                    self._procs[index] = self._spawn(index)
+                    self._next_restart[index] = time.monotonic() + self._restart_delay[index]
+                    self._restart_delay[index] = min(self._restart_delay[index] * 2, 60.0)
+
+                    for request_id, request in list(self._pending.items()):
+                        if request.worker != index:
+                            continue
+                        if request.attempts >= self.max_attempts:
+                            del self._pending[request_id]
+                            request.future.set_exception(
+                                InferenceError(f"Worker de inferência encerrou {request.attempts} vez(es) nesta requisição")
+                            )
+                        else:
+                            request.attempts += 1
+                            self._procs[index][1].put(request.message)
+
+    # --- public API ---------------------------------------------------------
+
+    def warm_up(self) -> list[Future]:
+        """Ask every worker to load its models now (one request per worker)."""
+        return [self._submit("warmup") for _ in range(self.workers)]
+
+    def embed(self, texts: list[str], batch_size: int = 32) -> np.ndarray:
+        """Embed *texts* across the workers (see ``utils.embeddings.embed_documents``)."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        shard_size = max(batch_size, math.ceil(len(texts) / self.workers))
+        futures = [
+            self._submit("embed", texts[start : start + shard_size], None, batch_size)
+            for start in range(0, len(texts), shard_size)
+        ]
+        return np.vstack([future.result() for future in futures])
+
+    def predict(self, pairs: list[list[str]], token_budget: int = 8192, adapt_max_length: bool = False) -> list[float]:
+        """Score *pairs* across the workers, in input order (same contract as ``RerankerPool.predict``)."""
+        if not pairs:
+            return []
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        shard_size = max(1, math.ceil(len(pairs) / (self.workers * 4)))
+        futures = [
+            self._submit("score", [pairs[i] for i in order[start : start + shard_size]], token_budget, adapt_max_length)
+            for start in range(0, len(order), shard_size)
+        ]
+
+        scores: list[float] = [0.0] * len(pairs)
+        sorted_scores = (score for future in futures for score in future.result())
+        for i, score in zip(order, sorted_scores):
+            scores[i] = score
+        return scores
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            procs = list(self._procs)
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for request in pending:
+            request.future.set_exception(InferenceError("Pool de inferência encerrado"))
+        for _, requests in procs:
+            requests.put(None)
+        for process, _ in procs:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._responses.put(None)
+        # Let the reader take the sentinel; a reader still blocked at interpreter exit raises during teardown
+        self._reader.join(timeout=5)
+
+
+_shared_client: InferenceClient | None = None
+_shared_client_key: tuple[int, int] | None = None
+_shared_client_lock = threading.Lock()
+
+
+def get_inference_client() -> InferenceClient | None:
+    """Return the worker pool configured in ``config.json``, or None in ``in_process`` mode.
+
+    The pool is created on first use and recreated if the configured sizes change.
+    """
+    global _shared_client, _shared_client_key
+    config = load_config()
+    key = (config.inference_workers, config.inference_threads_per_worker)
+
+    with _shared_client_lock:
+        if _shared_client is not None and (_shared_client_key != key or config.inference_mode != "process"):
+            _shared_client.close()
+            _shared_client = None
+        if _shared_client is None and config.inference_mode == "process":
+            _shared_client = InferenceClient(config.inference_workers, config.inference_threads_per_worker)
+            _shared_client_key = key
+        return _shared_client
+
+
+def shutdown_inference() -> None:
+    """Stop the worker pool, if one was started."""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is not None:
+            _shared_client.close()
+            _shared_client = None
+
+
+def embed_texts(texts: list[str]) -> np.ndarray:
+    """Embed *texts* with bge-m3 in the configured inference mode."""
+    client = get_inference_client()
+    if client is not None:
+        return client.embed(texts)
+
+    from utils.embeddings import embed_documents
+
+    return embed_documents(texts)
+
+
+@contextmanager
+def embedder(processes: int = 0) -> Iterator[Callable[[list[str]], np.ndarray]]:
+    """Yield an embedding function for bulk work (catalog ingestion).
+
+    In ``in_process`` mode *processes* > 1 starts a sentence-transformers
+    pool for the duration of the block; in ``process`` mode the inference
+    workers are used and *processes* is ignored.
+    """
+    client = get_inference_client()
+    if client is not None:
+        yield client.embed
+        return
+
+    from utils.embeddings import embed_documents, embedding_pool
+
+    with embedding_pool(processes) as pool:
+        yield lambda texts: embed_documents(texts, pool=pool)
+
+
+def reranker_backend():
+    """What to pass as ``pool`` to ``rerank_matrix``: the inference workers, a RerankerPool or None."""
+    client = get_inference_client()
+    if client is not None:
+        return client
+
+    from utils.reranker_pool import get_reranker_pool
+
+    return get_reranker_pool()
@@ -1,8 +1,10 @@
 import pandas as pd
 
+from utils.excel_cache import read_excel_cached
+
 def get_pesquisa(pesquisa_path : str) -> pd.DataFrame:
 
-    df_pesquisa = pd.read_excel(pesquisa_path, skiprows=16, sheet_name='Planilha1')
+    df_pesquisa = read_excel_cached(pesquisa_path, skiprows=16, sheet_name='Planilha1')
 
     if 'DESCRIÇÃO' not in df_pesquisa.columns:
         raise KeyError("Coluna 'DESCRIÇÃO' não encontrada no DataFrame.")
@@ -20,7 +22,7 @@ def get_notas_fiscais(file_path : str, description_filter=None, sheet_name=None)
         DataFrame with product descriptions, quantities, and average unit prices
     """
 
-    df = pd.read_excel(file_path, skiprows=4, sheet_name=sheet_name)
+    df = read_excel_cached(file_path, skiprows=4, sheet_name=sheet_name)
     
     # 2. Filtrar as linhas onde 'descr_compl' contém a palavra "PNEU"
     if description_filter:
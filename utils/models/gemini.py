@@ -1,26 +1,46 @@
 # Import from parent module
+import asyncio
+import concurrent.futures
+import hashlib
+import json
 import sys
+import threading
 import uuid
+from collections.abc import Callable, Iterator
+from dataclasses import asdict
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Protocol
 
 from google import genai
 
 sys.path.append(str(Path(__file__).parent.parent))
 from ai import BasePrompt, Candidates, PesquisaPrompt, PromptResult
+from batch_store import COMPLETED_STATES, BatchRecord, batch_store
 from config import load_config
 from exceptions import MissingGeminiApiKeyError
 
+MODEL_NAME = "gemini-2.5-flash"
 
-if not load_config().gemini_api_key:
-    raise MissingGeminiApiKeyError()
-client = genai.Client(api_key=load_config().gemini_api_key)
+_client: genai.Client | None = None
+
+
+def _get_client() -> genai.Client:
+    """Create the Gemini client on first use so the module can be imported without a key."""
+    global _client
+    if _client is None:
+        api_key = load_config().gemini_api_key
+        if not api_key:
+            raise MissingGeminiApiKeyError()
+        _client = genai.Client(api_key=api_key)
+    return _client
 
 
 def make_prompt(prompt: BasePrompt) -> BasePrompt.PromptResult:
     """Make a single prompt request to Gemini API and return the structured result."""
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
+    response = _get_client().models.generate_content(
+        model=MODEL_NAME,
         contents=prompt.build(),
         config={
             "response_mime_type": "application/json",
@@ -31,6 +51,86 @@ def make_prompt(prompt: BasePrompt) -> BasePrompt.PromptResult:
     return result
 
 
+# --- Batch service ----------------------------------------------------------
+
+
+class BatchService(Protocol):
+    """The subset of the Gemini batch API used here.
+
+    Job objects only need ``name``, ``state.name``, ``error`` and
+    ``dest.inlined_responses`` (each with ``response.text`` and ``error``).
+    """
+
+    def create(self, *, model: str, src: list[dict], config: dict) -> Any: ...
+
+    async def get(self, *, name: str) -> Any: ...
+
+
+class GeminiBatchService:
+    """Talks to the real Gemini batch API."""
+
+    def create(self, *, model: str, src: list[dict], config: dict) -> Any:
+        return _get_client().batches.create(model=model, src=src, config=config)  # type: ignore
+
+    async def get(self, *, name: str) -> Any:
+        return await _get_client().aio.batches.get(name=name)
+
+
+class LocalBatchService:
+    """
+    In-process stand-in for the batch API.
+
+    Answers each request with *responder* (prompt text -> JSON string) once
+    the job has been polled *polls_until_done* times.
+
+    Args:
+        responder: Callable producing the JSON response for a prompt text
+        polls_until_done: Number of ``get`` calls that report the job as running
+    """
+
+    def __init__(self, responder: Callable[[str], str], polls_until_done: int = 1):
+        self.responder = responder
+        self.polls_until_done = polls_until_done
+        self._jobs: dict[str, dict[str, Any]] = {}
+
+    def create(self, *, model: str, src: list[dict], config: dict) -> Any:
+        name = f"batches/local-{uuid.uuid4().hex[:12]}"
+        self._jobs[name] = {"src": src, "polls": 0}
+        return SimpleNamespace(name=name, state=SimpleNamespace(name="JOB_STATE_PENDING"))
+
+    async def get(self, *, name: str) -> Any:
+        job = self._jobs[name]
+        job["polls"] += 1
+        if job["polls"] < self.polls_until_done:
+            return SimpleNamespace(name=name, state=SimpleNamespace(name="JOB_STATE_RUNNING"))
+
+        responses = [
+            SimpleNamespace(
+                response=SimpleNamespace(text=self.responder(request["contents"][0]["parts"][0]["text"])),
+                error=None,
+            )
+            for request in job["src"]
+        ]
+        return SimpleNamespace(
+            name=name,
+            state=SimpleNamespace(name="JOB_STATE_SUCCEEDED"),
+            error=None,
+            dest=SimpleNamespace(inlined_responses=responses),
+        )
+
+
+batch_service: BatchService = GeminiBatchService()
+
+
+def set_batch_service(service: BatchService) -> None:
+    """Replace the remote batch API, e.g. with a ``LocalBatchService`` in tests."""
+    global batch_service
+    batch_service = service
+
+
+# --- Batch helpers ----------------------------------------------------------
+
+
 def _build_batch_request(prompt: PesquisaPrompt) -> dict:
     """Build a single batch request for Gemini API."""
     return {
@@ -42,126 +142,232 @@ def _build_batch_request(prompt: PesquisaPrompt) -> dict:
     }
 
 
-def _process_inline_response(inline_response, prompt: PesquisaPrompt) -> PromptResult:
-    """Process a single inline response and return PromptResult."""
+def _fingerprint(prompts: list[PesquisaPrompt]) -> str:
+    """Hash of the prompt texts, used to find an earlier submission of the same batch."""
+    payload = json.dumps([MODEL_NAME] + [p.build() for p in prompts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _serialize_prompt(prompt: PesquisaPrompt) -> dict[str, Any]:
+    return asdict(prompt)
+
+
+def _deserialize_prompt(data: dict[str, Any]) -> PesquisaPrompt:
+    return PesquisaPrompt(
+        id=data["id"],
+        item_description=data["item_description"],
+        items=[PesquisaPrompt.Item(**item) for item in data["items"]],
+        limit=data.get("limit", 3),
+    )
+
+
+def _parse_inline_response(inline_response, prompt_id) -> list[dict[str, Any]]:
+    """Parse a single inline response into candidate dicts (empty on error)."""
     if inline_response.error:
-        print(f"Error for prompt {prompt.id}: {inline_response.error}")
-        return PromptResult(prompt=prompt, candidates=[])
+        print(f"Error for prompt {prompt_id}: {inline_response.error}")
+        return []
 
     if not inline_response.response:
-        print(f"No response for prompt {prompt.id}")
-        return PromptResult(prompt=prompt, candidates=[])
+        print(f"No response for prompt {prompt_id}")
+        return []
 
     try:
         candidates = Candidates.model_validate_json(inline_response.response.text)
-        print(
-            f"Received {len(candidates.candidates)} candidates for prompt ID {prompt.id}"
-        )
-        return PromptResult(prompt=prompt, candidates=candidates.candidates)
+        print(f"Received {len(candidates.candidates)} candidates for prompt ID {prompt_id}")
+        return [c.model_dump() for c in candidates.candidates]
     except Exception as e:
-        print(f"Error parsing response for prompt {prompt.id}: {e}")
-        return PromptResult(prompt=prompt, candidates=[])
-
-
-def _poll_batch_job(batch_job, poll_interval: int = 30):
-    """Poll batch job until completion."""
-    import time
-
-    completed_states = {
-        "JOB_STATE_SUCCEEDED",
-        "JOB_STATE_FAILED",
-        "JOB_STATE_CANCELLED",
-        "JOB_STATE_EXPIRED",
-    }
+        print(f"Error parsing response for prompt {prompt_id}: {e}")
+        return []
 
-    while batch_job.state.name not in completed_states:
-        print(f"Job state: {batch_job.state.name}. Waiting {poll_interval} seconds...")
-        time.sleep(poll_interval)
-        batch_job = client.batches.get(name=batch_job.name)
 
-    print(f"Job finished with state: {batch_job.state.name}")
-    return batch_job
+def _finalize_record(record: BatchRecord, batch_job) -> BatchRecord:
+    """Store the outcome of a finished job in *record* and persist it."""
+    record.state = batch_job.state.name
+    prompt_ids = record.prompt_ids
 
-
-def _yield_batch_results(batch_job, prompts: list[PesquisaPrompt]):
-    """Yield results from a completed batch job."""
-    if batch_job.state.name != "JOB_STATE_SUCCEEDED":
-        print(f"Batch job failed with state: {batch_job.state.name}")
-        if batch_job.error:
+    if record.state != "JOB_STATE_SUCCEEDED":
+        print(f"Batch job failed with state: {record.state}")
+        if getattr(batch_job, "error", None):
             print(f"Error: {batch_job.error}")
-        for prompt in prompts:
-            yield PromptResult(prompt=prompt, candidates=[])
-        return
-
-    if not batch_job.dest or not batch_job.dest.inlined_responses:
+        record.results = [[] for _ in prompt_ids]
+    elif not batch_job.dest or not batch_job.dest.inlined_responses:
         print("No inline responses found in batch job result")
-        for prompt in prompts:
-            yield PromptResult(prompt=prompt, candidates=[])
-        return
+        record.results = [[] for _ in prompt_ids]
+    else:
+        record.results = [
+            _parse_inline_response(inline_response, prompt_id)
+            for inline_response, prompt_id in zip(batch_job.dest.inlined_responses, prompt_ids)
+        ]
 
-    for i, inline_response in enumerate(batch_job.dest.inlined_responses):
-        yield _process_inline_response(inline_response, prompts[i])
+    batch_store.save(record)
+    return record
 
 
-def get_candidates_gemini(queries: list[str], results: list[list[PesquisaPrompt.Item]]):
+class _BatchPoller:
     """
-    Fetch candidates using Gemini Batch API (50% cost reduction).
-    Submits all queries as a batch job, waits for completion, then yields (queries, results) tuples.
-
-    Args:
-      queries: List of query strings
-      results: List of lists of PesquisaPrompt.Item objects
+    Watches in-flight batch jobs from a single background event loop.
 
-    Yields:
-      Tuples of (list[str], list[list[PesquisaPrompt.Item]]) representing processed queries and their results
+    Each job is a coroutine on that loop, so waiting on many jobs costs no
+    threads. The poll interval starts at *initial_interval*, grows by
+    *backoff* while the job state is unchanged and resets whenever it moves.
+    A job whose status cannot be fetched *max_errors* times in a row fails.
     """
-    # Build prompts from queries and results
-    prompts = []
-    query_index_map = {}  # Map prompt to original index
-    for i, (query, result_items) in enumerate(zip(queries, results)):
-        prompt = PesquisaPrompt(id=i, item_description=query, items=result_items)
-        prompts.append(prompt)
-        query_index_map[id(prompt)] = i
-
-    # Create inline requests with structured output config
+
+    def __init__(
+        self, initial_interval: float = 2.0, max_interval: float = 60.0, backoff: float = 1.5, max_errors: int = 10
+    ):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_errors = max_errors
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+        self._watches: dict[str, concurrent.futures.Future] = {}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name="gemini-batch-poller", daemon=True).start()
+        return self._loop
+
+    def watch(self, name: str) -> "concurrent.futures.Future[BatchRecord]":
+        """Start watching job *name* (once) and return a future for its finished record."""
+        with self._lock:
+            future = self._watches.get(name)
+            if future is not None:
+                return future
+            future = asyncio.run_coroutine_threadsafe(self._poll(name), self._ensure_loop())
+            self._watches[name] = future
+        # Outside the lock: a job that already finished runs the callback inline
+        future.add_done_callback(lambda done: self._forget(name, done))
+        return future
+
+    def _forget(self, name: str, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            if self._watches.get(name) is future:
+                del self._watches[name]
+
+    async def _poll(self, name: str) -> BatchRecord:
+        record = batch_store.load(name)
+        if record is None:
+            raise KeyError(f"Unknown batch job: {name}")
+
+        interval = self.initial_interval
+        last_state = record.state
+        errors = 0
+        while True:
+            try:
+                batch_job = await batch_service.get(name=name)
+                errors = 0
+            except Exception as e:
+                errors += 1
+                print(f"Error polling batch job {name} ({errors}/{self.max_errors}): {e}")
+                if errors >= self.max_errors:
+                    raise RuntimeError(f"Batch job {name} could not be polled {errors} times in a row") from e
+                batch_job = None
+
+            if batch_job is not None:
+                state = batch_job.state.name
+                if state in COMPLETED_STATES:
+                    print(f"Job finished with state: {state}")
+                    return _finalize_record(record, batch_job)
+                if state != last_state:
+                    record.state = last_state = state
+                    batch_store.save(record)
+                    interval = self.initial_interval
+
+            print(f"Job state: {last_state}. Waiting {interval:.1f} seconds...")
+            await asyncio.sleep(interval)
+            interval = min(interval * self.backoff, self.max_interval)
+
+
+_poller = _BatchPoller()
+
+
+def _submit_batch(prompts: list[PesquisaPrompt], fingerprint: str) -> BatchRecord:
+    """Create the remote batch job and persist it before waiting on it."""
     inline_requests = [_build_batch_request(prompt) for prompt in prompts]
 
-    # Create batch job
     print(f"Creating batch job with {len(prompts)} requests...")
-    batch_job = client.batches.create(
-        model="gemini-2.5-flash",
+    batch_job = batch_service.create(
+        model=MODEL_NAME,
         src=inline_requests,
         config={"display_name": f"candidates-batch-{uuid.uuid4().hex[:8]}"},
     )
-
     print(f"Batch job created: {batch_job.name}")
 
-    # Poll for completion
-    batch_job = _poll_batch_job(batch_job)
-
-    # Process results and reconstruct as (queries, results) tuples
-    processed_queries = []
-    processed_results = []
-
-    for i, prompt_result in enumerate(_yield_batch_results(batch_job, prompts)):
-        # Extract the candidates and convert back to PesquisaPrompt.Item format
-        result_items = []
-        for candidate in prompt_result.candidates:
-            # Find the matching item from original results based on description
-            original_items = results[i]
-            matching_item = next(
-                (
-                    item
-                    for item in original_items
-                    if item.description == candidate.description
-                ),
-                None,
-            )
-            if matching_item:
-                result_items.append(matching_item)
+    record = BatchRecord(
+        name=batch_job.name,
+        fingerprint=fingerprint,
+        model=MODEL_NAME,
+        prompts=[_serialize_prompt(p) for p in prompts],
+        state=batch_job.state.name,
+    )
+    batch_store.save(record)
+    return record
+
+
+async def wait_for_batch(name: str) -> BatchRecord:
+    """Await the finished record of job *name* from an async context."""
+    return await asyncio.wrap_future(_poller.watch(name))
+
+
+def resume_pending_batches() -> int:
+    """Resume watching every batch job that was still running at the last shutdown.
+
+    Finished results are written back to the batch store, where the next
+    ``stream_prompt_results_gemini`` call for the same prompts picks them up.
+
+    Returns:
+        Number of jobs being watched
+    """
+    pending = batch_store.pending()
+    for record in pending:
+        print(f"Resuming batch job {record.name} ({len(record.prompts)} prompts)")
+        _poller.watch(record.name)
+    return len(pending)
+
+
+def _yield_batch_results(record: BatchRecord):
+    """Yield PromptResults from a finished batch record."""
+    for prompt_data, candidates in zip(record.prompts, record.results or []):
+        yield PromptResult(
+            prompt=_deserialize_prompt(prompt_data),
+            candidates=Candidates(candidates=candidates).candidates,  # type: ignore[arg-type]
+        )
+
+
+def stream_prompt_results_gemini(prompts: list[PesquisaPrompt], **_: Any) -> Iterator[PromptResult]:
+    """
+    Judge *prompts* using Gemini Batch API (50% cost reduction).
+    Submits all prompts as a batch job and yields one PromptResult per prompt
+    as soon as the job completes.
 
-        processed_queries.append(queries[i])
-        processed_results.append(result_items)
+    The submission is persisted, so if the same prompts were already sent
+    (e.g. before a restart) the existing job is reused instead of paying again.
 
-    # Yield as a single tuple
-    yield (processed_queries, processed_results)
+    Args:
+      prompts: Prompts to send; their ``id`` is carried over to the results
+      **_: Options of other providers (e.g. Ollama's ``concurrency``), ignored
+
+    Yields:
+      PromptResult for each prompt, in submission order
+    """
+    fingerprint = _fingerprint(prompts)
+    record = batch_store.find_by_fingerprint(fingerprint)
+    if record is not None and record.is_completed and record.state != "JOB_STATE_SUCCEEDED":
+        batch_store.delete(record.name)
+        record = None
+    if record is None:
+        record = _submit_batch(prompts, fingerprint)
+    else:
+        print(f"Reusing batch job {record.name} (state: {record.state})")
+
+    # Wait on the shared poller; returns as soon as the job finishes
+    if record.results is None:
+        record = _poller.watch(record.name).result()
+
+    yield from _yield_batch_results(record)
+
+    # Results have been handed over; the record is no longer needed
+    batch_store.delete(record.name)
@@ -1,62 +1,125 @@
 # Import from parent module
+import asyncio
+import queue
 import sys
-from collections.abc import Generator
+import threading
+from collections.abc import AsyncIterator, Iterator
 from pathlib import Path
 
-from ollama import chat
+from ollama import AsyncClient
 
 sys.path.append(str(Path(__file__).parent.parent))
-from ai import Candidates, PesquisaPrompt, PromptResult
+from ai import Candidates, PackedPesquisaPrompt, PesquisaPrompt, PromptResult, pack_prompts
 
+MODEL_NAME = "gemma3:4b-it-qat"
+# Keep the model loaded between requests instead of reloading it per query
+KEEP_ALIVE = "30m"
 
-def get_candidates_ollama(queries: list[str], results: list[list[PesquisaPrompt.Item]]):
+
+async def _judge_prompt(
+    client: AsyncClient, semaphore: asyncio.Semaphore, prompt: PesquisaPrompt
+) -> list[PromptResult]:
+    """Send a single query to the model."""
+    async with semaphore:
+        response = await client.chat(
+            model=MODEL_NAME,
+            messages=[{"role": "user", "content": prompt.build()}],
+            format=Candidates.model_json_schema(),
+            keep_alive=KEEP_ALIVE,
+        )
+    try:
+        candidates = Candidates.model_validate_json(response.message.content or "")
+    except Exception as e:
+        print(f"Error parsing response for prompt {prompt.id}: {e}")
+        return [PromptResult(prompt=prompt, candidates=[])]
+    return [PromptResult(prompt=prompt, candidates=candidates.candidates)]
+
+
+async def _judge_packed(
+    client: AsyncClient, semaphore: asyncio.Semaphore, packed: PackedPesquisaPrompt
+) -> list[PromptResult]:
+    """Send several queries in one request and unpack the per-query answers."""
+    async with semaphore:
+        response = await client.chat(
+            model=MODEL_NAME,
+            messages=[{"role": "user", "content": packed.build()}],
+            format=packed.PromptResult.model_json_schema(),
+            keep_alive=KEEP_ALIVE,
+        )
+    try:
+        result = packed.PromptResult.model_validate_json(response.message.content or "")
+    except Exception as e:
+        print(f"Error parsing response for packed prompt {packed.id}: {e}")
+        result = packed.PromptResult()
+
+    by_query = {r.query_id: r.candidates for r in result.results}
+    return [
+        PromptResult(prompt=prompt, candidates=by_query.get(query_id, []))
+        for query_id, prompt in enumerate(packed.prompts)
+    ]
+
+
+async def iter_prompt_results_ollama(
+    prompts: list[PesquisaPrompt],
+    concurrency: int = 4,
+    pack_token_budget: int | None = None,
+) -> AsyncIterator[PromptResult]:
     """
-    Fetch candidates using Ollama API.
-    Processes queries sequentially and yields (queries, results) tuples.
+    Judge *prompts* with up to *concurrency* requests in flight.
 
     Args:
-      queries: List of query strings
-      results: List of lists of PesquisaPrompt.Item objects
+      prompts: Prompts to send
+      concurrency: Maximum number of simultaneous requests to the Ollama server
+      pack_token_budget: If set, pack several queries per request up to this many tokens
 
     Yields:
-      Tuples of (list[str], list[list[PesquisaPrompt.Item]]) representing processed queries and their results
+      PromptResults in completion order
     """
-    # Build prompts from queries and results
-    prompts = []
-    for i, (query, result_items) in enumerate(zip(queries, results)):
-        prompt = PesquisaPrompt(id=i, item_description=query, items=result_items)
-        prompts.append(prompt)
-
-    # Process results and reconstruct as (queries, results) tuples
-    processed_queries = []
-    processed_results = []
-
-    for i, prompt in enumerate(prompts):
-        response = chat(
-            model="gemma3:4b-it-qat",
-            messages=[{"role": "user", "content": prompt.build()}],
-            format=Candidates.model_json_schema(),
-        )
-        candidates = Candidates.model_validate_json(response.message.content)
-
-        # Extract the candidates and convert back to PesquisaPrompt.Item format
-        result_items = []
-        for candidate in candidates.candidates:
-            # Find the matching item from original results based on description
-            original_items = results[i]
-            matching_item = next(
-                (
-                    item
-                    for item in original_items
-                    if item.description == candidate.description
-                ),
-                None,
-            )
-            if matching_item:
-                result_items.append(matching_item)
-
-        processed_queries.append(queries[i])
-        processed_results.append(result_items)
-
-    # Yield as a single tuple
-    yield (processed_queries, processed_results)
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    if pack_token_budget:
+        requests = [_judge_packed(client, semaphore, packed) for packed in pack_prompts(prompts, pack_token_budget)]
+    else:
+        requests = [_judge_prompt(client, semaphore, prompt) for prompt in prompts]
+
+    for finished in asyncio.as_completed(requests):
+        for result in await finished:
+            yield result
+
+
+def stream_prompt_results_ollama(
+    prompts: list[PesquisaPrompt],
+    concurrency: int = 4,
+    pack_token_budget: int | None = None,
+) -> Iterator[PromptResult]:
+    """
+    Synchronous view of ``iter_prompt_results_ollama``.
+
+    The requests run on an event loop in a helper thread, so they keep
+    progressing while the caller handles the results already received.
+
+    Yields:
+      PromptResults in completion order
+    """
+    results: queue.Queue = queue.Queue()
+    done = object()
+
+    async def _consume() -> None:
+        async for result in iter_prompt_results_ollama(prompts, concurrency, pack_token_budget):
+            results.put(result)
+
+    def _run() -> None:
+        try:
+            asyncio.run(_consume())
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(done)
+
+    threading.Thread(target=_run, name="ollama-judge", daemon=True).start()
+
+    while (item := results.get()) is not done:
+        if isinstance(item, BaseException):
+            raise item
+        yield item
@@ -9,7 +9,7 @@ from pydantic import BaseModel, Field
 
 from utils.ai import BasePrompt, PesquisaPrompt
 from utils.domain import QueryMatch
-from utils.cache import DEFAULT_CACHE_DIR, CacheManager
+from utils.cache import DEFAULT_CACHE_DB, DEFAULT_CACHE_DIR, SqliteCacheManager, migrate_json_cache, with_cache
 
 
 class Replacement(BaseModel):
@@ -45,9 +45,36 @@ class PreprocessingPrompt(BasePrompt):
 
 
 # Initialize cache manager for replacements
-_replacement_cache = CacheManager(
-    cache_dir=DEFAULT_CACHE_DIR, result_type=Replacement
+_replacement_cache = SqliteCacheManager(
+    db_path=DEFAULT_CACHE_DB, result_type=Replacement, max_entries=1000
 )
+# One-time import of replacements cached by the old JSON-file backend
+migrate_json_cache(DEFAULT_CACHE_DIR, _replacement_cache)
+
+
+def _fetch_replacements(
+    strings: list[str],
+    context: str,
+    status_callback: Callable[[str], None] | None = None,
+) -> list[Replacement]:
+    """Ask the LLM for replacements based on a random sample of *strings*."""
+    from utils.models.gemini import make_prompt
+
+    print("calling LLM API...")
+    if status_callback:
+        status_callback("Chamando LLM para gerar replacements...")
+    sample = random.sample(strings, min(len(strings), 50))
+
+    prompt = PreprocessingPrompt(id=uuid.uuid4(), sample=sample, context=context)
+
+    result = make_prompt(prompt)
+    return result.replacements  # type: ignore
+
+
+# Concurrent tasks with the same context share one LLM call
+_fetch_replacements_cached = with_cache(
+    _replacement_cache, lambda strings, context, **kwargs: context
+)(_fetch_replacements)
 
 
 def get_replacements_from_llm(
@@ -69,37 +96,21 @@ def get_replacements_from_llm(
     Returns:
         List of Replacement objects containing regex patterns and replacements
     """
-
-    from utils.models.gemini import make_prompt
-
-    # Try to load from cache first
-    if use_cache:
+    if not use_cache:
+        replacements = _fetch_replacements(strings, context, status_callback=status_callback)
         if status_callback:
-            status_callback("Verificando cache de replacements...")
-        cached_result = _replacement_cache.load(context)
-        if cached_result is not None:
-            print(f"✓ Loaded {len(cached_result)} replacements from cache")
-            if status_callback:
-                status_callback(f"✓ {len(cached_result)} replacements carregados do cache")
-            return cached_result
-
-    # Cache miss or cache disabled - call the LLM
-    print("calling LLM API...")
-    if status_callback:
-        status_callback("Chamando LLM para gerar replacements...")
-    sample = random.sample(strings, min(len(strings), 50))
+            status_callback(f"✓ {len(replacements)} replacements gerados pelo LLM")
+        return replacements
 
-    prompt = PreprocessingPrompt(id=uuid.uuid4(), sample=sample, context=context)
-
-    result = make_prompt(prompt)
-    replacements = result.replacements  # type: ignore
+    if status_callback:
+        status_callback("Verificando cache de replacements...")
+    from_cache = _replacement_cache.exists(context)
 
-    # Save to cache
-    if use_cache:
-        _replacement_cache.save(context, replacements)
+    replacements = _fetch_replacements_cached(strings, context, status_callback=status_callback)
 
     if status_callback:
-        status_callback(f"✓ {len(replacements)} replacements gerados pelo LLM")
+        source = "carregados do cache" if from_cache else "gerados pelo LLM"
+        status_callback(f"✓ {len(replacements)} replacements {source}")
 
     return replacements
 
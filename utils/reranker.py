@@ -1,58 +1,263 @@
-from typing import Callable, Optional
+import math
+import threading
+from typing import TYPE_CHECKING, Callable, Optional
 
-from sentence_transformers import CrossEncoder
+import numpy as np
 from tqdm import tqdm
 
 from utils.ai import PesquisaPrompt
+from utils.candidate_matrix import CandidateMatrix
 from utils.domain import QueryMatch
 
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+
+    from utils.reranker_pool import RerankerPool
+
 reranker_model_name = "BAAI/bge-reranker-v2-m3"
-reranker = CrossEncoder(reranker_model_name, max_length=512)
+_reranker: Optional["CrossEncoder"] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> "CrossEncoder":
+    """The cross-encoder, loaded on first use (so importing this module stays cheap)."""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            from sentence_transformers import CrossEncoder
+
+            _reranker = CrossEncoder(reranker_model_name, max_length=512)
+        return _reranker
+
+
+def pair_token_lengths(pairs: list[list[str]]) -> list[int]:
+    """Tokenized length of each (query, document) pair, truncated at the model's max_length."""
+    if not pairs:
+        return []
+    reranker = get_reranker()
+    encoded = reranker.tokenizer(
+        [query for query, _ in pairs],
+        [document for _, document in pairs],
+        truncation=True,
+        max_length=reranker.max_length,
+    )
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def length_buckets(lengths: list[int], token_budget: int) -> list[list[int]]:
+    """Group pair indices into batches of similar length under a padded-token budget.
+
+    Indices are sorted by length, and a batch is closed once
+    ``batch_size * longest_pair`` would exceed *token_budget* — the number
+    of tokens the batch occupies after padding.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    buckets: list[list[int]] = []
+    current: list[int] = []
+    for index in order:
+        # lengths are ascending, so the newcomer is the longest of the batch
+        if current and (len(current) + 1) * lengths[index] > token_budget:
+            buckets.append(current)
+            current = []
+        current.append(index)
+    if current:
+        buckets.append(current)
+    return buckets
+
+
+def adaptive_max_length(lengths: list[int], percentile: float = 99.5, multiple_of: int = 8) -> int:
+    """Smallest max_length covering *percentile* % of *lengths*, rounded up to *multiple_of*.
+
+    Never exceeds the model's configured max_length.
+    """
+    reranker = get_reranker()
+    if not lengths:
+        return reranker.max_length
+    ordered = sorted(lengths)
+    rank = min(len(ordered) - 1, math.ceil(len(ordered) * percentile / 100) - 1)
+    covered = ordered[max(rank, 0)]
+    return min(reranker.max_length, math.ceil(covered / multiple_of) * multiple_of)
+
+
+def truncate_pairs(pairs: list[list[str]], lengths: list[int], max_length: int) -> list[list[str]]:
+    """*pairs* with those longer than *max_length* tokens cut down to it.
+
+    The pair is truncated longest-first, as the cross-encoder itself does,
+    and decoded back to text, so the model scores it under its own
+    ``max_length`` without that shared setting being changed.
+    """
+    long_pairs = [i for i, length in enumerate(lengths) if length > max_length]
+    if not long_pairs:
+        return pairs
+    tokenizer = get_reranker().tokenizer
+    encoded = tokenizer(
+        [pairs[i][0] for i in long_pairs],
+        [pairs[i][1] for i in long_pairs],
+        truncation="longest_first",
+        max_length=max_length,
+    )
+    truncated = list(pairs)
+    for row, i in enumerate(long_pairs):
+        ids, sequences = encoded["input_ids"][row], encoded.sequence_ids(row)
+        truncated[i] = [
+            tokenizer.decode([t for t, s in zip(ids, sequences) if s == part], skip_special_tokens=True)
+            for part in (0, 1)
+        ]
+    return truncated
+
+
+def predict_bucketed(
+    pairs: list[list[str]],
+    token_budget: int = 8192,
+    adapt_max_length: bool = False,
+) -> list[float]:
+    """Score *pairs* in length-sorted batches sized by *token_budget*.
+
+    Short retail pairs are no longer padded to the longest pair of a
+    fixed-size batch. With *adapt_max_length*, pairs are truncated to a
+    length covering the observed distribution (only the longest outliers
+    are cut; see ``truncate_pairs``). Scores are returned in the original order.
+    """
+    if not pairs:
+        return []
+    reranker = get_reranker()
+    lengths = pair_token_lengths(pairs)
+    if adapt_max_length:
+        max_length = adaptive_max_length(lengths)
+        pairs = truncate_pairs(pairs, lengths, max_length)
+        lengths = [min(length, max_length) for length in lengths]
+
+    scores: list[float] = [0.0] * len(pairs)
+    for bucket in length_buckets(lengths, token_budget):
+        batch_scores = reranker.predict([pairs[i] for i in bucket], batch_size=len(bucket), show_progress_bar=False)
+        for i, score in zip(bucket, batch_scores):
+            scores[i] = float(score)
+    return scores
+
+
+def score_pairs(
+    pairs: list[list[str]],
+    pool: Optional["RerankerPool"] = None,
+    token_budget: int = 8192,
+    adapt_max_length: bool = False,
+) -> list[float]:
+    """Score (query, document) pairs in-process or on *pool*, preserving order."""
+    if not pairs:
+        return []
+    if pool is not None:
+        return pool.predict(pairs, token_budget=token_budget, adapt_max_length=adapt_max_length)
+    return predict_bucketed(pairs, token_budget=token_budget, adapt_max_length=adapt_max_length)
 
 
 def rerank_items(
     matches: list[QueryMatch],
     progress_callback: Optional[Callable[[int, int], None]] = None,
+    pool: Optional["RerankerPool"] = None,
+    chunk_size: int = 256,
+    token_budget: int = 8192,
+    adapt_max_length: bool = False,
 ) -> list[QueryMatch]:
     """Rerank each QueryMatch's candidates using a Cross-Encoder model.
 
+    Pairs of *chunk_size* queries are scored together, so the model (or the
+    worker pool) sees large batches instead of one query at a time.
+
     Args:
         matches: List of QueryMatch objects to rerank.
         progress_callback: Optional callback function(current, total) for progress tracking.
+        pool: Optional RerankerPool or InferenceClient (anything with ``predict``)
+            to score in other processes.
+        chunk_size: Number of queries scored per call.
+        token_budget: Maximum padded tokens per model batch (see ``predict_bucketed``).
+        adapt_max_length: Lower max_length to the observed pair lengths.
 
     Returns:
         New list of QueryMatch objects with candidates sorted by score (descending).
     """
     reranked: list[QueryMatch] = []
     total = len(matches)
-    iterator = matches if progress_callback else tqdm(matches, total=total, desc="Reranking")
-
-    for idx, match in enumerate(iterator, start=1):
-        pairs = [[match.query, c.description] for c in match.candidates]
-        scores = reranker.predict(pairs)
-
-        scored_candidates = [
-            PesquisaPrompt.Item(
-                description=c.description,
-                distance=c.distance,
-                score=float(score),
-                value=c.value,
-            )
-            for c, score in zip(match.candidates, scores)
-        ]
-        reranked.append(
-            QueryMatch(
-                query=match.query,
-                candidates=sorted(scored_candidates, key=lambda c: c.score, reverse=True),
+    progress_bar = None if progress_callback else tqdm(total=total, desc="Reranking")
+
+    for start in range(0, total, chunk_size):
+        chunk = matches[start : start + chunk_size]
+        pairs = [[match.query, c.description] for match in chunk for c in match.candidates]
+        scores = iter(score_pairs(pairs, pool, token_budget=token_budget, adapt_max_length=adapt_max_length))
+
+        for match in chunk:
+            scored_candidates = [
+                PesquisaPrompt.Item(
+                    description=c.description,
+                    distance=c.distance,
+                    score=next(scores),
+                    value=c.value,
+                )
+                for c in match.candidates
+            ]
+            reranked.append(
+                QueryMatch(
+                    query=match.query,
+                    candidates=sorted(scored_candidates, key=lambda c: c.score, reverse=True),
+                )
             )
-        )
 
+        done = min(start + chunk_size, total)
         if progress_callback:
-            progress_callback(idx, total)
+            progress_callback(done, total)
+        elif progress_bar is not None:
+            progress_bar.update(len(chunk))
 
+    if progress_bar is not None:
+        progress_bar.close()
     return reranked
 
 
+def rerank_matrix(
+    candidates: CandidateMatrix,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    pool: Optional["RerankerPool"] = None,
+    chunk_size: int = 256,
+    token_budget: int = 8192,
+    adapt_max_length: bool = False,
+    scores: Optional[np.ndarray] = None,
+    first_row: int = 0,
+    chunk_callback: Optional[Callable[[int, int, np.ndarray], None]] = None,
+) -> CandidateMatrix:
+    """Columnar ``rerank_items``: score the cells in play of *candidates*.
+
+    Cells out of play keep a NaN score. The column order is unchanged, so
+    callers still see candidates in retrieval order; use
+    ``CandidateMatrix.sort_by_score`` for the reranked order.
+
+    Args: as ``rerank_items``, plus:
+        scores: Scores of an interrupted run, whose rows before *first_row* are kept
+        first_row: First query row to rerank
+        chunk_callback: Called with ``(start, stop, scores[start:stop])`` after
+            each chunk of query rows (e.g. to checkpoint them)
+
+    Returns:
+        *candidates* with the ``score`` array filled in
+    """
+    scores = np.full(candidates.mask.shape, np.nan) if scores is None else scores.copy()
+    total = len(candidates.queries)
+    progress_bar = None if progress_callback else tqdm(total=total, initial=first_row, desc="Reranking")
+
+    for start in range(first_row, total, chunk_size):
+        done = min(start + chunk_size, total)
+        pairs, cells = candidates.pairs(slice(start, done))
+        scores.flat[cells] = score_pairs(pairs, pool, token_budget=token_budget, adapt_max_length=adapt_max_length)
+        if chunk_callback:
+            chunk_callback(start, done, scores[start:done])
+
+        if progress_callback:
+            progress_callback(done, total)
+        elif progress_bar is not None:
+            progress_bar.update(done - start)
+
+    if progress_bar is not None:
+        progress_bar.close()
+    return candidates.with_scores(scores)
+
+
 def filter_items_by_score(
     matches: list[QueryMatch], threshold: float = 0.5
 ) -> list[QueryMatch]:
@@ -0,0 +1,164 @@
+"""Multi-process cross-encoder scoring.
+
+A single ``CrossEncoder.predict`` call is bounded by one PyTorch intra-op
+pool and by the GIL around tokenization. ``RerankerPool`` spreads pair
+shards over N worker processes, each with its own copy of the model
+(or sharing the parent's weights copy-on-write when started with ``fork``),
+and merges the scores back in input order.
+
+Run ``python -m utils.reranker_pool`` to print the scaling curve on this machine.
+"""
+
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.config import load_config
+
+def _init_worker(threads_per_process: int) -> None:
+    """Load (or inherit after fork) the reranker model in a worker process."""
+    import torch
+
+    if threads_per_process > 0:
+        torch.set_num_threads(threads_per_process)
+
+    from utils.reranker import get_reranker
+
+    get_reranker()
+
+
+def _predict_shard(args: tuple[list[list[str]], int, bool]) -> list[float]:
+    from utils.reranker import predict_bucketed
+
+    pairs, token_budget, adapt_max_length = args
+    return predict_bucketed(pairs, token_budget=token_budget, adapt_max_length=adapt_max_length)
+
+
+class RerankerPool:
+    """
+    Pool of worker processes scoring (query, document) pairs.
+
+    Args:
+        processes: Number of worker processes
+        threads_per_process: torch intra-op threads per worker (0 = torch default)
+        start_method: multiprocessing start method. ``spawn`` (default) loads a
+            model copy per worker and works everywhere; ``fork`` shares the
+            parent's weights copy-on-write but is Unix-only and unsafe if the
+            parent already ran torch with OpenMP threads.
+    """
+
+    def __init__(self, processes: int, threads_per_process: int = 0, start_method: str = "spawn"):
+        self.processes = max(1, processes)
+        self.threads_per_process = threads_per_process
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(threads_per_process,),
+        )
+
+    def predict(self, pairs: list[list[str]], token_budget: int = 8192, adapt_max_length: bool = False) -> list[float]:
+        """Score *pairs* across the workers; scores are returned in input order.
+
+        Pairs are sorted by character length before sharding so each worker
+        gets pairs of similar length to bucket (see ``predict_bucketed``).
+        """
+        if not pairs:
+            return []
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        # A few shards per worker keeps them busy when shard costs differ
+        shard_size = max(1, math.ceil(len(pairs) / (self.processes * 4)))
+        shards = [
+            ([pairs[i] for i in order[start : start + shard_size]], token_budget, adapt_max_length)
+            for start in range(0, len(order), shard_size)
+        ]
+
+        scores: list[float] = [0.0] * len(pairs)
+        sorted_scores = (score for shard in self._executor.map(_predict_shard, shards) for score in shard)
+        for i, score in zip(order, sorted_scores):
+            scores[i] = score
+        return scores
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "RerankerPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+_shared_pool: RerankerPool | None = None
+_shared_pool_key: tuple[int, int] | None = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_reranker_pool() -> RerankerPool | None:
+    """Return the process pool configured in ``config.json``, or None to rerank in-process.
+
+    The pool is created on first use and recreated if the configured sizes change.
+    """
+    global _shared_pool, _shared_pool_key
+    config = load_config()
+    key = (config.reranker_processes, config.reranker_threads_per_process)
+
+    with _shared_pool_lock:
+        if _shared_pool is not None and _shared_pool_key != key:
+            _shared_pool.close()
+            _shared_pool = None
+        if _shared_pool is None and config.reranker_processes > 1:
+            _shared_pool = RerankerPool(config.reranker_processes, config.reranker_threads_per_process)
+            _shared_pool_key = key
+        return _shared_pool
+
+
+def benchmark(
+    num_pairs: int = 2000,
+    process_counts: tuple[int, ...] = (1, 2, 4, 8),
+    threads_per_process: int = 1,
+) -> list[dict[str, float]]:
+    """Measure reranking throughput for each process count.
+
+    Args:
+        num_pairs: Number of synthetic retail-like pairs to score
+        process_counts: Pool sizes to try
+        threads_per_process: torch threads per worker
+
+    Returns:
+        One row per pool size with ``pairs_per_second`` and ``speedup``
+    """
+    pairs = [
+        [f"PNEU ARO {13 + i % 5} 175/70 MARCA {i % 17}", f"PNEU {175 + i % 3 * 10}/70R{13 + i % 5} MODELO {i % 23} MARCA {i % 17}"]
+        for i in range(num_pairs)
+    ]
+
+    rows: list[dict[str, float]] = []
+    for processes in process_counts:
+        with RerankerPool(processes, threads_per_process) as pool:
+            pool.predict(pairs[: processes * 4])  # warm up: load the model in every worker
+            start = time.perf_counter()
+            pool.predict(pairs)
+            elapsed = time.perf_counter() - start
+        rows.append({"processes": processes, "seconds": elapsed, "pairs_per_second": num_pairs / elapsed})
+
+    baseline = rows[0]["pairs_per_second"]
+    for row in rows:
+        row["speedup"] = row["pairs_per_second"] / baseline
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reranker multi-process scaling benchmark")
+    parser.add_argument("--pairs", type=int, default=2000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per process")
+    args = parser.parse_args()
+
+    print(f"{'procs':>5} {'seconds':>9} {'pairs/s':>9} {'speedup':>8}")
+    for row in benchmark(args.pairs, tuple(args.processes), args.threads):
+        print(f"{row['processes']:>5} {row['seconds']:>9.2f} {row['pairs_per_second']:>9.1f} {row['speedup']:>7.2f}x")
@@ -0,0 +1,721 @@
+"""Pluggable vector stores for catalog retrieval.
+
+``ChromaVectorStore`` wraps a persistent Chroma collection (approximate
+HNSW search). ``NumpyVectorStore`` keeps the vectors in a memory-mapped
+``.npy`` file per catalog and answers queries with exact blocked matrix
+multiplies — faster for catalogs up to a few hundred thousand items and
+exact, which the distance cutoff relies on. ``ShardedVectorStore`` splits
+very large catalogs over several of either and queries them in parallel.
+
+Both take precomputed embeddings and return results in Chroma's
+``query`` shape (lists of ``ids``, ``documents``, ``distances`` and
+``metadatas`` per query), using Chroma's distance definitions. Queries
+accept a metadata filter in Chroma's ``where`` syntax (``$and``, ``$or``,
+``$eq``, ``$ne``, ``$gt``, ``$gte``, ``$lt``, ``$lte``, ``$in``, ``$nin``);
+``query_with_filters`` runs a batch with a different filter per query.
+
+Run ``python -m utils.vector_store`` to compare both backends on random data.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import chromadb
+import numpy as np
+
+from utils.config import OUTPUT_PATH
+
+DB_STORAGE_PATH = OUTPUT_PATH / "chromadb_storage"
+DB_STORAGE_PATH.mkdir(parents=True, exist_ok=True)
+NUMPY_STORAGE_PATH = OUTPUT_PATH / "numpy_storage"
+
+VECTOR_BACKENDS = ("chroma", "numpy")
+SHARD_KEYS = ("hash", "family")
+
+QueryResult = dict[str, list[list[Any]]]
+Where = dict[str, Any]
+
+_COMPARISONS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def matches_where(metadata: dict[str, Any] | None, where: Where) -> bool:
+    """True if *metadata* satisfies the Chroma-style filter *where*.
+
+    As in Chroma, a document without the filtered key does not match
+    (except for ``$ne`` and ``$nin``).
+    """
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, sub) for sub in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if value is None and op not in ("$ne", "$nin"):
+                    return False
+                if not _COMPARISONS[op](value, operand):
+                    return False
+    return True
+
+
+@dataclass(frozen=True)
+class IndexSettings:
+    """Distance space and HNSW parameters of a collection.
+
+    The defaults are what Chroma gives a collection created with the
+    sentence-transformers embedding function (cosine space, its default).
+    ``space`` and the build parameters are fixed when a collection is
+    created, so non-default values get their own collection (see
+    ``name_suffix``); ``ef_search`` can change at any time.
+    """
+
+    space: str = "cosine"
+    max_neighbors: int = 16
+    ef_construction: int = 100
+    ef_search: int = 100
+
+    def name_suffix(self) -> str:
+        """Collection-name suffix for the build-time settings ('' for the defaults)."""
+        default = IndexSettings()
+        if (self.space, self.max_neighbors, self.ef_construction) == (
+            default.space,
+            default.max_neighbors,
+            default.ef_construction,
+        ):
+            return ""
+        return f"--{self.space}-m{self.max_neighbors}-c{self.ef_construction}"
+
+    def hnsw_configuration(self) -> dict[str, Any]:
+        return {
+            "hnsw": {
+                "space": self.space,
+                "max_neighbors": self.max_neighbors,
+                "ef_construction": self.ef_construction,
+                "ef_search": self.ef_search,
+            }
+        }
+
+    @classmethod
+    def from_config(cls, config) -> "IndexSettings":
+        return cls(
+            space=config.vector_space,
+            max_neighbors=config.hnsw_max_neighbors,
+            ef_construction=config.hnsw_ef_construction,
+            ef_search=config.hnsw_ef_search,
+        )
+
+
+def convert_cosine_distance(distance: float, space: str) -> float:
+    """Express a cosine-distance cutoff in *space*, for unit-length embeddings (bge-m3's).
+
+    For unit vectors the inner-product distance ``1 - dot`` equals the
+    cosine distance, and the squared L2 distance ``2 - 2·cos`` is twice it.
+    """
+    return distance * 2 if space == "l2" else distance
+
+_chroma_client = None
+
+
+def get_chroma_client():
+    """Persistent Chroma client, created on first use."""
+    global _chroma_client
+    if _chroma_client is None:
+        _chroma_client = chromadb.PersistentClient(path=DB_STORAGE_PATH)
+    return _chroma_client
+
+
+class VectorStore(ABC):
+    """A catalog collection searchable by embedding."""
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: list[str],
+        documents: list[str],
+        embeddings: np.ndarray,
+        metadatas: list[dict[str, Any]] | None = None,
+    ) -> None:
+        """Insert or replace documents with their precomputed embeddings."""
+
+    @abstractmethod
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Where | None = None) -> QueryResult:
+        """Return the *n_results* nearest documents for each query embedding, among those matching *where*."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored documents."""
+
+    @abstractmethod
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        """The subset of *ids* already stored."""
+
+    @abstractmethod
+    def update_metadatas(self, ids: list[str], metadatas: list[dict[str, Any]]) -> None:
+        """Replace the metadata of stored documents, keeping their embeddings."""
+
+    @contextmanager
+    def bulk(self) -> Iterator["VectorStore"]:
+        """Group many ``upsert`` calls; stores that persist in one go write once on exit."""
+        yield self
+
+
+class ChromaVectorStore(VectorStore):
+    """Chroma collection (persistent HNSW index)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def upsert(self, ids, documents, embeddings, metadatas=None) -> None:
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Where | None = None) -> QueryResult:
+        raw = self.collection.query(
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32),
+            n_results=n_results,
+            where=where,
+            include=["documents", "distances", "metadatas"],
+        )
+        return {
+            "ids": raw.get("ids") or [],
+            "documents": raw.get("documents") or [],
+            "distances": raw.get("distances") or [],
+            "metadatas": raw.get("metadatas") or [],
+        }
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def existing_ids(self, ids: list[str], page_size: int = 5000) -> set[str]:
+        found: set[str] = set()
+        for start in range(0, len(ids), page_size):
+            found.update(self.collection.get(ids=ids[start : start + page_size], include=[])["ids"])
+        return found
+
+    def update_metadatas(self, ids: list[str], metadatas: list[dict[str, Any]], page_size: int = 5000) -> None:
+        for start in range(0, len(ids), page_size):
+            self.collection.update(ids=ids[start : start + page_size], metadatas=metadatas[start : start + page_size])
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact search over a memory-mapped embedding matrix.
+
+    Files in *directory*: ``vectors.npy`` (one row per document),
+    ``norms.npy`` (squared L2 norms) and ``index.json`` (ids, documents,
+    metadatas in row order).
+
+    Every ``upsert`` rewrites the files; inside ``bulk()`` the rows are
+    appended to an in-memory buffer (grown by doubling) and the files are
+    written once when the block exits. Open catalogs through
+    ``open_numpy_store`` so a process holds one instance per directory.
+
+    Args:
+        directory: Where the catalog's files live (created if missing)
+        space: Distance, as in Chroma — ``l2`` (squared L2), ``cosine`` or ``ip``
+        dtype: Storage dtype, ``float32`` or ``float16`` (half the memory)
+        query_block: Queries scored per matrix multiply
+        doc_block: Documents scored per matrix multiply
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        space: str = "cosine",
+        dtype: str = "float32",
+        query_block: int = 256,
+        doc_block: int = 65536,
+    ):
+        if space not in ("l2", "cosine", "ip"):
+            raise ValueError(f"Unsupported space: {space}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.space = space
+        self.dtype = np.dtype(dtype)
+        self.query_block = query_block
+        self.doc_block = doc_block
+        self._lock = threading.Lock()
+        self._bulk_depth = 0
+        self._dirty = False
+        self._load()
+
+    # --- persistence --------------------------------------------------------
+
+    def _load(self) -> None:
+        index_path = self.directory / "index.json"
+        if index_path.exists():
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self._ids: list[str] = index["ids"]
+            self._documents: list[str] = index["documents"]
+            self._metadatas: list[dict[str, Any] | None] = index["metadatas"]
+            self._vectors = np.load(self.directory / "vectors.npy", mmap_mode="r")
+            self._norms = np.load(self.directory / "norms.npy", mmap_mode="r")
+        else:
+            self._ids, self._documents, self._metadatas = [], [], []
+            self._vectors = None
+            self._norms = None
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        # Writable buffers (rows past count() are spare capacity); None while memory-mapped
+        self._vector_buffer: np.ndarray | None = None
+        self._norm_buffer: np.ndarray | None = None
+
+    def _dump_index(self, path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas},
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+
+    def _write(self) -> None:
+        """Atomically replace the files with the in-memory rows, then reopen them memory-mapped."""
+        vectors, norms = self._vectors, self._norms
+        # Drop the memory maps of the old files: Windows cannot replace a mapped file
+        self._vectors = self._norms = self._vector_buffer = self._norm_buffer = None
+        staging = Path(tempfile.mkdtemp(dir=self.directory, prefix=".staging_"))
+        try:
+            np.save(staging / "vectors.npy", vectors)
+            np.save(staging / "norms.npy", norms)
+            del vectors, norms
+            self._dump_index(staging / "index.json")
+            # index.json last: its presence marks a complete set of files
+            for name in ("vectors.npy", "norms.npy", "index.json"):
+                os.replace(staging / name, self.directory / name)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self._vectors = np.load(self.directory / "vectors.npy", mmap_mode="r")
+        self._norms = np.load(self.directory / "norms.npy", mmap_mode="r")
+        self._dirty = False
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """Make ``_vectors``/``_norms`` writable views with room for *rows* rows."""
+        if self._vector_buffer is not None and len(self._vector_buffer) >= rows:
+            return
+        stored = 0 if self._vectors is None else len(self._vectors)
+        capacity = max(rows, 2 * (0 if self._vector_buffer is None else len(self._vector_buffer)), 1024)
+        vector_buffer = np.empty((capacity, dim), dtype=self.dtype)
+        norm_buffer = np.empty(capacity, dtype=np.float32)
+        if stored:
+            vector_buffer[:stored] = self._vectors
+            norm_buffer[:stored] = self._norms
+        self._vector_buffer, self._norm_buffer = vector_buffer, norm_buffer
+        self._vectors, self._norms = vector_buffer[:stored], norm_buffer[:stored]
+
+    @contextmanager
+    def bulk(self) -> Iterator["NumpyVectorStore"]:
+        with self._lock:
+            self._bulk_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._bulk_depth -= 1
+                if self._bulk_depth == 0 and self._dirty:
+                    self._write()
+
+    # --- VectorStore API ----------------------------------------------------
+
+    def _prepare(self, embeddings: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self.space == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def upsert(self, ids, documents, embeddings, metadatas=None) -> None:
+        new_vectors = self._prepare(embeddings)
+        metadatas = metadatas or [None] * len(ids)
+
+        with self._lock:
+            rows = []
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                row = self._row_of.get(doc_id)
+                if row is None:
+                    row = self._row_of[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._documents.append(document)
+                    self._metadatas.append(metadata)
+                else:
+                    self._documents[row] = document
+                    self._metadatas[row] = metadata
+                rows.append(row)
+
+            total = len(self._ids)
+            self._reserve(total, new_vectors.shape[1])
+            self._vectors = self._vector_buffer[:total]  # type: ignore[index]
+            self._norms = self._norm_buffer[:total]  # type: ignore[index]
+            # A repeated id keeps its last vector, as the row order is preserved
+            stored = new_vectors.astype(self.dtype)
+            self._vectors[rows] = stored
+            stored = stored.astype(np.float32)
+            self._norms[rows] = np.einsum("ij,ij->i", stored, stored)
+            self._dirty = True
+            if self._bulk_depth == 0:
+                self._write()
+
+    def _distances(
+        self, vectors: np.ndarray, norms: np.ndarray, queries: np.ndarray, q_norms: np.ndarray, start: int, stop: int
+    ) -> np.ndarray:
+        block = np.asarray(vectors[start:stop], dtype=np.float32)
+        dots = queries @ block.T
+        if self.space == "l2":
+            return q_norms[:, None] + np.asarray(norms[start:stop])[None, :] - 2.0 * dots
+        return 1.0 - dots
+
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Where | None = None) -> QueryResult:
+        # The store is shared (see ``open_numpy_store``): score the rows as of now, while upserts may append
+        with self._lock:
+            total, vectors, norms = len(self._ids), self._vectors, self._norms
+            metadatas = self._metadatas[:total]
+        result: QueryResult = {"ids": [], "documents": [], "distances": [], "metadatas": []}
+        queries = self._prepare(query_embeddings)
+        # Rows outside the filter are scored at infinity, so they never reach the top k
+        excluded = None
+        if where:
+            excluded = ~np.fromiter((matches_where(m, where) for m in metadatas), dtype=bool, count=total)
+        k = min(n_results, total if excluded is None else int(total - excluded.sum()))
+        if k == 0:
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
+
+        for q_start in range(0, len(queries), self.query_block):
+            q_chunk = queries[q_start : q_start + self.query_block]
+            q_norms = np.einsum("ij,ij->i", q_chunk, q_chunk)
+
+            best_dist = np.full((len(q_chunk), 0), np.inf, dtype=np.float32)
+            best_rows = np.empty((len(q_chunk), 0), dtype=np.int64)
+            for d_start in range(0, total, self.doc_block):
+                d_stop = min(d_start + self.doc_block, total)
+                dist = self._distances(vectors, norms, q_chunk, q_norms, d_start, d_stop)  # type: ignore[arg-type]
+                if excluded is not None:
+                    dist[:, excluded[d_start:d_stop]] = np.inf
+                kk = min(k, d_stop - d_start)
+                # Top-k of this block, merged with the running top-k
+                part = np.argpartition(dist, kk - 1, axis=1)[:, :kk]
+                best_dist = np.hstack([best_dist, np.take_along_axis(dist, part, axis=1)])
+                best_rows = np.hstack([best_rows, part + d_start])
+                if best_dist.shape[1] > k:
+                    keep = np.argpartition(best_dist, k - 1, axis=1)[:, :k]
+                    best_dist = np.take_along_axis(best_dist, keep, axis=1)
+                    best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+            order = np.argsort(best_dist, axis=1)
+            best_dist = np.take_along_axis(best_dist, order, axis=1)
+            best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+            for rows, dists in zip(best_rows.tolist(), best_dist.tolist()):
+                result["ids"].append([self._ids[r] for r in rows])
+                result["documents"].append([self._documents[r] for r in rows])
+                result["metadatas"].append([metadatas[r] for r in rows])
+                result["distances"].append([max(d, 0.0) for d in dists])
+        return result
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        return {doc_id for doc_id in ids if doc_id in self._row_of}
+
+    def update_metadatas(self, ids: list[str], metadatas: list[dict[str, Any]]) -> None:
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                row = self._row_of.get(doc_id)
+                if row is not None:
+                    self._metadatas[row] = metadata
+            if self._bulk_depth:
+                # Written with the buffered rows when the bulk block exits
+                self._dirty = True
+                return
+            # Vectors are unchanged: only index.json is rewritten
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".index_", suffix=".json")
+            os.close(fd)
+            try:
+                self._dump_index(Path(tmp_path))
+                os.replace(tmp_path, self.directory / "index.json")
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+
+
+_numpy_stores: dict[Path, NumpyVectorStore] = {}
+_numpy_stores_lock = threading.Lock()
+
+
+def open_numpy_store(directory: Path, space: str = "cosine") -> NumpyVectorStore:
+    """The process-wide NumpyVectorStore of *directory*.
+
+    Every user of a catalog (background indexing, web tasks, the CLI's
+    file workers) gets the same instance: two instances would each keep
+    their own rows in memory, and the last one to write its files would
+    drop the other's upserts.
+    """
+    key = Path(directory).resolve()
+    with _numpy_stores_lock:
+        store = _numpy_stores.get(key)
+        if store is None or store.space != space:
+            store = _numpy_stores[key] = NumpyVectorStore(key, space=space)
+        return store
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    A catalog split over several stores, queried in parallel.
+
+    Each document lives in exactly one shard. Queries fan out to every
+    shard on a thread pool (Chroma and the NumPy matmul both release the
+    GIL) and the per-shard top-k lists are merged by distance.
+
+    Args:
+        shards: The underlying stores
+        shard_by: ``hash`` spreads documents evenly by ID; ``family`` keeps
+            documents sharing their first word (e.g. ``PNEU``, ``OLEO``) together
+    """
+
+    def __init__(self, shards: list[VectorStore], shard_by: str = "hash"):
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(f"Unsupported shard key: {shard_by}")
+        self.shards = shards
+        self.shard_by = shard_by
+        self._executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="vector-shard")
+
+    def shard_of(self, doc_id: str, document: str) -> int:
+        """Index of the shard holding *doc_id* / *document*."""
+        if self.shard_by == "family":
+            key = product_family(document)
+        else:
+            key = doc_id
+        return int(hashlib.md5(key.encode()).hexdigest()[:8], 16) % len(self.shards)
+
+    def upsert(self, ids, documents, embeddings, metadatas=None) -> None:
+        embeddings = np.asarray(embeddings)
+        rows: list[list[int]] = [[] for _ in self.shards]
+        for row, (doc_id, document) in enumerate(zip(ids, documents)):
+            rows[self.shard_of(doc_id, document)].append(row)
+
+        def _upsert(shard: VectorStore, shard_rows: list[int]) -> None:
+            shard.upsert(
+                [ids[r] for r in shard_rows],
+                [documents[r] for r in shard_rows],
+                embeddings[shard_rows],
+                [metadatas[r] for r in shard_rows] if metadatas else None,
+            )
+
+        futures = [
+            self._executor.submit(_upsert, shard, shard_rows)
+            for shard, shard_rows in zip(self.shards, rows)
+            if shard_rows
+        ]
+        for future in futures:
+            future.result()
+
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Where | None = None) -> QueryResult:
+        partials = list(self._executor.map(lambda shard: shard.query(query_embeddings, n_results, where), self.shards))
+
+        result: QueryResult = {"ids": [], "documents": [], "distances": [], "metadatas": []}
+        for q in range(len(query_embeddings)):
+            merged = [
+                (distance, doc_id, document, metadata)
+                for partial in partials
+                for distance, doc_id, document, metadata in zip(
+                    partial["distances"][q],
+                    partial["ids"][q],
+                    partial["documents"][q],
+                    partial["metadatas"][q] or [None] * len(partial["ids"][q]),
+                )
+            ]
+            merged.sort(key=lambda hit: hit[0])
+            # A document re-filed under another family after new replacements may sit in two shards
+            seen: set[str] = set()
+            merged = [hit for hit in merged if not (hit[1] in seen or seen.add(hit[1]))][:n_results]
+            result["distances"].append([hit[0] for hit in merged])
+            result["ids"].append([hit[1] for hit in merged])
+            result["documents"].append([hit[2] for hit in merged])
+            result["metadatas"].append([hit[3] for hit in merged])
+        return result
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards)
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        # Under "family" sharding the shard depends on the processed text, so ask every shard
+        return set().union(*self._executor.map(lambda shard: shard.existing_ids(ids), self.shards))
+
+    def update_metadatas(self, ids: list[str], metadatas: list[dict[str, Any]]) -> None:
+        metadata_of = dict(zip(ids, metadatas))
+
+        def _update(shard: VectorStore) -> None:
+            existing = shard.existing_ids(ids)
+            held = [doc_id for doc_id in ids if doc_id in existing]
+            if held:
+                shard.update_metadatas(held, [metadata_of[doc_id] for doc_id in held])
+
+        list(self._executor.map(_update, self.shards))
+
+    @contextmanager
+    def bulk(self) -> Iterator["ShardedVectorStore"]:
+        with ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.bulk())
+            yield self
+
+
+def query_with_filters(
+    store: VectorStore, query_embeddings: np.ndarray, n_results: int, wheres: list[Where | None]
+) -> QueryResult:
+    """Query *store* with a separate filter per query.
+
+    Queries sharing a filter are sent together, so a batch with a few
+    distinct filters costs a few queries, not one per row.
+    """
+    query_embeddings = np.asarray(query_embeddings)
+    groups: dict[str, list[int]] = {}
+    for row, where in enumerate(wheres):
+        groups.setdefault(json.dumps(where, sort_keys=True), []).append(row)
+
+    result: QueryResult = {key: [[] for _ in wheres] for key in ("ids", "documents", "distances", "metadatas")}
+    for key, rows in groups.items():
+        partial = store.query(query_embeddings[rows], n_results, json.loads(key))
+        for field, lists in partial.items():
+            for row, hits in zip(rows, lists):
+                result[field][row] = hits
+    return result
+
+
+def product_family(description: str) -> str:
+    """Product-family key of a description: its first word, upper-cased."""
+    words = re.findall(r"\w+", description.upper())
+    return words[0] if words else ""
+
+
+def _open_single(name: str, backend: str, settings: IndexSettings) -> VectorStore:
+    if backend == "chroma":
+        collection = get_chroma_client().get_or_create_collection(
+            name=name + settings.name_suffix(),
+            configuration=settings.hnsw_configuration(),  # type: ignore
+            # Embeddings are always computed by us; Chroma never embeds
+            embedding_function=None,
+        )
+        # configuration_json: ``configuration`` would instantiate the persisted embedding function
+        if (collection.configuration_json.get("hnsw") or {}).get("ef_search") != settings.ef_search:
+            collection.modify(configuration={"hnsw": {"ef_search": settings.ef_search}})
+        return ChromaVectorStore(collection)
+    if backend == "numpy":
+        suffix = "" if settings.space == IndexSettings.space else f"--{settings.space}"
+        return open_numpy_store(NUMPY_STORAGE_PATH / (name + suffix), space=settings.space)
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+def open_vector_store(
+    name: str,
+    backend: str = "chroma",
+    shards: int = 1,
+    shard_by: str = "hash",
+    settings: IndexSettings | None = None,
+) -> VectorStore:
+    """Open (or create) the vector store *name*.
+
+    Args:
+        name: Catalog name (slugified file name)
+        backend: ``chroma`` or ``numpy``
+        shards: Number of shards; 1 opens a single, unsharded store
+        shard_by: Shard key (see ``ShardedVectorStore``)
+        settings: Distance space and HNSW parameters (Chroma's defaults if None)
+    """
+    settings = settings or IndexSettings()
+    if shards <= 1:
+        return _open_single(name, backend, settings)
+    # Layout in the name, so changing it builds fresh shards instead of mixing documents
+    return ShardedVectorStore(
+        [_open_single(f"{name}--{shard_by}{shards}-{i}", backend, settings) for i in range(shards)],
+        shard_by=shard_by,
+    )
+
+
+def benchmark(num_docs: int = 100_000, num_queries: int = 500, dim: int = 1024, k: int = 5) -> list[dict[str, float]]:
+    """Compare build and query time of both backends on random normalized vectors.
+
+    Returns:
+        One row per backend with ``build_seconds``, ``query_seconds`` and
+        ``recall`` (against the exact NumPy results)
+    """
+    import time
+
+    rng = np.random.default_rng(0)
+    docs = rng.standard_normal((num_docs, dim)).astype(np.float32)
+    docs /= np.linalg.norm(docs, axis=1, keepdims=True)
+    # Queries close to real documents, like retail descriptions are
+    queries = docs[rng.integers(0, num_docs, num_queries)] + 0.05 * rng.standard_normal((num_queries, dim)).astype(np.float32)
+    ids = [str(i) for i in range(num_docs)]
+    documents = [f"doc {i}" for i in range(num_docs)]
+
+    rows: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        numpy_store = NumpyVectorStore(Path(tmp) / "numpy")
+        start = time.perf_counter()
+        numpy_store.upsert(ids, documents, docs)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        exact = numpy_store.query(queries, k)
+        rows.append({"backend": "numpy", "build_seconds": build, "query_seconds": time.perf_counter() - start, "recall": 1.0})
+
+        collection = chromadb.EphemeralClient().create_collection(
+            name="benchmark", configuration=IndexSettings().hnsw_configuration(), embedding_function=None  # type: ignore
+        )
+        chroma_store = ChromaVectorStore(collection)
+        batch = 5000
+        start = time.perf_counter()
+        for i in range(0, num_docs, batch):
+            chroma_store.upsert(ids[i : i + batch], documents[i : i + batch], docs[i : i + batch])
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        approx = chroma_store.query(queries, k)
+        query_seconds = time.perf_counter() - start
+
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx["ids"], exact["ids"]))
+    rows.append({"backend": "chroma", "build_seconds": build, "query_seconds": query_seconds, "recall": hits / (num_queries * k)})
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="NumPy exact search vs Chroma HNSW")
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'backend':>8} {'build s':>9} {'query s':>9} {'recall':>7}")
+    for row in benchmark(args.docs, args.queries, args.dim, args.k):
+        print(f"{row['backend']:>8} {row['build_seconds']:>9.2f} {row['query_seconds']:>9.3f} {row['recall']:>7.3f}")
@@ -2,15 +2,28 @@ import sys
 import uuid
 import threading
 from pathlib import Path
+from concurrent.futures import Future
 from typing import Dict, Any, Optional
-from fastapi import APIRouter, HTTPException, Query, Request
-from fastapi.responses import JSONResponse, RedirectResponse
+import hashlib
+import json
+from fastapi import APIRouter, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 import pandas as pd
 
-from services.matching import run_matching_pipeline
+from dataclasses import asdict
+
+from services.export import iter_csv, iter_xlsx
+from services.checkpoints import TaskCheckpoints, interrupted_task_ids
+from services.indexing import IndexingJob, start_indexing, start_query_embedding
+from services.matching import resume_matching_pipeline, run_matching_pipeline
+from services.results_view import ResultsQuery, StaleCursorError, dumps, page_results
+from services.task_results import refilter_task, sweep_task
+from utils.catalog_store import get_catalog_store
 from utils.config import load_config, save_config
-from web.schemas import PastedData, ExcelData, ConfigSchema
+from utils.dedup import collapse_catalog
+from utils.excel_cache import read_excel_cached
+from web.schemas import PastedData, ExcelData, ConfigSchema, ExportRequest, RefilterRequest, SweepRequest
 
 BASE_DIR = Path(sys._MEIPASS) if getattr(sys, "frozen", False) else Path(__file__).parent.parent
 
@@ -25,13 +38,74 @@ _pasted_context: str | None = None
 _pasted_description_column: str | None = None
 _task_store: Dict[str, Dict[str, Any]] = {}
 _task_lock = threading.Lock()
+# Background work started as soon as the data arrives (see services.indexing)
+_indexing_job: IndexingJob | None = None
+_query_embedding: tuple[list[str], Future] | None = None
 
 
 def _update_task_status(task_id: str, **updates):
     """Thread-safe task status update. Accepts arbitrary keyword arguments (e.g. message='...') to store alongside the standard fields."""
     with _task_lock:
         if task_id in _task_store:
-            _task_store[task_id].update(updates)
+            task = _task_store[task_id]
+            task.update(updates)
+            if "results" in updates:
+                # Invalidates result pages cached by clients (ETag) and open cursors
+                task["results_version"] = task.get("results_version", 0) + 1
+                task["results_count"] = len(updates["results"] or [])
+
+
+def _new_task(task_id: str, context: str, total: int, file_name: str | None) -> Dict[str, Any]:
+    """Initial record of a matching task in the task store."""
+    return {
+        "task_id": task_id,
+        "status": "pending",
+        "context": context,
+        "progress": 0,
+        "total": total,
+        "percentage": 0.0,
+        "results": None,
+        "results_version": 0,
+        "results_count": 0,
+        "error": None,
+        "stage": "initializing",
+        "message": None,
+        "file_name": file_name,
+        "resumable": False,
+    }
+
+
+def register_interrupted_tasks() -> int:
+    """Add the tasks interrupted at the last shutdown to the task store, so they can be resumed.
+
+    Returns:
+        Number of tasks registered
+    """
+    registered = 0
+    for task_id in interrupted_task_ids():
+        checkpoints = TaskCheckpoints(task_id)
+        try:
+            inputs = checkpoints.load_inputs()
+        except Exception as e:
+            print(f"Checkpoint ilegível da tarefa {task_id}: {e}")
+            continue
+        task = _new_task(task_id, inputs.context, len(inputs.queries), inputs.excel_file_name)
+        task.update(
+            status="interrupted",
+            stage=checkpoints.last_stage(),
+            message="Tarefa interrompida. Retome para continuar do último checkpoint.",
+            params=asdict(inputs.params),
+            resumable=True,
+        )
+        with _task_lock:
+            _task_store.setdefault(task_id, task)
+        registered += 1
+    return registered
+
+
+def _without_results(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Task record as sent to status polls: results are fetched page by page instead."""
+    return {k: v for k, v in task.items() if k != "results"}
 
 
 # Rota para acessar a página inicial
@@ -56,24 +130,22 @@ async def read_results():
     queries = _pasted_df[_pasted_description_column].tolist()
     documents = _excel_df['description'].tolist()
     values = _excel_df['mean_value'].tolist()
+    quantities = _excel_df['quantity'].tolist()
+    counts = _excel_df['count'].tolist()
     context = _pasted_context or "product matching"
+
+    # Attach to the work started at upload time when it is for this same data
+    catalog_job = (
+        _indexing_job
+        if _indexing_job and _indexing_job.matches(documents, values, context, _excel_file_name, quantities, counts)
+        else None
+    )
+    query_embeddings = _query_embedding[1] if _query_embedding and _query_embedding[0] == queries else None
     
     # Create task
     task_id = str(uuid.uuid4())
     with _task_lock:
-        _task_store[task_id] = {
-            "task_id": task_id,
-            "status": "pending",
-            "context": context,
-            "progress": 0,
-            "total": len(queries),
-            "percentage": 0.0,
-            "results": None,
-            "error": None,
-            "stage": "initializing",
-            "message": None,
-            "file_name": _excel_file_name,
-        }
+        _task_store[task_id] = _new_task(task_id, context, len(queries), _excel_file_name)
     
     
     print("Nome do arquivo Excel:", _excel_file_name)
@@ -81,6 +153,12 @@ async def read_results():
     thread = threading.Thread(
         target=run_matching_pipeline,
         args=(task_id, queries, documents, values, context, _update_task_status, _excel_file_name),
+        kwargs={
+            "catalog_job": catalog_job,
+            "query_embeddings": query_embeddings,
+            "quantities": quantities,
+            "counts": counts,
+        },
         daemon=True,
     )
     thread.start()
@@ -101,15 +179,35 @@ async def results_view(request: Request, taskId: Optional[str] = Query(default=N
 async def list_tasks():
     """Return all tasks in the task store."""
     with _task_lock:
-        tasks = list(_task_store.values())
+        tasks = [_without_results(task) for task in _task_store.values()]
     return JSONResponse(content=tasks)
 
 
+@router.get("/api/catalogs")
+async def list_catalogs():
+    """Catalogs with stored aggregates, most recently updated first (targets for append mode)."""
+    return JSONResponse(content=get_catalog_store().catalogs())
+
+
+@router.get("/api/indexing-status")
+async def get_indexing_status():
+    """Progress of the catalog indexing started by the last Excel upload."""
+    if _indexing_job is None:
+        raise HTTPException(status_code=404, detail="Nenhuma indexação em andamento")
+    return JSONResponse(content=_indexing_job.snapshot())
+
+
 @router.get("/api/task-status/{task_id}")
-async def get_task_status(task_id: str):
-    """Poll endpoint to check task progress and results."""
+async def get_task_status(task_id: str, include_results: bool = False):
+    """Poll endpoint to check task progress.
+
+    Results are left out unless *include_results* is set; use
+    ``/api/tasks/{task_id}/results`` to page through them.
+    """
     with _task_lock:
         task = _task_store.get(task_id)
+        if task:
+            task = dict(task) if include_results else _without_results(task)
     
     if not task:
         raise HTTPException(status_code=404, detail="Tarefa não encontrada")
@@ -117,6 +215,130 @@ async def get_task_status(task_id: str):
     return JSONResponse(content=task)
 
 
+@router.get("/api/tasks/{task_id}/results")
+async def get_task_results(
+    request: Request,
+    task_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    sort: str = "index",
+    min_score: Optional[float] = None,
+    matched: Optional[bool] = None,
+    q: Optional[str] = None,
+):
+    """One page of a task's results, sorted and filtered on the server.
+
+    Pages are identified by an ETag derived from the results version and the
+    request parameters, so an unchanged page is answered with 304.
+    """
+    with _task_lock:
+        task = _task_store.get(task_id)
+        if task:
+            version = task.get("results_version", 0)
+            results = task.get("results") or []
+    if not task:
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+
+    params = f"{task_id}|{cursor}|{limit}|{sort}|{min_score}|{matched}|{q}"
+    etag = f'W/"{version}-{hashlib.sha1(params.encode()).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    query = ResultsQuery(sort=sort, min_score=min_score, matched=matched, text=q or None)
+    try:
+        page = page_results(task_id, version, results, query, cursor=cursor, limit=limit)
+    except StaleCursorError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return Response(content=dumps(page), media_type="application/json", headers=headers)
+
+
+@router.post("/api/tasks/{task_id}/export")
+async def export_results(task_id: str, payload: ExportRequest):
+    """Download the best non-deselected candidate of each query as CSV or XLSX."""
+    with _task_lock:
+        task = _task_store.get(task_id)
+        # The list is replaced, never mutated, when results change
+        results = task.get("results") if task else None
+        version = task.get("results_version", 0) if task else None
+    if not task:
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+    if results is None:
+        raise HTTPException(status_code=409, detail="A tarefa ainda não tem resultados")
+    # Deselections are result indices, which change meaning when the results are replaced
+    if payload.deselected and payload.results_version != version:
+        raise HTTPException(
+            status_code=409, detail="Os resultados mudaram desde a seleção; revise os itens desmarcados"
+        )
+
+    file_name = f"resultados_{task_id[:8]}.{payload.format}"
+    headers = {"Content-Disposition": f'attachment; filename="{file_name}"'}
+    if payload.format == "xlsx":
+        return StreamingResponse(
+            iter_xlsx(results, payload.deselected),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers=headers,
+        )
+    return StreamingResponse(
+        iter_csv(results, payload.deselected), media_type="text/csv; charset=utf-8", headers=headers
+    )
+
+
+@router.post("/api/tasks/{task_id}/resume")
+async def resume_task(task_id: str):
+    """Continue a failed or interrupted task from its last complete checkpoint."""
+    checkpoints = TaskCheckpoints(task_id)
+    with _task_lock:
+        task = _task_store.get(task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+        if task["status"] in ("pending", "running"):
+            raise HTTPException(status_code=409, detail="A tarefa já está em execução")
+        if task["status"] == "completed" or not checkpoints.exists():
+            raise HTTPException(status_code=409, detail="A tarefa não tem checkpoint para retomar")
+        task.update(status="pending", error=None, message="Retomando do último checkpoint...")
+
+    stage = checkpoints.last_stage()
+    threading.Thread(
+        target=resume_matching_pipeline, args=(task_id, _update_task_status), daemon=True
+    ).start()
+    return {"task_id": task_id, "status": "pending", "resumed_from": stage}
+
+
+@router.post("/api/tasks/{task_id}/refilter")
+def refilter_results(task_id: str, payload: RefilterRequest):
+    """Re-apply score/gap/confidence filters to a finished task's stored scores.
+
+    Retrieval and reranking are not repeated. With ``apply`` the task's
+    results are replaced by the re-filtered ones.
+    """
+    overrides = payload.model_dump(exclude={"apply"})
+    try:
+        params, results = refilter_task(task_id, **overrides)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    if payload.apply:
+        _update_task_status(task_id, results=results, params=asdict(params))
+
+    return JSONResponse(content={"params": asdict(params), "matched_count": len(results), "results": results})
+
+
+@router.post("/api/tasks/{task_id}/refilter/sweep")
+def sweep_thresholds(task_id: str, payload: SweepRequest):
+    """Report the number of high-confidence matches for each combination of thresholds."""
+    try:
+        rows = sweep_task(task_id, payload.model_dump())
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(content={"rows": rows})
+
+
 # Rota para acessar a página de upload
 @router.get("/upload")
 async def read_upload(request: Request):
@@ -169,10 +391,15 @@ async def receive_pasted_data(payload: PastedData):
     """
     header = payload.data[0][:3] # Sempre tem tamanho fixo de 3 colunas
     body_data = payload.data[2:]
-    global _pasted_df, _pasted_context, _pasted_description_column
+    global _pasted_df, _pasted_context, _pasted_description_column, _query_embedding
     _pasted_df = pd.DataFrame(body_data, columns=header)
     _pasted_context = payload.description
     _pasted_description_column = payload.description_column
+
+    # Embed the queries now, while the user picks the catalog file
+    if _pasted_description_column in _pasted_df.columns:
+        queries = _pasted_df[_pasted_description_column].tolist()
+        _query_embedding = (queries, start_query_embedding(queries))
     
     return {
         "status": "success",
@@ -183,13 +410,33 @@ async def receive_pasted_data(payload: PastedData):
 
 
 # Rota para processar arquivo Excel
+@router.post("/api/upload-excel")
+def upload_excel(file: UploadFile = File(...)):
+    """Parse the first sheet of a spreadsheet on the server (cached by file content).
+
+    Returns the sheet as rows of cells, like SheetJS ``sheet_to_json(..., {header: 1})``,
+    so the upload page can pick columns without parsing the file in the browser.
+    """
+    content = file.file.read()
+    try:
+        df = read_excel_cached(content, sheet_name=0, header=None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Não foi possível ler a planilha: {e}")
+
+    return {
+        "fileName": file.filename,
+        "sheetName": df.attrs.get("sheet_name"),
+        "rows": json.loads(df.to_json(orient="values", date_format="iso")),
+    }
+
+
 @router.post("/api/process-excel")
-async def receive_excel_data(payload: ExcelData):
+def receive_excel_data(payload: ExcelData):
     """
     Recebe os dados do arquivo Excel com as colunas selecionadas.
     """
     # TODO: Adicionar lógica de processamento do Excel
-    global _excel_df, _excel_file_name
+    global _excel_df, _excel_file_name, _indexing_job
     _excel_df = pd.DataFrame([row.model_dump() for row in payload.data])
     
     # Apply filter if provided
@@ -203,18 +450,42 @@ async def receive_excel_data(payload: ExcelData):
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Erro no filtro: {str(e)}. Verifique se a expressão regular está correta.")
     
-    _excel_df = (
-        _excel_df
-        .groupby("description", as_index=False)
-        .agg(
-            quantity=("quantity", "sum"),
-            total_value=("value", "sum"),
-        )
+    # Same product spelled differently is embedded once, with its quantities and values pooled
+    config = load_config()
+    extract_df, dedup_report = collapse_catalog(
+        _excel_df, near_duplicates=config.dedup_near_duplicates, threshold=config.dedup_similarity
     )
+    print(f"Catálogo: {dedup_report.summary()}")
+
+    # Running aggregates: an appended extract adds to the stored sums, a full upload replaces them
+    catalog_name = payload.catalogName or payload.fileName or "uploaded_file.xlsx"
+    catalog_store = get_catalog_store()
+    merge_report = catalog_store.merge(catalog_name, extract_df, replace=not payload.appendMode)
+    if merge_report.duplicate:
+        print(f"Catálogo {catalog_name}: extrato já incorporado, ignorado")
+    else:
+        print(
+            f"Catálogo {catalog_name}: {merge_report.new_descriptions} descrições novas, "
+            f"{merge_report.updated_descriptions} atualizadas, {merge_report.total_descriptions} no total"
+        )
+
+    _excel_df = catalog_store.load(catalog_name)
     _excel_df["mean_value"] = _excel_df["total_value"] / _excel_df["quantity"]
-    _excel_df = _excel_df.drop(columns=["total_value", "quantity"])
+    _excel_df = _excel_df[["description", "mean_value", "quantity", "count"]]
     _excel_df = _excel_df.dropna()
-    _excel_file_name = payload.fileName or "uploaded_file.xlsx"
+    _excel_file_name = catalog_name
+
+    # Start embedding and indexing the catalog before the user asks for results
+    documents = _excel_df["description"].tolist()
+    values = _excel_df["mean_value"].tolist()
+    quantities = _excel_df["quantity"].tolist()
+    counts = _excel_df["count"].tolist()
+    context = _pasted_context or "product matching"
+    if not (_indexing_job and _indexing_job.matches(documents, values, context, _excel_file_name, quantities, counts)):
+        # Appending: descriptions already in the collection keep their vectors
+        _indexing_job = start_indexing(
+            documents, values, context, _excel_file_name, payload.appendMode, quantities, counts
+        )
 
     return {
         "status": "success",
@@ -225,7 +496,10 @@ async def receive_excel_data(payload: ExcelData):
         "isRegex": payload.isRegex,
         "rows_count": len(payload.data),
         "filtered_rows_count": len(_excel_df),
+        "dedup": {**asdict(dedup_report), "shrink_ratio": dedup_report.shrink_ratio},
+        "catalog": asdict(merge_report),
         "columns": payload.columns,
+        "indexing_job_id": _indexing_job.job_id,
         "sample_data": payload.data[:5] if len(payload.data) > 5 else payload.data
     }
 
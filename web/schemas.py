@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel
 
@@ -14,6 +14,10 @@ class ExcelData(BaseModel):
     skipRows: int
     filterText: Optional[str] = None
     isRegex: bool = False
+    # Merge into the stored catalog's running aggregates instead of replacing it
+    appendMode: bool = False
+    # Stored catalog to replace or append to (defaults to fileName)
+    catalogName: Optional[str] = None
     columns: "ExcelColumns"
     columnIndices: "ExcelColumnIndices"
     data: List["ExcelRow"]
@@ -43,6 +47,7 @@ class MatchedItem(BaseModel):
     distance: float
     score: float
     value: float = 0.0
+    matched: bool = False
 
 
 class MatchResult(BaseModel):
@@ -58,6 +63,31 @@ class ConfigSchema(BaseModel):
     high_confidence_threshold: Optional[float] = None
 
 
+class RefilterRequest(BaseModel):
+    n_results: Optional[int] = None
+    max_distance: Optional[float] = None
+    score_threshold: Optional[float] = None
+    gap_threshold: Optional[float] = None
+    high_confidence_threshold: Optional[float] = None
+    apply: bool = False  # Replace the task's results with the re-filtered ones
+
+
+class SweepRequest(BaseModel):
+    n_results: List[int] = []
+    max_distance: List[float] = []
+    score_threshold: List[float] = []
+    gap_threshold: List[float] = []
+    high_confidence_threshold: List[float] = []
+
+
+class ExportRequest(BaseModel):
+    format: Literal["csv", "xlsx"] = "csv"
+    # Deselected candidate positions per result index, e.g. {"12": [0, 2]}
+    deselected: Dict[int, List[int]] = {}
+    # results_version the indices in `deselected` refer to
+    results_version: Optional[int] = None
+
+
 class TaskStatus(BaseModel):
     task_id: str
     status: str  # "pending", "running", "completed", "failed"